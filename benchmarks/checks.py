@@ -0,0 +1,241 @@
+"""
+Contrôles de non-régression rapides (quelques secondes), sans dépendance de test :
+
+    python -m benchmarks.checks            # tous les contrôles
+    python -m benchmarks.checks theil_sen  # un seul
+    python -m benchmarks.checks compact    # empreinte de FrameCompactor sur les données du dépôt
+    python -m benchmarks.checks incremental  # TXT complété entre deux runs incrémentaux
+
+Chaque contrôle renvoie la liste de ses échecs ; le module sort en code 1 s'il y en a,
+ce qui permet de l'enchaîner avec run_benchmarks.py --compare comme garde-fou.
+"""
+import argparse
+import copy
+import json
+import logging
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE = Path(__file__).resolve().parent.parent
+if str(BASE) not in sys.path:
+    sys.path.insert(0, str(BASE))
+
+from classes.analysis.robust_drift import RobustDriftEngine  # noqa: E402
+from classes.processing.compact import (  # noqa: E402
+    QUALITY_FLAGS,
+    QUALITY_FLAGS_COLUMN,
+    FrameCompactor,
+    bytes_per_record,
+    flag
+)
+
+ORIGIN = pd.Timestamp("2024-01-01")
+SETTINGS_PATH = BASE / "config" / "settings.json"
+# Empreinte maximale d'une ligne APM compacte (octets, index compris), cf. README « Memory »
+COMPACT_MAX_BYTES_PER_RECORD = 200
+
+
+def _engine(t_days, y) -> RobustDriftEngine:
+    ts = ORIGIN + pd.to_timedelta(np.asarray(t_days, dtype=float), unit="D")
+    return RobustDriftEngine(ts.to_numpy(), np.asarray(y, dtype=float))
+
+
+def _brute_theil_sen(t, y) -> float:
+    """Pente de référence (par jour) : médiane centrale supérieure des pentes des paires à t distincts."""
+    slopes = np.sort([(y[j] - y[i]) / (t[j] - t[i]) for i in range(len(t)) for j in range(len(t)) if t[j] > t[i]])
+    return slopes[len(slopes) // 2] if len(slopes) else np.nan
+
+
+def check_theil_sen(trials: int = 60, batches: int = 2000, seed: int = 3) -> list:
+    """
+    theil_sen = médiane brute des pentes, y compris avec des timestamps répétés et pour des
+    segments de 2 points calculés avec d'autres segments.
+    """
+    failures = []
+    whole = ([ORIGIN - pd.Timedelta(days=1)], [ORIGIN + pd.Timedelta(days=365)])
+    for t, y, expected in (([0, 1, 1], [0, 0, 10], 10.0), ([0, 1, 1, 2], [0, 0, 10, 10], 5.0)):
+        got = _engine(t, y).drift(*whole, method="theil_sen")[0]
+        if not np.isclose(got, expected):
+            failures.append(f"theil_sen tied timestamps {list(zip(t, y))}: {got} != {expected}")
+
+    rng = np.random.default_rng(seed)
+    for trial in range(trials):
+        n = int(rng.integers(20, 200))
+        t = np.sort(rng.integers(0, n // 2 + 2, n)).astype(float)   # nombreux ex aequo
+        y = rng.normal(size=n) * (1 + t)
+        if trial % 3 == 0:
+            y = np.round(y)
+        cuts = np.r_[0, np.sort(rng.choice(np.arange(1, n), size=14, replace=False)), n]
+        bounds = np.r_[t, t[-1] + 1][cuts]
+        starts = [ORIGIN + pd.Timedelta(days=d) for d in bounds[:-1]]
+        ends = [ORIGIN + pd.Timedelta(days=d) for d in bounds[1:]]
+        got = _engine(t, y).drift(starts, ends, method="theil_sen")
+        for k, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+            m = (t >= a) & (t < b)
+            ref = _brute_theil_sen(t[m], y[m])
+            if not (np.isnan(ref) and np.isnan(got[k])) and not np.isclose(ref, got[k], rtol=1e-9, atol=1e-12):
+                failures.append(f"theil_sen trial {trial} interval {k} ({m.sum()} points): {got[k]} != {ref}")
+
+    # Lots de segments indépendants et courts (2 points compris), horodatés à la seconde, d'échelles
+    # variées : le résultat d'un segment ne doit pas dépendre des autres segments du même appel
+    for trial in range(batches):
+        lens = rng.choice([2, 2, 3, 6, 12, 14], int(rng.integers(2, 8)))
+        seconds, values, bounds = [], [], [0]
+        for n in lens:
+            seconds.append(bounds[-1] + np.sort(rng.integers(0, 30 * 86400, n)))
+            values.append(rng.normal(0.0, rng.choice([1e-3, 1.0, 1e2, 1e4]), n))
+            bounds.append(int(seconds[-1][-1]) + 1)
+        t, y = np.concatenate(seconds) / 86400.0, np.concatenate(values)
+        bounds = np.array(bounds) / 86400.0
+        got = _engine(t, y).drift([ORIGIN + pd.Timedelta(days=d) for d in bounds[:-1]],
+                                  [ORIGIN + pd.Timedelta(days=d) for d in bounds[1:]], method="theil_sen")
+        for k, n in enumerate(lens):
+            m = (t >= bounds[k]) & (t < bounds[k + 1])
+            ref = _brute_theil_sen(t[m], y[m])
+            if not (np.isnan(ref) and np.isnan(got[k])) and not np.isclose(ref, got[k], rtol=1e-9, atol=0.0):
+                failures.append(f"theil_sen batch {trial} segment {k} ({n} points, lengths {lens.tolist()}): "
+                                f"{got[k]} != {ref}")
+    return failures
+
+
+def check_compact(settings: dict = None) -> list:
+    """
+    FrameCompactor sur les données du dépôt, préparées comme dans main.py : empreinte par ligne
+    sous COMPACT_MAX_BYTES_PER_RECORD, identifiants en category, indicateurs regroupés en bits.
+    """
+    from main import load_inputs, prepare_events, prepare_txt, select_events
+    from classes.io.schemas import DataSchema
+
+    if settings is None:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    settings = copy.deepcopy(settings)
+    settings.setdefault("cache", {})["enabled"] = False
+    df_txt, all_events = load_inputs(settings)
+    schema = DataSchema(settings)
+    txt = prepare_txt(df_txt, schema)
+    events = prepare_events(select_events(all_events, settings), schema)
+    compactor = FrameCompactor.from_settings(settings)
+    c_txt, c_events = compactor.compact_txt(txt), compactor.compact_events(events)
+
+    failures = []
+    size = bytes_per_record(c_txt)
+    if size > COMPACT_MAX_BYTES_PER_RECORD:
+        failures.append(f"compact APM series: {size:.1f} bytes/record > {COMPACT_MAX_BYTES_PER_RECORD}")
+    if c_txt.shape[0] != txt.shape[0]:
+        failures.append(f"compact APM series: {c_txt.shape[0]} rows != {txt.shape[0]}")
+    for name, frame, columns in (("APM series", c_txt, ["tail_number"]), ("events", c_events, ["tail_number", "event"])):
+        for c in columns:
+            if c in frame.columns and not isinstance(frame[c].dtype, pd.CategoricalDtype):
+                failures.append(f"compact {name}: {c} is {frame[c].dtype}, expected category")
+    if QUALITY_FLAGS_COLUMN not in c_txt.columns or c_txt[QUALITY_FLAGS_COLUMN].dtype != np.uint8:
+        failures.append(f"compact APM series: no uint8 {QUALITY_FLAGS_COLUMN} column")
+    else:
+        for name in QUALITY_FLAGS:
+            if name in c_txt.columns:
+                failures.append(f"compact APM series: {name} kept next to {QUALITY_FLAGS_COLUMN}")
+            elif name in txt.columns and not np.array_equal(flag(c_txt, name).to_numpy(), txt[name].to_numpy(dtype=bool)):
+                failures.append(f"compact APM series: bit {name} differs from the boolean column")
+    return failures
+
+
+def check_incremental(settings: dict = None, fractions=(0.6, 0.97)) -> list:
+    """
+    Mode incrémental sur une copie des données du dépôt dont le TXT est complété entre deux runs
+    (le premier s'arrête au milieu d'une ligne) : seules les lignes ajoutées sont lues, et TXT
+    préparé et tables d'analyse sont ceux d'un run complet sur le fichier final. Après 60 % du
+    fichier, des colonnes numériques reçoivent des valeurs texte (« 29..6 ») : relecture complète.
+    """
+    if settings is None:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    failures = []
+    for fraction in fractions:
+        failures += [f"{fraction:.0%} + rest: {line}" for line in _incremental_append(settings, fraction)]
+    return failures
+
+
+def _incremental_append(settings: dict, fraction: float) -> list:
+    """Run incrémental sur les premiers fraction du TXT, puis sur le fichier complet, comparé à un run complet."""
+    from main import build_pipeline, prepare_txt
+    from classes.io.schemas import DataSchema
+    from classes.pipeline.incremental import IncrementalIngest
+
+    source = BASE / settings["paths"]["data_dir"]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        settings = copy.deepcopy(settings)
+        settings["paths"]["data_dir"] = str(tmp)
+        settings.setdefault("cache", {})["enabled"] = False
+        shutil.copy(source / settings["paths"]["excel_file"], tmp)
+        txt_file = tmp / settings["paths"]["txt_file"]
+        raw = (source / settings["paths"]["txt_file"]).read_bytes()
+        lines = raw.split(b"\n")
+        cut = int(len(lines) * fraction)
+
+        def tables(incremental: bool) -> dict:
+            settings["incremental"] = {"enabled": incremental, "state_dir": str(tmp / "state")}
+            graph = build_pipeline(settings)
+            out = {"txt": graph.get("prepare", "txt")}
+            out.update(graph.outputs("analysis", ["non_main", "type_rates", "maint_impacts"]))
+            return out
+
+        txt_file.write_bytes(b"\n".join(lines[:cut]) + b"\n" + lines[cut][:40])
+        tables(True)
+        txt_file.write_bytes(raw)
+        read = []
+
+        def clean(new):
+            read.append(new.shape[0])
+            return prepare_txt(new, DataSchema(settings))
+
+        IncrementalIngest(tmp / "state", settings, txt_file).update(clean)
+        if not read or not 0 < read[0] <= len(lines) - cut:
+            failures.append(f"incremental ingest read {read} rows, expected only the {len(lines) - cut} appended lines")
+        got, expected = tables(True), tables(False)
+
+    for name, df in expected.items():
+        key = ["tail_number", "timestamp"] if name == "txt" else list(df.columns[:5])
+        a = df.sort_values(key, kind="mergesort").reset_index(drop=True)
+        b = got[name][df.columns].sort_values(key, kind="mergesort").reset_index(drop=True)
+        try:
+            pd.testing.assert_frame_equal(a, b, check_dtype=False)
+        except AssertionError as exc:
+            failures.append(f"incremental {name} differs from a full run: {str(exc).splitlines()[0]}")
+    return failures
+
+
+CHECKS = {
+    "theil_sen": check_theil_sen,
+    "compact": check_compact,
+    "incremental": check_incremental,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fast regression checks")
+    parser.add_argument("checks", nargs="*", metavar="check",
+                        help=f"Contrôles à lancer parmi {', '.join(CHECKS)} (tous par défaut)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    unknown = sorted(set(args.checks) - set(CHECKS))
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}")
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        failures = CHECKS[name]()
+        print(f"{name}: {'OK' if not failures else f'{len(failures)} failure(s)'}")
+        for line in failures:
+            print(f"  {line}")
+        failed += bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Benchmarks par étape du pipeline sur des données synthétiques (classes/io/synthetic.py).
+
+Exemples (depuis la racine du dépôt) :
+    python -m benchmarks.run_benchmarks --sizes 10000 1000000 --save benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes 10000 --compare benchmarks/baseline.json
+
+Les jeux synthétiques sont générés une fois par (taille, avions, graine) dans --data-dir
+puis réutilisés. --compare sort en code 1 si une étape est plus lente que la référence
+au-delà de --threshold (ratio), ce qui permet de l'utiliser comme garde-fou.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE = Path(__file__).resolve().parent.parent
+if str(BASE) not in sys.path:
+    sys.path.insert(0, str(BASE))
+
+from classes.io.data_loader import load_txt_series, load_events_all_sheets  # noqa: E402
+from classes.io.schemas import DataSchema  # noqa: E402
+from classes.io import synthetic  # noqa: E402
+from classes.io.synthetic import generate_fleet  # noqa: E402
+from classes.processing.cleaning import DataCleaner  # noqa: E402
+from classes.processing.compact import FrameCompactor, bytes_per_record  # noqa: E402
+from classes.processing.feature_engineering import FeatureEngineer  # noqa: E402
+from classes.processing.steady_state import SteadyStateFilter  # noqa: E402
+from classes.domain.maintenance import MaintenanceCatalog  # noqa: E402
+from classes.domain.apm_models import APMModels, engine_columns  # noqa: E402
+from classes.analysis.event_history import SameTypeHistory  # noqa: E402
+from classes.analysis.reporting import Reporter  # noqa: E402
+from classes.optimization.scheduler import MaintenanceScheduler  # noqa: E402
+from classes.pipeline.incremental import build_intervals_by_tail  # noqa: E402
+from classes.utils.instrumentation import max_rss_mb  # noqa: E402
+from classes.analysis.impact_analysis import (  # noqa: E402
+    compute_non_maintenance_metrics,
+    estimate_type_rates,
+    compute_maintenance_impacts,
+    summarize_global
+)
+
+logger = logging.getLogger("benchmarks")
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+SETTINGS_PATH = BASE / "config" / "settings.json"
+
+
+class StageTimer:
+    """Chronomètre les étapes successives : {stage: {"seconds", "rows"}}."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        rows = out.shape[0] if isinstance(out, pd.DataFrame) else None
+        self.stages[name] = {"seconds": round(elapsed, 4), "rows": rows}
+        logger.info("%-32s %9.3f s  rows=%s", name, elapsed, rows)
+        return out
+
+
+def dataset(data_dir: Path, settings: dict, n_rows: int, n_tails: int, seed: int) -> dict:
+    """
+    Jeu synthétique (TXT + classeur) pour une taille donnée, généré au premier appel ; la clé
+    inclut l'empreinte de synthetic.py (un générateur modifié produit un nouveau jeu).
+    """
+    generator = hashlib.blake2b(Path(synthetic.__file__).read_bytes(), digest_size=4).hexdigest()
+    out_dir = Path(data_dir) / f"rows{n_rows}_tails{n_tails}_seed{seed}_{generator}"
+    txt, xlsx = out_dir / "synthetic_apm.txt", out_dir / "synthetic_events.xlsx"
+    if not (txt.exists() and xlsx.exists()):
+        logger.info("Generating synthetic fleet: %d rows, %d tails -> %s", n_rows, n_tails, out_dir)
+        generate_fleet(out_dir, settings["columns_mapping"], n_rows=n_rows, n_tails=n_tails, seed=seed,
+                       template_path=BASE / settings["paths"]["data_dir"] / settings["paths"]["txt_file"])
+    return {"txt": txt, "excel": xlsx}
+
+
+def run_size(settings: dict, files: dict, out_dir: Path) -> dict:
+    """Toutes les étapes du pipeline (flotte complète, un seul processus) sur un jeu de données."""
+    timer = StageTimer()
+    schema = DataSchema(settings)
+    cleaner = DataCleaner()
+
+    df_txt = timer.run("load_txt_series", load_txt_series, str(files["txt"]),
+                       settings["txt_read"], settings["columns_mapping"])
+    events = timer.run("load_events_all_sheets", load_events_all_sheets, str(files["excel"]),
+                       tail_sheet_pattern=settings.get("events", {}).get("tail_sheet_pattern", r"^F[A-Z]{4}$"),
+                       ignore_sheets=[])
+
+    def mapping(df):
+        df = schema.standardize_columns(df)
+        df = schema.apply_mapping_txt(df)
+        schema.validate_txt(df)
+        return df
+
+    df_txt = timer.run("schema_mapping", mapping, df_txt)
+    df_txt = timer.run("clean.build_timestamp", cleaner.build_timestamp, df_txt,
+                       date_col="recorded_date", time_col="time")
+    df_txt = timer.run("clean.fix_timestamps", cleaner.fix_timestamps, df_txt)
+    df_txt = timer.run("clean.remove_duplicates", cleaner.remove_duplicates, df_txt)
+    df_txt = timer.run("clean.flag_quality", cleaner.flag_quality, df_txt)
+    df_txt = timer.run("clean.clean_numeric_columns", cleaner.clean_numeric_columns, df_txt,
+                       extra_cols=engine_columns(settings))
+    df_txt = timer.run("clean.sort_timestamps", lambda d: d.dropna(subset=["timestamp"])
+                       .sort_values("timestamp").reset_index(drop=True), df_txt)
+
+    # Empreinte mémoire par ligne, complète puis compacte (memory.compact) ; la suite tourne sur la frame complète
+    compact = timer.run("compact", FrameCompactor.from_settings(settings).compact_txt, df_txt)
+    timer.stages["compact"]["bytes_per_record"] = {"full": round(bytes_per_record(df_txt), 1),
+                                                   "compact": round(bytes_per_record(compact), 1)}
+    logger.info("%-32s %9.1f -> %.1f bytes/record", "memory", *timer.stages["compact"]["bytes_per_record"].values())
+    del compact
+
+    # Filtre de croisière stabilisée (steady_state) : chronométré, la suite garde toutes les lignes
+    steady, counts = SteadyStateFilter.from_settings(settings), {}
+
+    def steady_state(df):
+        kept, c = steady.apply(df)
+        counts.update(c)
+        return kept
+
+    timer.run("steady_state", steady_state, df_txt)   # rows = lignes conservées
+    timer.stages["steady_state"].update(kept=counts["kept"], dropped=counts["dropped"])
+    logger.info("%-32s %9d kept, %d dropped", "steady_state", counts["kept"], counts["dropped"])
+
+    features = FeatureEngineer()
+    timer.run("features.rolling_baseline", features.rolling_baseline, df_txt, metric="fuel_flow", window="30D")
+    timer.run("features.aggregate_by_airac", features.aggregate_by_airac, df_txt)
+
+    def events_prep(df):
+        df = schema.standardize_columns(df)
+        df = schema.apply_mapping_events(df)
+        schema.validate_events(df)
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        return df.dropna(subset=["date"]).sort_values("date").reset_index(drop=True)
+
+    events = timer.run("events_prep", events_prep, events)
+    intervals = timer.run("build_event_intervals", build_intervals_by_tail, events)
+    non_main = timer.run("compute_non_maintenance_metrics", compute_non_maintenance_metrics,
+                         df_txt, intervals, settings)
+    history = SameTypeHistory(events, time_axis=settings["impact"]["time_axis"])
+    type_rates = timer.run("estimate_type_rates", estimate_type_rates, non_main, events, settings, history=history)
+    maint_impacts = timer.run("compute_maintenance_impacts", compute_maintenance_impacts,
+                              events, non_main, type_rates, settings, history=history)
+    summary = timer.run("summarize_global", summarize_global, non_main, type_rates, maint_impacts)
+    apm = APMModels(settings)
+    engine_table = timer.run("engine_interval_metrics", apm.engine_interval_metrics, df_txt, non_main)
+    timer.run("engine_baseline", apm.engine_baseline, df_txt)
+
+    scheduler = MaintenanceScheduler(
+        catalog=MaintenanceCatalog.from_settings(settings),
+        constraints=settings["economics"]["constraints"],
+        fuel_price=settings["economics"]["fuel_price_per_unit"],
+        solver=settings["economics"].get("solver", "exact")
+    )
+    plan = timer.run("scheduler.optimize", scheduler.optimize, maint_impacts.copy(),
+                     event_col="event_name", delta_fuel_col="impact_model",
+                     default_delta_from_metric="impact_observed")
+
+    def export():
+        Reporter(out_dir).export_many({"impact_interval_non_maintenance.csv": non_main,
+                                       "maintenance_type_rates.csv": type_rates,
+                                       "maintenance_impacts_modeled.csv": maint_impacts,
+                                       "impact_summary.csv": summary,
+                                       "impact_engine_intervals.csv": engine_table,
+                                       "maintenance_plan.csv": plan})
+
+    timer.run("reporter.export_csv", export)
+    timer.run("reporter.plot_metric", Reporter(out_dir).plot_metric, df_txt, metric="fuel_flow", events=events)
+    return timer.stages
+
+
+def environment() -> dict:
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float) -> list:
+    """Étapes plus lentes que la référence d'un facteur > threshold (les étapes très courtes sont ignorées)."""
+    regressions = []
+    for size, stages in results["sizes"].items():
+        ref_stages = baseline.get("sizes", {}).get(size, {})
+        missing = [stage for stage in stages if stage not in ref_stages]
+        if missing:
+            # Référence à régénérer (--save) : ces étapes ne sont pas comparées
+            logger.warning("No baseline for size %s, stage(s): %s", size, ", ".join(missing))
+        for stage, r in stages.items():
+            ref = ref_stages.get(stage)
+            if ref is None:
+                continue
+            ratio = r["seconds"] / max(ref["seconds"], 1e-9)
+            flag = ratio > threshold and r["seconds"] >= min_seconds
+            print(f"{size:>10} {stage:<34} {ref['seconds']:>9.3f} s -> {r['seconds']:>9.3f} s  x{ratio:5.2f}"
+                  f"{'  REGRESSION' if flag else ''}")
+            if flag:
+                regressions.append((size, stage, ratio))
+    return regressions
+
+
+def main(argv=None, settings: dict = None) -> int:
+    """settings : configuration déjà chargée (cli.py bench, surcharges --set) ; sinon lue depuis --settings."""
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks on synthetic APM data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Nombre de lignes TXT")
+    parser.add_argument("--tails", type=int, default=3, help="Nombre d'avions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--settings", type=Path, default=SETTINGS_PATH)
+    parser.add_argument("--data-dir", type=Path, default=BASE / "benchmarks" / "data")
+    parser.add_argument("--save", type=Path, help="Écrit les résultats (JSON) pour servir de référence")
+    parser.add_argument("--compare", type=Path, help="Référence JSON à comparer")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Ratio au-delà duquel une étape régresse")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Durée en deçà de laquelle on ne compare pas")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    for name in ("classes", "main"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if settings is None:
+        with open(args.settings, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+
+    results = {"meta": {**environment(), "tails": args.tails, "seed": args.seed, "max_rss_mb": {}}, "sizes": {}}
+    for n_rows in args.sizes:
+        files = dataset(args.data_dir, settings, n_rows, args.tails, args.seed)
+        with tempfile.TemporaryDirectory() as out_dir:
+            results["sizes"][str(n_rows)] = run_size(settings, files, Path(out_dir))
+        # Pic mémoire du processus après cette taille (tailles croissantes : pic de la plus grande)
+        results["meta"]["max_rss_mb"][str(n_rows)] = max_rss_mb()
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        logger.info("Benchmark results saved to %s", args.save)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            logger.error("%d stage(s) slower than baseline by more than x%.2f", len(regressions), args.threshold)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+class SameTypeHistory:
+    """
+    Index de l'historique des maintenances : pour une date donnée, retrouve la
+    précédente occurrence du même type d'événement sur le même tail_number
+    (strictement antérieure) et le delta_t correspondant.
+
+    L'historique est trié une seule fois à la construction ; les recherches se
+    font ensuite pour toutes les lignes d'un coup via merge_asof.
+    """
+
+    def __init__(self, events_df: pd.DataFrame, time_axis: str = "days"):
+        self.time_axis = time_axis
+        ev = events_df.assign(event=events_df["event"].astype(str),
+                              date=pd.to_datetime(events_df["date"], errors="coerce").astype("datetime64[ns]"))
+        ev = ev.dropna(subset=["date"])
+
+        self.has_tail = "tail_number" in ev.columns
+        keys = ["tail_number", "event"] if self.has_tail else ["event"]
+        hist = ev[keys + ["date"]].drop_duplicates()
+        # merge_asof exige des clés de dtypes identiques : object des deux côtés
+        hist = hist.astype({k: object for k in keys})
+        hist = hist.assign(prev_same_date=hist["date"]).sort_values("date", kind="mergesort")
+        self._history = hist.reset_index(drop=True)
+
+    def _asof(self, query: pd.DataFrame, by: list) -> pd.DataFrame:
+        right = self._history
+        if by == ["event"] and self.has_tail:
+            right = right.drop(columns=["tail_number"])
+        query = query.sort_values("date", kind="mergesort")
+        merged = pd.merge_asof(
+            query, right, on="date", by=by,
+            direction="backward", allow_exact_matches=False
+        )
+        return merged.set_index("_pos")["prev_same_date"]
+
+    def lookup(self,
+               table: pd.DataFrame,
+               date_col: str = "event_date",
+               name_col: str = "event_name",
+               tail_col: str = "tail_number") -> pd.DataFrame:
+        """
+        Renvoie, aligné sur l'index de `table`, les colonnes :
+          - prev_same_date : date de la précédente même maintenance (NaT si aucune)
+          - delta_t : temps écoulé depuis celle-ci selon time_axis (NaN si aucune)
+        Sans tail_number (colonne absente ou valeur manquante), la recherche porte sur tous les tails.
+        """
+        query = pd.DataFrame({
+            "_pos": np.arange(len(table)),
+            "event": table[name_col].astype(str).to_numpy(dtype=object),
+            "date": pd.to_datetime(table[date_col]).to_numpy(dtype="datetime64[ns]"),
+        })
+        use_tail = self.has_tail and tail_col in table.columns
+        tail_mask = np.zeros(len(table), dtype=bool)
+        if use_tail:
+            query["tail_number"] = table[tail_col].to_numpy(dtype=object)
+            tail_mask = query["tail_number"].notna().to_numpy()
+        # Clés en dtype object des deux côtés (pandas peut inférer un dtype str à l'assignation)
+        query = query.astype({c: object for c in ("event", "tail_number") if c in query.columns})
+
+        parts = []
+        if tail_mask.any():
+            parts.append(self._asof(query[tail_mask], by=["tail_number", "event"]))
+        if (~tail_mask).any():
+            no_tail = query[~tail_mask].drop(columns=["tail_number"], errors="ignore")
+            parts.append(self._asof(no_tail, by=["event"]))
+
+        prev = pd.concat(parts).sort_index() if parts else pd.Series(dtype="datetime64[ns]")
+        prev_dates = pd.to_datetime(prev.reindex(np.arange(len(table))))
+        event_dates = pd.to_datetime(query["date"])
+
+        delta = event_dates - prev_dates.to_numpy()
+        if self.time_axis == "days":
+            delta_t = delta.dt.days.astype(float)
+        else:
+            delta_t = delta.dt.total_seconds() / 3600.0
+
+        return pd.DataFrame({
+            "prev_same_date": prev_dates.to_numpy(),
+            "delta_t": delta_t.to_numpy(dtype=float),
+        }, index=table.index)
@@ -1,7 +1,10 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Union
 from classes.analysis.event_types import EventTypeConfig
+from classes.analysis.event_history import SameTypeHistory
+from classes.analysis.series_store import SeriesStore, to_datetime64_ns
+from classes.analysis.robust_drift import RobustDriftEngine
 
 #test psuh
 def build_event_intervals(events_df: pd.DataFrame) -> pd.DataFrame:
@@ -9,9 +12,9 @@ def build_event_intervals(events_df: pd.DataFrame) -> pd.DataFrame:
     Construit les intervalles [event_i, event_{i+1}) avec références au précédent,
     en conservant le nom et le tail_number (si présent) pour filtrage ciblé.
     """
-    df = events_df.copy()
-    df["event"] = df["event"].astype(str)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    # assign : nouvelle frame sans copie profonde (copy-on-write), l'appelant n'est pas modifié
+    df = events_df.assign(event=events_df["event"].astype(str),
+                          date=pd.to_datetime(events_df["date"], errors="coerce"))
     df = df.dropna(subset=["date"]).sort_values("date").reset_index(drop=True)
 
     df["next_event_date"] = df["date"].shift(-1)
@@ -23,11 +26,11 @@ def build_event_intervals(events_df: pd.DataFrame) -> pd.DataFrame:
     if "tail_number" in df.columns:
         keep_cols.append("tail_number")
 
-    intervals = df.dropna(subset=["next_event_date"]).copy()
+    intervals = df.dropna(subset=["next_event_date"])
     return intervals[keep_cols].rename(columns={"date": "event_date"})
 
 
-def slice_series(df_txt: pd.DataFrame,
+def slice_series(df_txt: Union[pd.DataFrame, SeriesStore],
                  start: pd.Timestamp,
                  end: pd.Timestamp,
                  metric: str,
@@ -35,13 +38,17 @@ def slice_series(df_txt: pd.DataFrame,
     """
     Extrait un segment temporel [start, end) sur la métrique choisie,
     optionnellement filtré par tail_number.
+    Accepte aussi un SeriesStore (recherche dichotomique au lieu de masques).
     """
+    if isinstance(df_txt, SeriesStore):
+        return df_txt.slice_frame(start, end, metric=metric, tail_number=tail_number)
+
     df = df_txt
     if tail_number is not None and "tail_number" in df.columns:
         df = df[df["tail_number"] == tail_number]
 
     mask = (df["timestamp"] >= start) & (df["timestamp"] < end)
-    return df.loc[mask, ["timestamp", metric]].copy()
+    return df.loc[mask, ["timestamp", metric]]
 
 
 def fit_drift_rate(segment: pd.DataFrame,
@@ -56,13 +63,26 @@ def fit_drift_rate(segment: pd.DataFrame,
     if segment.empty or segment.shape[0] < min_points:
         return np.nan
 
-    ts = pd.to_datetime(segment["timestamp"], errors="coerce")
+    ts = pd.to_datetime(segment["timestamp"], errors="coerce").to_numpy(dtype="datetime64[ns]")
     y = segment[metric_col].astype(float).values
+    return fit_drift_rate_arrays(ts, y, start, time_axis=time_axis, min_points=min_points)
+
 
-    if time_axis == "days":
-        t = (ts - start).dt.total_seconds().values / (24 * 3600.0)
-    elif time_axis == "hours":
-        t = (ts - start).dt.total_seconds().values / 3600.0
+def fit_drift_rate_arrays(ts: np.ndarray,
+                          y: np.ndarray,
+                          start: pd.Timestamp,
+                          time_axis: str = "days",
+                          min_points: int = 2) -> float:
+    """
+    Variante de fit_drift_rate sur tableaux (timestamps datetime64[ns], valeurs),
+    utilisée avec les vues renvoyées par SeriesStore.slice.
+    """
+    if y.size == 0 or y.size < min_points:
+        return np.nan
+
+    if time_axis in ("days", "hours"):
+        seconds = (ts - to_datetime64_ns(start)) / np.timedelta64(1, "s")
+        t = seconds / (24 * 3600.0) if time_axis == "days" else seconds / 3600.0
     else:
         # fallback: indices
         t = np.arange(y.size, dtype=float)
@@ -74,7 +94,7 @@ def fit_drift_rate(segment: pd.DataFrame,
     return float(slope)
 
 
-def mean_in_stabilization_window(df_txt: pd.DataFrame,
+def mean_in_stabilization_window(df_txt: Union[pd.DataFrame, SeriesStore],
                                  event_date: pd.Timestamp,
                                  window_days: int,
                                  metric: str,
@@ -83,6 +103,9 @@ def mean_in_stabilization_window(df_txt: pd.DataFrame,
     Moyenne de la métrique sur la fenêtre de stabilisation [event_date, event_date + window_days).
     """
     end = event_date + pd.Timedelta(days=window_days)
+    if isinstance(df_txt, SeriesStore):
+        _, y = df_txt.slice(event_date, end, metric=metric, tail_number=tail_number)
+        return float(y.mean()) if y.size > 0 else np.nan
     seg = slice_series(df_txt, event_date, end, metric=metric, tail_number=tail_number)
     if seg.empty:
         return np.nan
@@ -91,7 +114,8 @@ def mean_in_stabilization_window(df_txt: pd.DataFrame,
 
 def compute_non_maintenance_metrics(df_txt: pd.DataFrame,
                                     intervals: pd.DataFrame,
-                                    settings: Dict) -> pd.DataFrame:
+                                    settings: Dict,
+                                    store: SeriesStore = None) -> pd.DataFrame:
     """
     Calcule pour chaque intervalle entre deux événements :
       - baseline_before: moyenne avant l’événement sur l’intervalle précédent
@@ -99,220 +123,234 @@ def compute_non_maintenance_metrics(df_txt: pd.DataFrame,
       - drift_rate: pente sur l’intervalle courant (derrière l’événement)
       - valid: booléen selon les seuils (min_points, présence baseline, etc.)
     Utilise la métrique 'perf_factor' si disponible, sinon 'fuel_flow'.
+    Tous les intervalles d'un même tail sont traités en un seul passage vectorisé
+    (SegmentStatsEngine). La pente suit impact.drift (method, winsorize_pct, voir
+    RobustDriftEngine) ; elle vaut NaN sur les intervalles plus courts que min_interval_hours.
+    Un SeriesStore déjà construit peut être fourni pour être réutilisé.
     """
-    out_rows: List[Dict] = []
+    columns = ["event_idx", "event_date", "next_event_date", "event_name", "prev_event_date",
+               "tail_number", "metric", "baseline_before", "mean_after", "drift_rate",
+               "n_points_prev", "n_points_curr", "valid"]
+    if intervals.empty:
+        return pd.DataFrame(columns=columns)
+
     time_axis = settings["impact"]["time_axis"]
     window_days = int(settings["impact"]["stabilization_window_days"])
     min_points = int(settings["impact"]["min_points_per_interval"])
     require_prev = bool(settings["impact"]["require_prev_interval"])
     fallback_days = int(settings["impact"]["fallback_baseline_days"])
+    drift_cfg = settings["impact"].get("drift", {})
+    drift_method = drift_cfg.get("method", "ols")
+    winsorize_pct = float(drift_cfg.get("winsorize_pct", 0.0))
+    min_interval = pd.Timedelta(hours=float(drift_cfg.get("min_interval_hours", 0)))
 
     metric = "perf_factor" if "perf_factor" in df_txt.columns else "fuel_flow"
-    df_txt = df_txt.copy()
-    df_txt["timestamp"] = pd.to_datetime(df_txt["timestamp"], errors="coerce")
-    df_txt = df_txt.dropna(subset=["timestamp", metric]).sort_values("timestamp")
-
-    for _, row in intervals.iterrows():
-        event_date = row["event_date"]
-        next_event_date = row["next_event_date"]
-        prev_event_date = row["prev_event_date"]
-        event_name = str(row["event_name"])
-        tail_num = row["tail_number"] if "tail_number" in intervals.columns else None
-
-        use_fallback = False
-        if pd.isna(prev_event_date):
-            use_fallback = True
-            prev_event_date = event_date - pd.Timedelta(days=fallback_days)
-
-        seg_prev = slice_series(df_txt, prev_event_date, event_date, metric=metric, tail_number=tail_num)
-        seg_curr = slice_series(df_txt, event_date, next_event_date, metric=metric, tail_number=tail_num)
-
-        n_prev = seg_prev.shape[0]
-        n_curr = seg_curr.shape[0]
-
-        baseline = float(seg_prev[metric].mean()) if n_prev > 0 else np.nan
-        mean_after = mean_in_stabilization_window(df_txt, event_date, window_days, metric=metric, tail_number=tail_num)
-        drift_rate = fit_drift_rate(seg_curr, event_date, time_axis=time_axis, min_points=min_points, metric_col=metric)
-
-        valid_baseline = (not np.isnan(baseline)) and (n_prev >= (1 if not require_prev else min_points))
-        valid_after = not np.isnan(mean_after)
-        valid_interval = (n_curr >= min_points)
-        valid = valid_baseline and valid_after and valid_interval and (not use_fallback or not require_prev)
-
-        out_rows.append({
-            "event_idx": int(row["event_idx"]),
-            "event_date": event_date,
-            "next_event_date": next_event_date,
-            "event_name": event_name,
-            "prev_event_date": (row["prev_event_date"] if not use_fallback else pd.NaT),
-            "tail_number": tail_num,
-            "metric": metric,
-            "baseline_before": baseline,
-            "mean_after": mean_after,
-            "drift_rate": drift_rate,
-            "n_points_prev": int(n_prev),
-            "n_points_curr": int(n_curr),
-            "valid": bool(valid)
-        })
-
-    return pd.DataFrame(out_rows)
+    if store is None or metric not in store.metrics:
+        # Index trié par tail : chaque segment devient une recherche dichotomique + une vue
+        store = SeriesStore.from_frame(df_txt, metrics=[metric])
+
+    event_date = pd.to_datetime(intervals["event_date"]).reset_index(drop=True)
+    next_event_date = pd.to_datetime(intervals["next_event_date"]).reset_index(drop=True)
+    prev_raw = pd.to_datetime(intervals["prev_event_date"]).reset_index(drop=True)
+
+    use_fallback = prev_raw.isna().to_numpy()
+    prev_event_date = prev_raw.where(~use_fallback, event_date - pd.Timedelta(days=fallback_days))
+    stab_end = event_date + pd.Timedelta(days=window_days)
+
+    n = len(intervals)
+    baseline = np.full(n, np.nan)
+    mean_after = np.full(n, np.nan)
+    drift_rate = np.full(n, np.nan)
+    n_prev = np.zeros(n, dtype=int)
+    n_curr = np.zeros(n, dtype=int)
+
+    has_tail = "tail_number" in intervals.columns
+    if has_tail:
+        tails = intervals["tail_number"].to_numpy(dtype=object)
+        codes, uniques = pd.factorize(pd.Series(tails), use_na_sentinel=False)
+    else:
+        tails = np.full(n, None, dtype=object)
+        codes, uniques = np.zeros(n, dtype=int), [None]
+
+    for code, tail_num in enumerate(uniques):
+        idx = np.flatnonzero(codes == code)
+        engine = RobustDriftEngine.from_store(store, tail_num, metric, time_axis=time_axis)
+        ev = event_date.iloc[idx]
+
+        prev_stats = engine.compute(prev_event_date.iloc[idx], ev)
+        stab_stats = engine.compute(ev, stab_end.iloc[idx])
+        curr_stats = engine.compute(ev, next_event_date.iloc[idx], min_points=min_points)
+
+        baseline[idx] = prev_stats["mean"]
+        n_prev[idx] = prev_stats["count"]
+        mean_after[idx] = stab_stats["mean"]
+        if drift_method == "ols":
+            drift_rate[idx] = curr_stats["slope"]
+        else:
+            drift_rate[idx] = engine.drift(ev, next_event_date.iloc[idx], method=drift_method,
+                                           min_points=min_points, winsorize_pct=winsorize_pct)
+        n_curr[idx] = curr_stats["count"]
+
+    drift_rate[((next_event_date - event_date) < min_interval).to_numpy()] = np.nan
+
+    valid_baseline = ~np.isnan(baseline) & (n_prev >= (1 if not require_prev else min_points))
+    valid_after = ~np.isnan(mean_after)
+    valid_interval = n_curr >= min_points
+    valid = valid_baseline & valid_after & valid_interval & (~use_fallback | (not require_prev))
+
+    return pd.DataFrame({
+        "event_idx": intervals["event_idx"].astype(int).to_numpy(),
+        "event_date": event_date,
+        "next_event_date": next_event_date,
+        "event_name": intervals["event_name"].astype(str).to_numpy(),
+        "prev_event_date": prev_raw,
+        "tail_number": tails,
+        "metric": metric,
+        "baseline_before": baseline,
+        "mean_after": mean_after,
+        "drift_rate": drift_rate,
+        "n_points_prev": n_prev,
+        "n_points_curr": n_curr,
+        "valid": valid.astype(bool)
+    }, columns=columns)
 
 
 def estimate_type_rates(non_main_table: pd.DataFrame,
                         events_df: pd.DataFrame,
-                        settings: Dict) -> pd.DataFrame:
+                        settings: Dict,
+                        history: SameTypeHistory = None) -> pd.DataFrame:
     """
     Estime un taux par type d’événement (impact par unité de temps) :
       rate = (baseline_before - mean_after) / delta_t
     où delta_t est le temps depuis la précédente même maintenance.
+    L'historique (SameTypeHistory) peut être partagé avec compute_maintenance_impacts.
     """
-    cfg = EventTypeConfig(settings["impact"]["allowed_maintenance_types"])
-    accum: Dict[str, List[float]] = {}
-
-    ev = events_df.copy()
-    ev["event"] = ev["event"].astype(str)
-    ev["date"] = pd.to_datetime(ev["date"], errors="coerce")
-    ev = ev.dropna(subset=["date"]).sort_values("date")
-
-    for _, row in non_main_table.iterrows():
-        if not bool(row["valid"]):
-            continue
-        tname = str(row["event_name"])
-        if not cfg.is_allowed(tname):
-            continue
-
-        # Filtrer par tail_number si disponible
-        ev_subset = ev
-        if "tail_number" in ev.columns and not pd.isna(row.get("tail_number", np.nan)):
-            ev_subset = ev_subset[ev_subset["tail_number"] == row["tail_number"]]
-
-        prev_same = ev_subset[(ev_subset["event"] == tname) & (ev_subset["date"] < row["event_date"])]
-        if prev_same.empty:
-            continue
-        last_prev_date = prev_same["date"].max()
-
-        # Delta temps selon l'axe
-        if settings["impact"]["time_axis"] == "days":
-            delta_t = (row["event_date"] - last_prev_date).days
-        else:
-            delta_t = (row["event_date"] - last_prev_date).total_seconds() / 3600.0
+    columns = ["type", "rate_mean", "rate_std", "n"]
+    if non_main_table.empty:
+        return pd.DataFrame(columns=columns)
 
-        if delta_t <= 0:
-            continue
+    cfg = EventTypeConfig(settings["impact"]["allowed_maintenance_types"])
+    if history is None:
+        history = SameTypeHistory(events_df, time_axis=settings["impact"]["time_axis"])
+
+    names = non_main_table["event_name"].astype(str)
+    prev = history.lookup(non_main_table)
+
+    keep = (
+        non_main_table["valid"].astype(bool)
+        & names.map(cfg.is_allowed).astype(bool)
+        & (prev["delta_t"] > 0)
+    )
+    if not keep.any():
+        return pd.DataFrame(columns=columns)
+
+    # Impact observé instantané (amélioration = baseline_before - mean_after)
+    J_obs = non_main_table["baseline_before"].astype(float) - non_main_table["mean_after"].astype(float)
+    rates = (J_obs / prev["delta_t"])[keep]
+
+    grouped = rates.groupby(names[keep], sort=False)
+    out = pd.DataFrame({
+        "rate_mean": grouped.mean(),
+        "rate_std": grouped.std(ddof=1),
+        "n": grouped.size().astype(int),
+    })
+    return out.rename_axis("type").reset_index()[columns]
+
+
+def pool_type_rates(type_rates_list: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Agrège des tables de taux par type (une par avion) en taux flotte, exactement comme
+    si estimate_type_rates avait vu toutes les observations :
+      - rate_mean : moyenne pondérée par n
+      - rate_std : écart-type (ddof=1) reconstitué depuis les moyennes et variances partielles
+    """
+    columns = ["type", "rate_mean", "rate_std", "n"]
+    frames = [df for df in type_rates_list if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
 
-        # Impact observé instantané (amélioration = baseline_before - mean_after)
-        J_obs = float(row["baseline_before"]) - float(row["mean_after"])
-        rate = J_obs / float(delta_t)
-        accum.setdefault(tname, []).append(rate)
+    df = pd.concat(frames, ignore_index=True)
+    df["n"] = df["n"].astype(int)
+    df["_sum"] = df["rate_mean"] * df["n"]
+    # Somme des carrés des écarts par groupe : (n - 1) * std² (0 si n == 1)
+    df["_ss"] = ((df["n"] - 1) * df["rate_std"].fillna(0.0) ** 2).where(df["n"] > 1, 0.0)
 
-    rows = []
-    for t, vals in accum.items():
-        n = len(vals)
-        rate_mean = float(np.mean(vals)) if n > 0 else np.nan
-        rate_std = float(np.std(vals, ddof=1)) if n > 1 else np.nan
-        rows.append({
-            "type": t,
-            "rate_mean": rate_mean,
-            "rate_std": rate_std,
-            "n": int(n)
-        })
+    g = df.groupby("type", sort=False)
+    n = g["n"].sum()
+    mean = g["_sum"].sum() / n
+    df["_between"] = df["n"] * (df["rate_mean"] - df["type"].map(mean)) ** 2
+    ss = g["_ss"].sum() + df.groupby("type", sort=False)["_between"].sum()
+    std = np.sqrt(ss / (n - 1)).where(n > 1, np.nan)
 
-    return pd.DataFrame(rows)
+    out = pd.DataFrame({"rate_mean": mean, "rate_std": std, "n": n.astype(int)})
+    return out.rename_axis("type").reset_index()[columns]
 
 
 def compute_maintenance_impacts(events_df: pd.DataFrame,
                                 non_main_table: pd.DataFrame,
                                 type_rates_df: pd.DataFrame,
-                                settings: Dict) -> pd.DataFrame:
+                                settings: Dict,
+                                history: SameTypeHistory = None) -> pd.DataFrame:
     """
     Impact instantané d'une maintenance:
       impact_model = rate_type_mean * (temps depuis la dernière même maintenance)
     Fallback demandé par Pierre:
       si pas de rate_type_mean disponible, utiliser drift_non_maintenance_mean * delta_t.
     """
+    columns = ["event_date", "event_name", "tail_number", "metric", "delta_t", "impact_model",
+               "impact_observed", "rate_mean_type", "rate_std_type", "rate_n_type", "rate_source"]
+    if non_main_table.empty:
+        return pd.DataFrame(columns=columns)
+
     cfg = EventTypeConfig(settings["impact"]["allowed_maintenance_types"])
+    if history is None:
+        history = SameTypeHistory(events_df, time_axis=settings["impact"]["time_axis"])
 
     # Carte des taux par type
-    rate_map: Dict[str, Dict] = {}
-    for _, r in type_rates_df.iterrows():
-        rate_map[str(r["type"])] = {
-            "rate_mean": float(r["rate_mean"]),
-            "rate_std": float(r["rate_std"]) if not pd.isna(r["rate_std"]) else np.nan,
-            "n": int(r["n"])
-        }
+    rates = type_rates_df
+    if not rates.empty:
+        rates = rates.assign(type=rates["type"].astype(str))
+    rates = rates.set_index("type") if not rates.empty else pd.DataFrame(columns=["rate_mean", "rate_std", "n"])
 
     # Moyenne des dérives sur les intervalles valides (fallback)
     valid_nm = non_main_table[non_main_table["valid"] == True]
     drift_rate_mean = float(valid_nm["drift_rate"].mean()) if not valid_nm.empty else np.nan
 
-    ev = events_df.copy()
-    ev["event"] = ev["event"].astype(str)
-    ev["date"] = pd.to_datetime(ev["date"], errors="coerce")
-    ev = ev.dropna(subset=["date"]).sort_values("date")
-
-    impacts = []
-    for _, row in non_main_table.iterrows():
-        tname = str(row["event_name"])
-        if not cfg.is_allowed(tname):
-            continue
-
-        # Sélection de la série d'événements pour le même tail si dispo
-        ev_subset = ev
-        if "tail_number" in ev.columns and not pd.isna(row.get("tail_number", np.nan)):
-            ev_subset = ev_subset[ev_subset["tail_number"] == row["tail_number"]]
-
-        prev_same = ev_subset[(ev_subset["event"] == tname) & (ev_subset["date"] < row["event_date"])]
-        if prev_same.empty:
-            continue
-        last_prev_date = prev_same["date"].max()
-
-        # Delta t selon axe
-        if settings["impact"]["time_axis"] == "days":
-            delta_t = (row["event_date"] - last_prev_date).days
-        else:
-            delta_t = (row["event_date"] - last_prev_date).total_seconds() / 3600.0
-
-        if delta_t <= 0:
-            continue
-
-        # Modèle: produit "taux" * "temps depuis dernière même maintenance"
-        rate_mean_type = rate_map.get(tname, {}).get("rate_mean", np.nan)
-        if not pd.isna(rate_mean_type):
-            impact_model = rate_mean_type * float(delta_t)
-            rate_std_type = rate_map.get(tname, {}).get("rate_std", np.nan)
-            rate_n_type = rate_map.get(tname, {}).get("n", 0)
-            source = "type_rate"
-        else:
-            # Fallback demandé: utiliser drift non-maintenance moyen
-            if pd.isna(drift_rate_mean):
-                # Pas de fallback possible → ignorer
-                continue
-            impact_model = drift_rate_mean * float(delta_t)
-            rate_std_type = np.nan
-            rate_n_type = 0
-            source = "fallback_drift"
-
-        # Observé (si intervalle valide)
-        J_obs = np.nan
-        if bool(row["valid"]):
-            # amélioration observée sur la fenêtre de stabilisation
-            J_obs = float(row["baseline_before"]) - float(row["mean_after"])
-
-        impacts.append({
-            "event_date": row["event_date"],
-            "event_name": tname,
-            "tail_number": row.get("tail_number", None),
-            "metric": row.get("metric", "fuel_flow"),
-            "delta_t": float(delta_t),
-            "impact_model": float(impact_model),
-            "impact_observed": J_obs,
-            "rate_mean_type": (rate_mean_type if not pd.isna(rate_mean_type) else drift_rate_mean),
-            "rate_std_type": rate_std_type,
-            "rate_n_type": int(rate_n_type),
-            "rate_source": source
-        })
-
-    return pd.DataFrame(impacts)
+    names = non_main_table["event_name"].astype(str)
+    delta_t = history.lookup(non_main_table)["delta_t"]
+
+    rate_mean_type = names.map(rates["rate_mean"]).astype(float)
+    has_rate = rate_mean_type.notna()
+
+    keep = names.map(cfg.is_allowed).astype(bool) & (delta_t > 0)
+    # Pas de taux par type et pas de fallback possible → ignorer
+    if pd.isna(drift_rate_mean):
+        keep &= has_rate
+
+    # Modèle: produit "taux" * "temps depuis dernière même maintenance"
+    impact_model = np.where(has_rate, rate_mean_type * delta_t, drift_rate_mean * delta_t)
+    rate_std_type = names.map(rates["rate_std"]).astype(float).where(has_rate, np.nan)
+    rate_n_type = names.map(rates["n"]).fillna(0).astype(int).where(has_rate, 0)
+
+    # Observé (si intervalle valide): amélioration sur la fenêtre de stabilisation
+    J_obs = (non_main_table["baseline_before"].astype(float)
+             - non_main_table["mean_after"].astype(float)).where(non_main_table["valid"].astype(bool), np.nan)
+
+    out = pd.DataFrame({
+        "event_date": non_main_table["event_date"],
+        "event_name": names,
+        "tail_number": non_main_table["tail_number"] if "tail_number" in non_main_table.columns else None,
+        "metric": non_main_table["metric"] if "metric" in non_main_table.columns else "fuel_flow",
+        "delta_t": delta_t.astype(float),
+        "impact_model": impact_model,
+        "impact_observed": J_obs,
+        "rate_mean_type": rate_mean_type.where(has_rate, drift_rate_mean),
+        "rate_std_type": rate_std_type,
+        "rate_n_type": rate_n_type.astype(int),
+        "rate_source": np.where(has_rate, "type_rate", "fallback_drift"),
+    }, columns=columns)
+
+    return out[keep.to_numpy()].reset_index(drop=True)
 
 
 def summarize_global(non_main_table: pd.DataFrame,
@@ -1,52 +1,280 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence
 import logging
 import os
+import threading
+
+from classes.io.cache import HAS_PYARROW
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_POINTS = 4000
+
+# Formats d'export : extension du fichier ; parquet et feather nécessitent pyarrow
+EXPORT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def _tmp_path(path: Path) -> Path:
+    """Fichier temporaire caché, dans le même dossier (rename atomique), propre au thread/processus."""
+    return path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+
+
+def write_table_atomic(df: pd.DataFrame, path: Path, fmt: str = "csv") -> Path:
+    """
+    Écrit la table dans un fichier temporaire puis le renomme (os.replace) : un lecteur voit
+    l'ancienne version complète ou la nouvelle, jamais un fichier à moitié écrit.
+    """
+    path = Path(path)
+    tmp = _tmp_path(path)
+    try:
+        if fmt == "csv":
+            df.to_csv(tmp, index=False)
+        elif fmt == "parquet":
+            df.to_parquet(tmp, index=False)
+        elif fmt == "feather":
+            df.reset_index(drop=True).to_feather(tmp)
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def minmax_downsample(x: np.ndarray, y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Indices (triés) du minimum et du maximum de y dans chacun des n_buckets intervalles
+    de même largeur sur x (≈ une colonne de pixels), plus le premier et le dernier point.
+    Les pics sont conservés exactement ; x doit être trié.
+    """
+    n = len(x)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    xi = x.astype(np.int64, copy=False) if np.issubdtype(x.dtype, np.datetime64) else x
+    span = float(xi[-1] - xi[0]) or 1.0
+    bucket = np.minimum(((xi - xi[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    owner = np.repeat(np.arange(len(starts)), lengths)
+
+    # Premier indice atteignant le min (resp. le max) de chaque bucket
+    is_min = y == np.repeat(np.minimum.reduceat(y, starts), lengths)
+    is_max = y == np.repeat(np.maximum.reduceat(y, starts), lengths)
+    i_min = np.flatnonzero(is_min)
+    i_max = np.flatnonzero(is_max)
+    i_min = i_min[np.unique(owner[i_min], return_index=True)[1]]
+    i_max = i_max[np.unique(owner[i_max], return_index=True)[1]]
+    return np.unique(np.concatenate([[0, n - 1], i_min, i_max]))
+
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices retenus par Largest-Triangle-Three-Buckets : dans chaque bucket (même nombre de
+    points), le point qui forme le plus grand triangle avec le point retenu précédemment et
+    la moyenne du bucket suivant. Une boucle par bucket (n_out), vectorisée à l'intérieur.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf = x.astype(np.int64).astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    yf = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        nxt_lo, nxt_hi = hi, edges[k + 2] if k + 2 < len(edges) else n
+        cx, cy = xf[nxt_lo:nxt_hi].mean(), yf[nxt_lo:nxt_hi].mean()
+        area = np.abs((xf[a] - cx) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (cy - yf[a]))
+        a = lo + int(np.argmax(area))
+        out[k + 1] = a
+    return out
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int = DEFAULT_MAX_POINTS,
+               method: str = "minmax") -> np.ndarray:
+    """Indices des points à tracer (au plus ~max_points) ; method = minmax, lttb ou none."""
+    if method == "none" or not max_points or len(x) <= max_points:
+        return np.arange(len(x))
+    if method == "minmax":
+        return minmax_downsample(x, y, max(1, max_points // 2))
+    if method == "lttb":
+        return lttb_downsample(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def _render_timeline(task: Dict) -> str:
+    """Rendu d'une courbe déjà réduite (exécutable dans un worker : pas d'état pyplot)."""
+    # matplotlib (~0,5 s d'import) n'est chargé que si un graphique est effectivement tracé
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    metric = task["metric"]
+    if len(task["x"]):
+        ax.plot(task["x"], task["y"], label=metric, linewidth=0.8)
+        if len(task["events"]):
+            # Un seul LineCollection pour tous les événements (au lieu d'un axvline par ligne)
+            ax.vlines(task["events"], 0, 1, transform=ax.get_xaxis_transform(),
+                      colors="red", linestyles="--", alpha=0.3, label="events")
+    else:
+        ax.text(0.5, 0.5, "No data available", ha="center", va="center")
+    ax.set_title(task["title"])
+    ax.set_xlabel("Date")
+    ax.set_ylabel(metric)
+    ax.legend()
+    tmp = _tmp_path(Path(task["path"]))
+    try:
+        fig.savefig(tmp, format="png")
+        os.replace(tmp, task["path"])
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return task["path"]
+
 class Reporter:
-    def __init__(self, output_dir: Path):
+    """
+    Exports du pipeline dans output_dir. Chaque fichier est écrit de façon atomique (temporaire
+    puis rename) ; export_many écrit les tables indépendantes en parallèle (pool de threads),
+    dans tous les formats demandés (csv, parquet, feather).
+    """
+
+    def __init__(self, output_dir: Path, formats: Sequence[str] = ("csv",), max_workers: int = None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
-
-    def _remove_if_exists(self, path: Path):
-        """Supprime le fichier s'il existe déjà."""
-        if path.exists():
-            os.remove(path)
-            logger.info("Old file %s removed", path)
+        unknown = [f for f in formats if f not in EXPORT_FORMATS]
+        if unknown:
+            raise ValueError(f"Unknown export format(s): {unknown}")
+        self.formats = list(dict.fromkeys(formats))
+        if not HAS_PYARROW and any(f != "csv" for f in self.formats):
+            logger.warning("pyarrow not installed, exports fall back to csv only")
+            self.formats = ["csv"]
+        self.max_workers = max_workers
 
     def summary_tables(self, impacts: pd.DataFrame, sort_col="delta_fuel") -> pd.DataFrame:
         summary = impacts.sort_values(sort_col, ascending=False) if not impacts.empty else impacts
-        out_path = self.output_dir / "impact_summary.csv"
-        self._remove_if_exists(out_path)   # Suppression avant écriture
-        summary.to_csv(out_path, index=False)
+        out_path = write_table_atomic(summary, self.output_dir / "impact_summary.csv")
         logger.info("Impact summary exported to %s", out_path)
         return summary
 
-    def plot_metric(self, df: pd.DataFrame, metric="fuel_flow", event_col="event"):
-        out_path = self.output_dir / f"{metric}_timeline.png"
-        self._remove_if_exists(out_path)   # Suppression avant écriture
-        plt.figure(figsize=(10,5))
-        if metric in df.columns and "timestamp" in df.columns and not df.empty:
-            plt.plot(df["timestamp"], df[metric], label=metric)
-            if event_col in df.columns:
-                for t, e in zip(df["timestamp"], df[event_col]):
-                    if pd.notna(e):
-                        plt.axvline(t, color="red", linestyle="--", alpha=0.3)
+    def _timeline_task(self, df: pd.DataFrame, metric: str, event_col: str, events: Optional[pd.DataFrame],
+                       filename: str, title: str, max_points: int, method: str) -> Dict:
+        """Série réduite et dates d'événements prêtes à tracer (quelques milliers de points au plus)."""
+        out_path = self.output_dir / filename
+        task = {"path": str(out_path), "metric": metric, "title": title,
+                "x": np.array([], dtype="datetime64[ns]"), "y": np.array([]), "events": np.array([])}
+        if metric not in df.columns or "timestamp" not in df.columns or df.empty:
+            return task
+
+        x = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+        y = df[metric].to_numpy(dtype=np.float64)
+        keep = ~np.isnat(x) & np.isfinite(y)
+        x, y = x[keep], y[keep]
+        if len(x) > 1 and (x[1:] < x[:-1]).any():
+            order = np.argsort(x, kind="stable")
+            x, y = x[order], y[order]
+        idx = downsample(x, y, max_points=max_points, method=method)
+        task["x"], task["y"] = x[idx], y[idx]
+
+        if events is not None and "date" in events.columns:
+            dates = pd.to_datetime(events["date"], errors="coerce")
+        elif event_col in df.columns:
+            dates = df.loc[df[event_col].notna(), "timestamp"]
         else:
-            plt.text(0.5, 0.5, "No data available", ha="center", va="center")
-        plt.title(f"{metric} over time with events")
-        plt.xlabel("Date")
-        plt.ylabel(metric)
-        plt.legend()
-        plt.savefig(out_path)
-        plt.close()
-        logger.info("Plot exported to %s", out_path)
+            dates = pd.Series([], dtype="datetime64[ns]")
+        ev = np.unique(dates.dropna().to_numpy(dtype="datetime64[ns]"))
+        if max_points and len(ev) > max_points:
+            # Marqueurs confondus à l'écran : un seul par bucket de largeur ≈ 1 pixel
+            ei = ev.astype(np.int64)
+            span = float(ei[-1] - ei[0]) or 1.0
+            bucket = ((ei - ei[0]) / span * (max_points - 1)).astype(np.int64)
+            ev = ev[np.unique(bucket, return_index=True)[1]]
+        task["events"] = ev
+        logger.debug("Plot %s: %d -> %d points, %d events", filename, len(x), len(idx), len(task["events"]))
+        return task
+
+    def plot_metric(self, df: pd.DataFrame, metric="fuel_flow", event_col="event",
+                    events: pd.DataFrame = None, filename: str = None,
+                    max_points: int = DEFAULT_MAX_POINTS, method: str = "minmax") -> Path:
+        """
+        Courbe de la métrique dans le temps avec les événements en traits verticaux.
+        La série est réduite avant le tracé (min/max par bucket ou LTTB) : le temps de rendu
+        et la taille du PNG ne dépendent plus du nombre de mesures.
+        events (colonne date) est prioritaire sur event_col pour placer les marqueurs.
+        """
+        filename = filename or f"{metric}_timeline.png"
+        task = self._timeline_task(df, metric, event_col, events, filename,
+                                   f"{metric} over time with events", max_points, method)
+        _render_timeline(task)
+        logger.info("Plot exported to %s", task["path"])
+        return Path(task["path"])
+
+    def plot_metric_by_tail(self, df: pd.DataFrame, metric="fuel_flow", events: pd.DataFrame = None,
+                            max_points: int = DEFAULT_MAX_POINTS, method: str = "minmax",
+                            max_workers: int = None) -> List[Path]:
+        """
+        Un graphique par tail_number ({metric}_timeline_{tail}.png). Les séries sont réduites ici,
+        le rendu (coût fixe par figure) est réparti sur un pool de processus.
+        """
+        if "tail_number" not in df.columns or df.empty:
+            return []
+        tasks = []
+        for tail, part in df.groupby("tail_number", sort=True, observed=True):
+            ev = None
+            if events is not None and "tail_number" in events.columns:
+                ev = events[events["tail_number"].astype(str) == str(tail)]
+            tasks.append(self._timeline_task(part, metric, "event", ev, f"{metric}_timeline_{tail}.png",
+                                             f"{metric} over time with events ({tail})", max_points, method))
+
+        max_workers = max_workers or os.cpu_count() or 1
+        max_workers = max(1, min(int(max_workers), len(tasks)))
+        if max_workers == 1:
+            paths = [_render_timeline(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                paths = list(pool.map(_render_timeline, tasks))
+        logger.info("%d tail plot(s) exported to %s", len(paths), self.output_dir)
+        return [Path(p) for p in paths]
 
     def export_csv(self, df: pd.DataFrame, filename="maintenance_plan.csv"):
-        out_path = self.output_dir / filename
-        self._remove_if_exists(out_path)   # Suppression avant écriture
-        df.to_csv(out_path, index=False)
+        out_path = write_table_atomic(df, self.output_dir / filename, fmt="csv")
         logger.info("CSV exported to %s", out_path)
+        return out_path
+
+    def export(self, df: pd.DataFrame, filename: str) -> List[Path]:
+        """Exporte la table dans chacun des formats configurés (filename sans extension ou en .csv)."""
+        return self.export_many({filename: df}, max_workers=1)[filename]
+
+    def export_many(self, tables: Dict[str, pd.DataFrame], max_workers: int = None) -> Dict[str, List[Path]]:
+        """
+        Exporte plusieurs tables indépendantes : une écriture (table, format) par tâche sur un
+        pool de threads (l'écriture parquet / feather et les E/S libèrent le GIL).
+        Les tables None sont ignorées. Une erreur d'écriture est propagée après la fin des
+        autres tâches ; les fichiers déjà en place ne sont jamais tronqués.
+        """
+        jobs = [(name, self.output_dir / (Path(name).stem + EXPORT_FORMATS[fmt]), fmt)
+                for name, df in tables.items() if df is not None for fmt in self.formats]
+        max_workers = max_workers or self.max_workers or min(len(jobs), os.cpu_count() or 1)
+        max_workers = max(1, min(int(max_workers), len(jobs) or 1))
+
+        def write(job):
+            name, path, fmt = job
+            return write_table_atomic(tables[name], path, fmt=fmt)
+
+        if max_workers == 1:
+            paths = [write(job) for job in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(write, job) for job in jobs]
+            paths = [f.result() for f in futures]
+
+        out = {}
+        for (name, _, fmt), path in zip(jobs, paths):
+            out.setdefault(name, []).append(path)
+        logger.info("%d file(s) exported to %s (%s)", len(paths), self.output_dir, ", ".join(self.formats))
+        return out
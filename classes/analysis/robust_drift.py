@@ -0,0 +1,396 @@
+import numpy as np
+from typing import Tuple
+
+from classes.analysis.segment_stats import SegmentStatsEngine
+
+# "robust_linear" (valeur historique de settings.json) = OLS winsorisée
+DRIFT_METHODS = ("ols", "robust_linear", "winsorized_ols", "theil_sen", "huber")
+
+HUBER_K = 1.345                  # efficacité 95 % sous bruit gaussien
+MAD_TO_SIGMA = 0.6744897501960817
+
+
+def ragged_indices(i0: np.ndarray, i1: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Indices à plat des segments [i0, i1), numéro de segment de chaque élément, débuts et longueurs."""
+    lens = (i1 - i0).astype(np.int64)
+    offsets = np.cumsum(lens) - lens
+    seg = np.repeat(np.arange(lens.size), lens)
+    idx = np.arange(lens.sum(), dtype=np.int64) - np.repeat(offsets, lens) + np.repeat(i0, lens)
+    return idx, seg, offsets, lens
+
+
+def segment_order(values: np.ndarray, seg: np.ndarray, m: int) -> np.ndarray:
+    """
+    Ordre (segment, valeur) : tri des valeurs puis tri stable par segment ; jusqu'à 2¹⁶ segments,
+    ce second tri porte sur des entiers 16 bits (tri par base, linéaire) et coûte bien moins
+    qu'un lexsort.
+    """
+    if m > 1 << 16:
+        return np.lexsort((values, seg))
+    order = np.argsort(values)
+    return order[np.argsort(seg[order].astype(np.uint16), kind="stable")]
+
+
+def segment_quantile(values: np.ndarray, seg: np.ndarray, offsets: np.ndarray, lens: np.ndarray,
+                     q: float) -> np.ndarray:
+    """Quantile q de chaque segment (interpolation linéaire comme np.quantile) ; segments non vides."""
+    order = segment_order(values, seg, lens.size)
+    v = values[order]
+    pos = q * (lens - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, lens - 1)
+    a, b = v[offsets + lo], v[offsets + hi]
+    return a + (b - a) * (pos - lo)
+
+
+def _wls(t: np.ndarray, y: np.ndarray, w: np.ndarray, seg: np.ndarray, m: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Moindres carrés pondérés de chaque segment : (ordonnée en t=0, pente)."""
+    sw = np.bincount(seg, w, m)
+    st = np.bincount(seg, w * t, m)
+    sy = np.bincount(seg, w * y, m)
+    stt = np.bincount(seg, w * t * t, m)
+    sty = np.bincount(seg, w * t * y, m)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mt, my = st / sw, sy / sw
+        slope = (sty - st * my) / (stt - st * mt)
+    return my - slope * mt, slope
+
+
+class RobustDriftEngine(SegmentStatsEngine):
+    """
+    Pentes robustes de segments [start, end), calculées pour tous les segments d'un tail
+    à la fois (pas de boucle Python par segment) :
+      - winsorized_ols : OLS, résidus winsorisés aux quantiles winsorize_pct / 1 - winsorize_pct,
+        puis nouvel OLS
+      - huber : IRLS de Huber (k = 1.345, échelle = MAD des résidus) ; chaque itération (max_iter
+        au plus) traite tous les segments à la fois
+      - theil_sen : médiane des pentes de toutes les paires de points, par recherche sur la pente
+        (chaque étape compte les paires sous une pente candidate en O(n log n), sans énumérer
+        les n² paires) ; la recherche part de ±(max y - min y) / (plus petit écart de temps
+        non nul), borne sûre même avec des timestamps répétés
+    Coût mesuré sur 2 M points en 100 segments (1 cœur) : winsorized_ols ≈ 0.6 s, huber ≈ 3.6 s,
+    theil_sen ≈ 17 s (une douzaine de comptages complets) ; theil_sen est à réserver aux
+    intervalles courts ou aux analyses ponctuelles.
+    Les segments pour lesquels l'OLS n'est pas défini (trop peu de points, étendue nulle) valent NaN.
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray, time_axis: str = "days"):
+        super().__init__(timestamps, values, time_axis=time_axis)
+        self._t = self._to_axis(self._ts_int)
+        self._y = np.asarray(values, dtype=float)
+
+    def drift(self, starts, ends, method: str = "ols", min_points: int = 2,
+              winsorize_pct: float = 0.0, **kwargs) -> np.ndarray:
+        """Pente de chaque segment selon method (voir DRIFT_METHODS)."""
+        if method not in DRIFT_METHODS:
+            raise ValueError(f"Unknown drift method: {method}")
+        ols = self.compute(starts, ends, min_points=min_points)["slope"]
+        if method == "ols":
+            return ols
+
+        ok = ~np.isnan(ols)
+        out = np.full(ols.shape, np.nan)
+        if not ok.any():
+            return out
+        i0, i1 = self.bounds(starts, ends)
+        idx, seg, offsets, lens = ragged_indices(i0[ok], i1[ok])
+        # t centré par segment : sommes pondérées sans annulation numérique
+        t = self._t[idx]
+        t = t - (np.bincount(seg, t, lens.size) / lens)[seg]
+        y = self._y[idx]
+
+        if method in ("robust_linear", "winsorized_ols"):
+            out[ok] = self._winsorized_ols(t, y, seg, offsets, lens, winsorize_pct)
+        elif method == "huber":
+            out[ok] = self._huber(t, y, seg, offsets, lens, **kwargs)
+        else:
+            out[ok] = self._theil_sen(t, y, seg, offsets, lens, **kwargs)
+        return out
+
+    # -- OLS winsorisée -----------------------------------------------------
+
+    @staticmethod
+    def _winsorized_ols(t, y, seg, offsets, lens, pct: float) -> np.ndarray:
+        m = lens.size
+        a, b = _wls(t, y, np.ones_like(y), seg, m)
+        if not pct or pct <= 0:
+            return b
+        fit = a[seg] + b[seg] * t
+        r = y - fit
+        lo = segment_quantile(r, seg, offsets, lens, pct)
+        hi = segment_quantile(r, seg, offsets, lens, 1.0 - pct)
+        y_w = fit + np.clip(r, lo[seg], hi[seg])
+        return _wls(t, y_w, np.ones_like(y), seg, m)[1]
+
+    # -- Huber IRLS ---------------------------------------------------------
+
+    @staticmethod
+    def _huber(t, y, seg, offsets, lens, k: float = HUBER_K, max_iter: int = 50, tol: float = 1e-8) -> np.ndarray:
+        m = lens.size
+        w = np.ones_like(y)
+        a, b = _wls(t, y, w, seg, m)
+        for _ in range(max_iter):
+            r = y - a[seg] - b[seg] * t
+            abs_r = np.abs(r)
+            scale = segment_quantile(abs_r, seg, offsets, lens, 0.5) / MAD_TO_SIGMA
+            with np.errstate(invalid="ignore", divide="ignore"):
+                u = abs_r / (k * scale[seg])
+                w = np.where(u > 1.0, 1.0 / u, 1.0)   # échelle nulle : poids 1 (ajustement exact)
+            a_new, b_new = _wls(t, y, w, seg, m)
+            step = np.abs(b_new - b) <= tol * np.maximum(np.abs(b), 1e-300)
+            step &= np.abs(a_new - a) <= tol * np.maximum(np.abs(a), 1e-300)
+            a, b = a_new, b_new
+            if np.all(step | np.isnan(b)):
+                break
+        return b
+
+    # -- Theil–Sen ----------------------------------------------------------
+
+    @staticmethod
+    def _z_order(z: np.ndarray, prob: np.ndarray, n_prob: int) -> np.ndarray:
+        """Ordre (problème, z), ex aequo dans l'ordre du temps (tris stables)."""
+        if n_prob > 1 << 16:
+            return np.lexsort((z, prob))
+        order = np.argsort(z, kind="stable")
+        # Tri stable par problème sur entiers 16 bits : tri par base (radix), linéaire
+        return order[np.argsort(prob[order].astype(np.uint16), kind="stable")]
+
+    @classmethod
+    def _ranks(cls, z: np.ndarray, prob: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Rang de z dans son problème (problèmes contigus, éléments dans l'ordre du temps) :
+        permutation 0..n-1, ex aequo départagés par l'ordre du temps (jamais d'inversion entre eux).
+        """
+        order = cls._z_order(z, prob, offsets.size)
+        rank = np.empty(z.size, dtype=np.int32)
+        rank[order] = np.arange(z.size, dtype=np.int32) - np.repeat(offsets, np.diff(np.r_[offsets, z.size])).astype(np.int32)
+        return rank
+
+    @classmethod
+    def _count_below(cls, s: np.ndarray, t, y, prob, offsets, lens) -> np.ndarray:
+        """
+        Nombre de paires (i < j dans l'ordre du temps) de pente < s[p] pour chaque problème p :
+        pente(i, j) < s ⇔ z_i > z_j avec z = y - s·t, soit les inversions des rangs de z.
+        Elles sont comptées bit par bit (du poids fort au poids faible) : à préfixe égal, une paire
+        s'inverse au premier bit où elle diffère. Les rangs étant une permutation, le groupe d'un
+        élément (même préfixe) et sa taille se déduisent du rang ; chaque niveau n'est qu'un cumsum
+        et une partition stable en O(n), soit O(n log n) au total sans tri par niveau.
+        """
+        n = y.size
+        rank = cls._ranks(y - s[prob] * t, prob, offsets)
+        n_bits = int(lens.max() - 1).bit_length()
+        offset = np.repeat(offsets, lens).astype(np.int32)
+        size = np.repeat(lens, lens).astype(np.int32)
+        here = np.arange(n, dtype=np.int32)
+        count = np.zeros(lens.size, dtype=np.int64)
+        # Éléments rangés par (problème, rang >> (b + 1)), dans l'ordre du temps à préfixe égal
+        for b in range(n_bits - 1, -1, -1):
+            bit = (rank >> b) & 1
+            before = np.cumsum(bit, dtype=np.int32) - bit
+            rel_start = (rank >> (b + 1)) << (b + 1)
+            g_start = offset + rel_start
+            ones_before = before - before[g_start]    # « 1 » plus tôt dans le groupe
+            count += np.add.reduceat(ones_before * (1 - bit), offsets, dtype=np.int64)
+            if b == 0:
+                break
+            n_zero = np.minimum(np.int32(1 << b), size - rel_start)
+            dest = here - ones_before + bit * (g_start + n_zero + 2 * ones_before - here)
+            rank_next = np.empty_like(rank)
+            rank_next[dest] = rank
+            rank = rank_next
+        return count.astype(np.float64)
+
+    def _theil_sen(self, t, y, seg, offsets, lens, rtol: float = 1e-12, max_iter: int = 100,
+                   sample_pairs: int = 4, seed: int = 0, enumerate_gap: int = 64) -> np.ndarray:
+        """
+        Médiane des pentes de paires, rang ⌊P/2⌋ parmi les P paires de t distincts (médiane
+        exacte si P impair, valeur centrale supérieure sinon). Dès que l'encadrement ne contient
+        plus que enumerate_gap paires au plus, elles sont énumérées (_bracket_pairs).
+        """
+        m = lens.size
+        # Ordre (t, y) dans chaque segment : deux points de même t ne forment jamais d'inversion
+        order = np.lexsort((y, t, seg))
+        t, y = t[order], y[order]
+
+        same_seg = seg[1:] == seg[:-1]
+        tie = np.zeros(y.size, dtype=bool)
+        tie[1:] = same_seg & (t[1:] == t[:-1])
+        run_start = np.flatnonzero(~tie)
+        run_len = np.diff(np.r_[run_start, y.size])
+        n_pairs = lens * (lens - 1) // 2 - np.bincount(seg[run_start], run_len * (run_len - 1) // 2, m).astype(np.int64)
+
+        # Toute pente de paire vérifie |pente| <= (max y - min y) / (plus petit écart de t non nul) ;
+        # les pentes consécutives ne suffisent pas dès que des t sont ex aequo
+        # (segments contigus et non vides : réductions par reduceat sur leurs débuts)
+        dt = np.r_[t[1:] - t[:-1], 0.0]
+        dt[np.r_[~same_seg, True] | (dt <= 0)] = np.inf
+        min_dt = np.minimum.reduceat(dt, offsets)
+        y_span = np.maximum.reduceat(y, offsets) - np.minimum.reduceat(y, offsets)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bound = np.where(np.isfinite(min_dt), y_span / min_dt, 0.0)
+        lo, hi = -bound, bound.copy()
+
+        out = np.full(m, np.nan)
+        live = n_pairs > 0
+        if not live.any():
+            return out
+        # Segments sans paire retirés : les éléments restent contigus par problème
+        sel = np.repeat(live, lens)
+        t, y = t[sel], y[sel]
+        lens, lo, hi = lens[live], lo[live], hi[live]
+        n_p = lens.size
+        offsets = np.cumsum(lens) - lens
+        prob = np.repeat(np.arange(n_p), lens)
+        pairs = n_pairs[live].astype(np.float64)
+        rank_k = np.floor(pairs / 2)
+
+        def count(slopes, active=None):
+            if active is None or active.all():
+                return self._count_below(slopes, t, y, prob, offsets, lens)
+            keep = np.repeat(active, lens)
+            a_lens = lens[active]
+            c = np.zeros(n_p)
+            c[active] = self._count_below(slopes[active], t[keep], y[keep],
+                                          np.repeat(np.arange(a_lens.size), a_lens),
+                                          np.cumsum(a_lens) - a_lens, a_lens)
+            return c
+
+        # Encadrement [lo, hi) du rang cherché : count(lo) <= k < count(hi). Les deux bornes sont
+        # élargies : une pente de paire égale à ±bound (segment de 2 points…) ne dépend plus de
+        # l'arrondi de y - s·t pour tomber du bon côté
+        margin = np.maximum(hi - lo, np.maximum(np.abs(lo), np.abs(hi))) * 1e-9 + 1e-300
+        lo, hi = lo - margin, hi + margin
+        c_lo, c_hi = np.zeros(n_p), pairs.copy()
+
+        # Resserrement initial par quantiles d'un échantillon de pentes (sample_pairs × n paires
+        # tirées au hasard), validé par deux comptages ; à défaut on garde l'encadrement complet
+        rng = np.random.default_rng(seed)
+        n_draw = np.minimum(sample_pairs * lens, 1 << 16)
+        d_prob = np.repeat(np.arange(n_p), n_draw)
+        i = (rng.random(d_prob.size) * lens[d_prob]).astype(np.int64) + offsets[d_prob]
+        j = (rng.random(d_prob.size) * lens[d_prob]).astype(np.int64) + offsets[d_prob]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sample = (y[j] - y[i]) / (t[j] - t[i])
+        finite = np.isfinite(sample)
+        d_prob, sample = d_prob[finite], sample[finite]
+        d_lens = np.bincount(d_prob, minlength=n_p)
+        ok = d_lens > 0
+        if ok.any():
+            d_offsets = np.cumsum(d_lens) - d_lens
+            srt = sample[segment_order(sample, d_prob, n_p)]
+            q = (rank_k + 0.5) / pairs
+            margin = 4.0 * np.sqrt(q * (1.0 - q) / np.maximum(d_lens, 1)) + 2.0 / np.maximum(d_lens, 1)
+            last = np.maximum(d_lens - 1, 0)
+            lo_i = np.floor(np.clip(q - margin, 0.0, 1.0) * last).astype(np.int64)
+            hi_i = np.ceil(np.clip(q + margin, 0.0, 1.0) * last).astype(np.int64)
+            s_lo = np.clip(np.where(ok, srt[np.minimum(d_offsets + lo_i, srt.size - 1)], lo), lo, hi)
+            s_hi = np.clip(np.where(ok, np.nextafter(srt[np.minimum(d_offsets + hi_i, srt.size - 1)], np.inf), hi), lo, hi)
+            c = count(s_lo, ok)
+            use = ok & (c <= rank_k)
+            lo, c_lo = np.where(use, s_lo, lo), np.where(use, c, c_lo)
+            c = count(s_hi, ok)
+            use = ok & (c > rank_k)
+            hi, c_hi = np.where(use, s_hi, hi), np.where(use, c, c_hi)
+
+        slow = np.zeros(n_p, dtype=bool)
+        gap_before = np.full(n_p, np.inf)
+        resolved = np.zeros(n_p, dtype=bool)
+        est = np.full(n_p, np.nan)
+        for it in range(max_iter):
+            width, gap = hi - lo, c_hi - c_lo
+            # Une seule pente de paire dans [lo, hi) : c'est la valeur cherchée (calcul exact plus bas)
+            active = (gap > 1) & (width > rtol * np.maximum(np.abs(lo), np.abs(hi)))
+            # Peu de paires dans [lo, hi) : énumérées directement plutôt que par d'autres comptages
+            small = active & ~resolved & (gap <= enumerate_gap)
+            if small.any():
+                value, found = self._bracket_pairs(small, lo, hi, rank_k - c_lo, gap, t, y, prob, lens)
+                est[found] = value[found]
+                resolved |= found
+                active &= ~resolved
+            if not active.any():
+                break
+            # Interpolation sur les comptes (répartition des pentes quasi linéaire dans l'encadrement),
+            # visée légèrement au-delà du rang cherché, d'un côté puis de l'autre, pour que les deux
+            # bornes se resserrent ; bissection là où les deux itérations précédentes n'ont pas divisé
+            # l'écart par 4
+            target = rank_k + 0.5 + (1 if it % 2 == 0 else -1) * np.maximum(gap / 64.0, 0.5)
+            frac = np.clip((target - c_lo) / np.maximum(gap, 1.0), 0.01, 0.99)
+            frac = np.where(slow, 0.5, frac)
+            mid = lo + frac * width
+            c = count(mid, active)
+            below = c <= rank_k
+            lo = np.where(active & below, mid, lo)
+            c_lo = np.where(active & below, c, c_lo)
+            hi = np.where(active & ~below, mid, hi)
+            c_hi = np.where(active & ~below, c, c_hi)
+            slow = active & ~slow & (c_hi - c_lo > gap_before / 4)
+            gap_before = gap
+
+        est = np.where(resolved, est, 0.5 * (lo + hi))
+        single = ~resolved & (c_hi - c_lo == 1)
+        if single.any():
+            est = self._flipped_pair_slope(single, lo, hi, t, y, prob, lens, est)
+        out[live] = est
+        return out
+
+    @classmethod
+    def _bracket_pairs(cls, sel, lo, hi, rank, gap, t, y, prob, lens) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pente de rang rank parmi les paires de pente dans [lo, hi), pour les problèmes sel.
+        Ces paires sont celles qui s'inversent entre les ordres de z = y - s·t en lo et en hi
+        (mêmes z et mêmes ex aequo que _count_below, donc mêmes arrondis aux bornes) ; entre les
+        deux points d'une telle paire (ordre en lo), chaque point s'inverse avec l'un des deux,
+        donc leur écart de position est au plus gap : il suffit de comparer chaque point à ses
+        gap suivants. Résultat retenu si le nombre de paires trouvées vaut gap.
+        """
+        n_p = lens.size
+        keep = np.repeat(sel, lens)
+        t, y, prob = t[keep], y[keep], prob[keep]
+        order = cls._z_order(y - lo[prob] * t, prob, n_p)
+        # _ranks attend des problèmes contigus numérotés 0..k-1 : problèmes de sel renumérotés
+        sub_lens = lens[sel]
+        rank_hi = cls._ranks(y - hi[prob] * t, (np.cumsum(sel) - 1)[prob], np.cumsum(sub_lens) - sub_lens)
+        slopes, owner = [], []
+        for d in range(1, int(gap[sel].max()) + 1):
+            a, b = order[:-d], order[d:]
+            p = prob[a]
+            inside = (prob[b] == p) & (d <= gap[p]) & (rank_hi[b] < rank_hi[a])
+            a, b, p = a[inside], b[inside], p[inside]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                slopes.append((y[b] - y[a]) / (t[b] - t[a]))
+            owner.append(p)
+        slopes, owner = np.concatenate(slopes), np.concatenate(owner)
+        found = np.zeros(n_p, dtype=bool)
+        value = np.full(n_p, np.nan)
+        n_found = np.bincount(owner, minlength=n_p)
+        found[sel] = n_found[sel] == gap[sel]
+        if found.any():
+            srt = slopes[segment_order(slopes, owner, n_p)]
+            start = np.cumsum(n_found) - n_found
+            value[found] = srt[start[found] + rank[found].astype(np.int64)]
+        return value, found
+
+    @staticmethod
+    def _flipped_pair_slope(single, lo, hi, t, y, prob, lens, est) -> np.ndarray:
+        """
+        Pente exacte quand [lo, hi) ne contient qu'une pente de paire : les ordres de z = y - s·t
+        en lo et en hi ne diffèrent que par l'échange de ces deux points, adjacents dans les deux ordres.
+        """
+        keep = np.repeat(single, lens)
+        t, y, prob = t[keep], y[keep], prob[keep]
+        order_lo = np.lexsort((y - lo[prob] * t, prob))   # lexsort stable : ex aequo dans l'ordre du temps
+        order_hi = np.lexsort((y - hi[prob] * t, prob))
+        diff = np.flatnonzero(order_lo != order_hi)
+        out = est.copy()
+        if diff.size == 0:
+            return out
+        # Première position divergente de chaque problème
+        d_prob = prob[order_lo[diff]]
+        first = diff[np.r_[True, d_prob[1:] != d_prob[:-1]]]
+        a, b = order_lo[first], order_lo[np.minimum(first + 1, order_lo.size - 1)]
+        p = prob[a]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (y[b] - y[a]) / (t[b] - t[a])
+        exact = (prob[b] == p) & (slope >= lo[p]) & (slope <= hi[p])
+        out[p[exact]] = slope[exact]
+        return out
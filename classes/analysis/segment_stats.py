@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from classes.analysis.series_store import SeriesStore
+
+SECONDS_PER_UNIT = {"days": 24 * 3600.0, "hours": 3600.0}
+
+
+class SegmentStatsEngine:
+    """
+    Statistiques de segments [start, end) par sommes cumulées sur une série triée.
+
+    On précalcule les préfixes de 1, t, y, t² et t·y : chaque segment se résume
+    ensuite à des différences de préfixes, ce qui donne pour tous les segments
+    d'un coup (sans boucle Python) :
+      - count, mean de la métrique
+      - slope / intercept de la régression linéaire (OLS, équivalent à np.polyfit deg=1)
+    t est exprimé selon time_axis ("days", "hours", sinon rang de l'observation).
+    values peut être une matrice (n × k, ex. une colonne par moteur) : les k séries partagent
+    les mêmes timestamps et sont traitées dans le même passage ; mean / slope / intercept
+    sont alors de forme (segments × k).
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray, time_axis: str = "days"):
+        self.timestamps = np.asarray(timestamps, dtype="datetime64[ns]")
+        y = np.asarray(values, dtype=float)
+        self._ndim = y.ndim
+        self.time_axis = time_axis
+        self._ts_int = self.timestamps.view("int64")
+        self._origin = self._ts_int[0] if y.size > 0 else 0
+        t = self._to_axis(self._ts_int)
+
+        # Centrage (t, y) pour limiter les annulations numériques des préfixes
+        self._y_shift = y.mean(axis=0) if y.shape[0] > 0 else np.zeros(y.shape[1:])
+        self._t_shift = float(t.mean()) if y.shape[0] > 0 else 0.0
+        tc = t - self._t_shift
+        yc = y - self._y_shift
+
+        def prefix(a):
+            out = np.zeros((a.shape[0] + 1,) + a.shape[1:], dtype=float)
+            np.cumsum(a, axis=0, out=out[1:])
+            return out
+
+        self._s_t = prefix(tc)
+        self._s_y = prefix(yc)
+        self._s_tt = prefix(tc * tc)
+        self._s_ty = prefix(self._col(tc) * yc)
+
+    def _col(self, a: np.ndarray) -> np.ndarray:
+        """Grandeur par segment (ou par point) diffusée sur les k séries d'une matrice de valeurs."""
+        return a.reshape(a.shape + (1,) * (self._ndim - 1))
+
+    @classmethod
+    def from_store(cls, store: SeriesStore, tail_number=None, metric: str = None,
+                   time_axis: str = "days") -> "SegmentStatsEngine":
+        t, y = store.arrays(tail_number, metric)
+        return cls(t, y, time_axis=time_axis)
+
+    def _to_axis(self, ts_int: np.ndarray) -> np.ndarray:
+        if self.time_axis in SECONDS_PER_UNIT:
+            return (ts_int - self._origin) / 1e9 / SECONDS_PER_UNIT[self.time_axis]
+        # fallback: indices (rang de l'observation dans la série)
+        return np.arange(ts_int.size, dtype=float)
+
+    def bounds(self, starts, ends):
+        """Indices [i0, i1) de chaque segment [start, end) par searchsorted."""
+        s = pd.to_datetime(np.asarray(starts)).to_numpy(dtype="datetime64[ns]")
+        e = pd.to_datetime(np.asarray(ends)).to_numpy(dtype="datetime64[ns]")
+        i0 = np.searchsorted(self.timestamps, s, side="left")
+        i1 = np.maximum(np.searchsorted(self.timestamps, e, side="left"), i0)
+        return i0, i1
+
+    def compute(self, starts, ends, origins=None, min_points: int = 2) -> Dict[str, np.ndarray]:
+        """
+        Statistiques vectorisées pour des tableaux de bornes (starts, ends).
+        origins (par défaut starts) fixe le t=0 de l'intercept, comme fit_drift_rate.
+        slope/intercept valent NaN si count < min_points ou si l'étendue temporelle est nulle.
+        """
+        i0, i1 = self.bounds(starts, ends)
+        n = self._col((i1 - i0).astype(float))
+
+        s_t = self._col(self._s_t[i1] - self._s_t[i0])
+        s_y = self._s_y[i1] - self._s_y[i0]
+        s_tt = self._col(self._s_tt[i1] - self._s_tt[i0])
+        s_ty = self._s_ty[i1] - self._s_ty[i0]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_t = s_t / n
+            mean_yc = s_y / n
+            sxx = s_tt - s_t * mean_t
+            sxy = s_ty - s_t * mean_yc
+            slope = sxy / sxx
+
+        # Étendue temporelle nulle (tous les points au même instant)
+        has_points = i1 > i0
+        last = np.where(has_points, i1 - 1, i0)
+        if self.time_axis in SECONDS_PER_UNIT:
+            ts_len = self._ts_int.size
+            flat = np.zeros(i0.shape, dtype=bool)
+            if ts_len > 0:
+                first_ts = self._ts_int[np.minimum(i0, ts_len - 1)]
+                last_ts = self._ts_int[np.minimum(last, ts_len - 1)]
+                flat = first_ts == last_ts
+        else:
+            flat = last == i0
+        fit_ok = (n >= max(min_points, 1)) & ~self._col(flat)
+        slope = np.where(fit_ok, slope, np.nan)
+
+        if origins is None:
+            origins = starts
+        if self.time_axis in SECONDS_PER_UNIT:
+            o = pd.to_datetime(np.asarray(origins)).to_numpy(dtype="datetime64[ns]").view("int64")
+            t0 = self._to_axis(o) - self._t_shift
+        else:
+            t0 = i0.astype(float) - self._t_shift
+        t0 = self._col(t0)
+
+        mean = np.where(n > 0, mean_yc + self._y_shift, np.nan)
+        intercept = np.where(fit_ok, mean - slope * (mean_t - t0), np.nan)
+
+        return {
+            "count": (i1 - i0).astype(int),
+            "mean": mean,
+            "slope": slope,
+            "intercept": intercept,
+        }
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+ALL_TAILS = None
+
+
+def to_datetime64_ns(value) -> np.datetime64:
+    """Convertit une date (Timestamp, str, datetime64) en np.datetime64[ns]."""
+    return np.datetime64(pd.Timestamp(value).to_datetime64(), "ns")
+
+
+class SeriesStore:
+    """
+    Stockage des séries APM par tail_number sous forme de tableaux NumPy triés et contigus.
+
+    Pour chaque tail (et pour la flotte entière, clé ALL_TAILS) on conserve :
+      - les timestamps triés (datetime64[ns])
+      - une colonne par métrique (float64, ou float32 si la frame est compacte), alignée sur les timestamps
+    Les séries des tails sont des vues sur un unique tableau trié par (tail, timestamp) ;
+    la série flotte (ALL_TAILS) n'est matérialisée qu'à la première requête sans tail.
+    Les requêtes [start, end) se font par searchsorted en O(log n) et renvoient
+    des vues sur les tableaux, sans copie.
+    """
+
+    def __init__(self,
+                 timestamps: Dict[Hashable, np.ndarray],
+                 values: Dict[Hashable, Dict[str, np.ndarray]],
+                 metrics: Iterable[str],
+                 has_tail: bool,
+                 fleet_order: Optional[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]] = None):
+        self._timestamps = timestamps
+        self._values = values
+        self.metrics = list(metrics)
+        self.has_tail = has_tail
+        # (codes des tails dans l'ordre chronologique, tampon trié par tail, métriques du tampon)
+        self._fleet_order = fleet_order
+        self._empty_t = np.empty(0, dtype="datetime64[ns]")
+        self._empty_y = np.empty(0, dtype=float)
+
+    @classmethod
+    def from_frame(cls,
+                   df: pd.DataFrame,
+                   metrics: Iterable[str],
+                   ts_col: str = "timestamp",
+                   tail_col: str = "tail_number") -> "SeriesStore":
+        """
+        Construit le store depuis un DataFrame APM. Les lignes sans timestamp ou
+        sans valeur pour l'une des métriques sont écartées.
+        """
+        metrics = [m for m in metrics if m in df.columns]
+        ts = pd.to_datetime(df[ts_col], errors="coerce")
+        t_all = ts.to_numpy(dtype="datetime64[ns]")
+        keep = ~np.isnat(t_all)
+        cols = {}
+        for m in metrics:
+            y = pd.to_numeric(df[m], errors="coerce").to_numpy()
+            if y.dtype.kind != "f":
+                y = y.astype(float)
+            keep &= ~np.isnan(y)
+            cols[m] = y
+
+        has_tail = tail_col in df.columns
+        tails = df[tail_col].to_numpy(dtype=object)[keep] if has_tail else None
+        t_all = t_all[keep]
+        cols = {m: y[keep] for m, y in cols.items()}
+
+        timestamps: Dict[Hashable, np.ndarray] = {}
+        values: Dict[Hashable, Dict[str, np.ndarray]] = {}
+
+        order = np.argsort(t_all, kind="mergesort")
+        if not has_tail:
+            timestamps[ALL_TAILS] = np.ascontiguousarray(t_all[order])
+            values[ALL_TAILS] = {m: np.ascontiguousarray(y[order]) for m, y in cols.items()}
+            return cls(timestamps, values, metrics, has_tail)
+
+        # Un seul tampon trié par (tail, timestamp) : tri stable de l'ordre chronologique par code de tail
+        codes, uniques = pd.factorize(tails[order], use_na_sentinel=True)
+        codes = codes.astype(np.min_scalar_type(-max(len(uniques), 1)))
+        by_tail = order[np.argsort(codes, kind="stable")]
+        t_buf = t_all[by_tail]
+        y_buf = {m: y[by_tail] for m, y in cols.items()}
+        bounds = np.searchsorted(np.sort(codes, kind="stable"), np.arange(len(uniques) + 1))
+        for code, tail in enumerate(uniques):
+            i0, i1 = bounds[code], bounds[code + 1]
+            timestamps[tail] = t_buf[i0:i1]
+            values[tail] = {m: y[i0:i1] for m, y in y_buf.items()}
+
+        return cls(timestamps, values, metrics, has_tail, fleet_order=(codes, t_buf, y_buf))
+
+    def _materialize_fleet(self) -> None:
+        """Série flotte dans l'ordre chronologique, reconstruite depuis le tampon trié par tail."""
+        codes, t_buf, y_buf = self._fleet_order
+        pos = np.empty(codes.size, dtype=np.int64)
+        pos[np.argsort(codes, kind="stable")] = np.arange(codes.size)
+        self._timestamps[ALL_TAILS] = t_buf[pos]
+        self._values[ALL_TAILS] = {m: y[pos] for m, y in y_buf.items()}
+
+    def tails(self):
+        return [k for k in self._timestamps if k is not ALL_TAILS]
+
+    def _key(self, tail_number) -> Optional[Hashable]:
+        # Sans colonne tail_number côté APM, le filtre est ignoré (comportement de slice_series)
+        if tail_number is None or not self.has_tail:
+            return ALL_TAILS
+        return tail_number
+
+    def arrays(self, tail_number=None, metric: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Tableaux complets (timestamps, valeurs) d'un tail, vides si tail inconnu."""
+        key = self._key(tail_number)
+        if key is ALL_TAILS and key not in self._timestamps and self._fleet_order is not None:
+            self._materialize_fleet()
+        if key not in self._timestamps:
+            return self._empty_t, self._empty_y
+        metric = metric or self.metrics[0]
+        return self._timestamps[key], self._values[key][metric]
+
+    def bounds(self, start, end, tail_number=None) -> Tuple[int, int]:
+        """Indices [i0, i1) couvrant l'intervalle [start, end) pour le tail demandé."""
+        t, _ = self.arrays(tail_number)
+        i0 = int(np.searchsorted(t, to_datetime64_ns(start), side="left"))
+        i1 = int(np.searchsorted(t, to_datetime64_ns(end), side="left"))
+        return i0, max(i0, i1)
+
+    def slice(self, start, end, metric: str, tail_number=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Vues (timestamps, valeurs) sur [start, end), sans copie."""
+        t, y = self.arrays(tail_number, metric)
+        if t.size == 0:
+            return t, y
+        i0, i1 = self.bounds(start, end, tail_number)
+        return t[i0:i1], y[i0:i1]
+
+    def slice_frame(self, start, end, metric: str, tail_number=None) -> pd.DataFrame:
+        """Même segment que slice(), au format DataFrame de slice_series."""
+        t, y = self.slice(start, end, metric, tail_number)
+        return pd.DataFrame({"timestamp": t, metric: y})
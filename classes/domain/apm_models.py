@@ -1,19 +1,67 @@
+import re
+from typing import List, Sequence
+
+import numpy as np
 import pandas as pd
 
+from classes.analysis.segment_stats import SegmentStatsEngine
+from classes.analysis.series_store import SeriesStore
+from classes.processing.feature_engineering import FeatureEngineer, to_window, window_label
+
+# Colonnes par moteur après columns_mapping ({i} = numéro du moteur, 1 = extérieur gauche)
+ENGINE_COLUMNS = {"ff_dev": "ff_dev_eng{i}", "book_ff": "book_ff_eng{i}", "fn_delta": "fn_delta_eng{i}"}
+# Préfixe du nom d'événement → moteurs touchés (biréacteur : 1 = gauche, 2 = droit)
+DEFAULT_EVENT_ENGINES = {"LH": [1], "RH": [2], "Dual": [1, 2]}
+
+
+def engine_columns(settings: dict) -> List[str]:
+    """Toutes les colonnes moteur attendues (max_engines × métriques), pour le nettoyage numérique."""
+    cfg = settings.get("apm", {}).get("engines", {})
+    if not cfg.get("enabled", False):
+        return []
+    templates = cfg.get("columns", ENGINE_COLUMNS)
+    return [tpl.format(i=i) for tpl in templates.values() for i in range(1, int(cfg.get("max_engines", 4)) + 1)]
+
+
 class APMModels:
+    """
+    Constantes APM et analyse par moteur.
+
+    Les métriques par moteur (%FF Dev, Book FF, Fn/delta Eng1..4) sont lues comme une matrice
+    (n_records × n_engines) : déviation, baseline roulante et dérive de tous les moteurs sortent
+    du même passage vectorisé (sommes cumulées partagées), sans boucle par moteur.
+    Les événements côté moteur (LH / RH / Dual …, apm.engines.event_engines) sont attribués
+    aux moteurs qu'ils touchent.
+    """
+
     def __init__(self, settings: dict):
         self.settings = settings
-        self.basic_pf = settings["apm"]["basic_perf_factor"]
-        self.slope = settings["apm"]["perf_to_fuel_factor_linear"]["slope"]
-        self.intercept = settings["apm"]["perf_to_fuel_factor_linear"]["intercept"]
+        apm = settings.get("apm", {})
+        linear = apm.get("perf_to_fuel_factor_linear", {})
+        self.basic_pf = apm.get("basic_perf_factor")
+        self.slope = linear.get("slope")
+        self.intercept = linear.get("intercept")
+
+        cfg = apm.get("engines", {})
+        self.engines_enabled = bool(cfg.get("enabled", False))
+        self.max_engines = int(cfg.get("max_engines", 4))
+        self.n_engines = cfg.get("n_engines")
+        self.templates = cfg.get("columns", ENGINE_COLUMNS)
+        self.metric = cfg.get("metric", "ff_dev")
+        self.baseline_window = to_window(cfg.get("baseline_window", "30D"))
+        self.baseline_min_periods = int(cfg.get("baseline_min_periods", 5))
+        event_engines = cfg.get("event_engines", DEFAULT_EVENT_ENGINES)
+        # Premier mot du nom d'événement, insensible à la casse ("LH engine + Airframe wash" → LH)
+        self.event_engines = {k.lower(): [int(e) for e in v] for k, v in event_engines.items()}
 
     def apply_constants(self, df: pd.DataFrame) -> pd.DataFrame:
-        df["basic_perf_factor"] = self.basic_pf
+        if self.basic_pf is not None:
+            df["basic_perf_factor"] = self.basic_pf
         return df
 
     def perf_to_fuel_factor(self, df: pd.DataFrame, perf_col="perf_factor", out_col="fuel_factor") -> pd.DataFrame:
-        if perf_col in df.columns:
-            df[out_col] = df[perf_col] * self.slope + self.intercept
+        if perf_col in df.columns and self.slope is not None:
+            df[out_col] = df[perf_col] * self.slope + (self.intercept or 0.0)
         return df
 
     def expected_fuel(self, df: pd.DataFrame, base_fuel_col="fuel_flow", factor_col="fuel_factor", out_col="fuel_expected_corr") -> pd.DataFrame:
@@ -21,3 +69,160 @@ class APMModels:
             df[out_col] = df[base_fuel_col] * (1.0 + df[factor_col])
         return df
 
+    # -- matrices moteur ----------------------------------------------------
+
+    def engine_column_names(self, metric: str = None, engines: Sequence[int] = None) -> List[str]:
+        template = self.templates[metric or self.metric]
+        return [template.format(i=i) for i in (engines or range(1, self.max_engines + 1))]
+
+    def active_engines(self, df: pd.DataFrame, metric: str = None) -> List[int]:
+        """Moteurs présents : apm.engines.n_engines, sinon ceux dont la métrique n'est pas toujours nulle / vide."""
+        if self.n_engines:
+            return list(range(1, int(self.n_engines) + 1))
+        engines = [i for i, c in zip(range(1, self.max_engines + 1), self.engine_column_names(metric))
+                   if c in df.columns]
+        if not engines:
+            return []
+        m = self.engine_matrix(df, metric, engines)
+        used = (np.isfinite(m) & (m != 0)).any(axis=0)
+        return [e for e, u in zip(engines, used) if u]
+
+    def engine_matrix(self, df: pd.DataFrame, metric: str = None, engines: Sequence[int] = None) -> np.ndarray:
+        """Matrice float64 (n_records × n_engines) de la métrique ; colonne absente → NaN."""
+        cols = self.engine_column_names(metric, engines)
+        out = np.full((df.shape[0], len(cols)), np.nan)
+        for j, c in enumerate(cols):
+            if c in df.columns:
+                out[:, j] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        return out
+
+    def engines_touched(self, event_names, engines: Sequence[int]) -> np.ndarray:
+        """Matrice booléenne (n_events × n_engines) : moteurs touchés par chaque événement."""
+        codes, uniques = pd.factorize(pd.Series(event_names).astype(str))
+        table = np.zeros((len(uniques) + 1, len(engines)), dtype=bool)   # dernière ligne : nom manquant
+        position = {e: j for j, e in enumerate(engines)}
+        for u, name in enumerate(uniques):
+            words = re.findall(r"[A-Za-z0-9]+", name)
+            for e in self.event_engines.get(words[0].lower(), []) if words else []:
+                if e in position:
+                    table[u, position[e]] = True
+        return table[codes]
+
+    # -- analyse par moteur -------------------------------------------------
+
+    def engine_baseline(self, df: pd.DataFrame, metric: str = None) -> pd.DataFrame:
+        """
+        Ajoute {colonne moteur}_baseline_{window} pour chaque moteur actif : moyenne roulante sur
+        (t - baseline_window, t] par tail, tous les moteurs dans la même passe (FeatureEngineer).
+        """
+        engines = self.active_engines(df, metric)
+        if not engines or "timestamp" not in df.columns:
+            return df
+        cols = self.engine_column_names(metric, engines)
+        out = FeatureEngineer().rolling_mean(df, self.engine_matrix(df, metric, engines), window=self.baseline_window,
+                                             min_periods=self.baseline_min_periods)
+        label = window_label(self.baseline_window)
+        return df.assign(**{f"{c}_baseline_{label}": out[:, j] for j, c in enumerate(cols)})
+
+    def engine_interval_metrics(self, df_txt: pd.DataFrame, non_main: pd.DataFrame) -> pd.DataFrame:
+        """
+        Pour chaque intervalle de compute_non_maintenance_metrics et chaque moteur actif :
+        baseline_before, mean_after (fenêtre de stabilisation), impact_observed
+        (baseline_before - mean_after, > 0 = amélioration), drift_rate (OLS) et touched
+        (l'événement concerne ce moteur). Mêmes fenêtres et mêmes règles que l'analyse globale.
+        """
+        columns = ["event_idx", "event_date", "next_event_date", "event_name", "tail_number", "engine",
+                   "touched", "metric", "baseline_before", "mean_after", "impact_observed", "drift_rate",
+                   "n_points_prev", "n_points_curr", "valid"]
+        engines = self.active_engines(df_txt) if self.engines_enabled else []
+        if not engines or non_main is None or non_main.empty:
+            return pd.DataFrame(columns=columns)
+
+        impact = self.settings["impact"]
+        time_axis = impact["time_axis"]
+        window_days = int(impact["stabilization_window_days"])
+        min_points = int(impact["min_points_per_interval"])
+        require_prev = bool(impact["require_prev_interval"])
+        fallback_days = int(impact["fallback_baseline_days"])
+        min_interval = pd.Timedelta(hours=float(impact.get("drift", {}).get("min_interval_hours", 0)))
+
+        cols = self.engine_column_names(engines=engines)
+        # Lignes où tous les moteurs actifs sont renseignés, triées par (tail, timestamp)
+        store = SeriesStore.from_frame(df_txt, metrics=cols)
+
+        event_date = pd.to_datetime(non_main["event_date"]).reset_index(drop=True)
+        next_event_date = pd.to_datetime(non_main["next_event_date"]).reset_index(drop=True)
+        prev_raw = pd.to_datetime(non_main["prev_event_date"]).reset_index(drop=True)
+        use_fallback = prev_raw.isna().to_numpy()
+        prev_event_date = prev_raw.where(~use_fallback, event_date - pd.Timedelta(days=fallback_days))
+        stab_end = event_date + pd.Timedelta(days=window_days)
+
+        n, k = non_main.shape[0], len(engines)
+        baseline = np.full((n, k), np.nan)
+        mean_after = np.full((n, k), np.nan)
+        drift_rate = np.full((n, k), np.nan)
+        n_prev = np.zeros(n, dtype=int)
+        n_curr = np.zeros(n, dtype=int)
+
+        tails = non_main["tail_number"].to_numpy(dtype=object) if "tail_number" in non_main.columns \
+            else np.full(n, None, dtype=object)
+        codes, uniques = pd.factorize(pd.Series(tails), use_na_sentinel=False)
+        for code, tail_num in enumerate(uniques):
+            idx = np.flatnonzero(codes == code)
+            t, _ = store.arrays(tail_num)
+            values = np.column_stack([store.arrays(tail_num, c)[1] for c in cols])
+            engine = SegmentStatsEngine(t, values, time_axis=time_axis)
+            ev = event_date.iloc[idx]
+
+            prev_stats = engine.compute(prev_event_date.iloc[idx], ev)
+            stab_stats = engine.compute(ev, stab_end.iloc[idx])
+            curr_stats = engine.compute(ev, next_event_date.iloc[idx], min_points=min_points)
+
+            baseline[idx] = prev_stats["mean"]
+            n_prev[idx] = prev_stats["count"]
+            mean_after[idx] = stab_stats["mean"]
+            drift_rate[idx] = curr_stats["slope"]
+            n_curr[idx] = curr_stats["count"]
+
+        drift_rate[((next_event_date - event_date) < min_interval).to_numpy()] = np.nan
+        valid_interval = (n_prev >= (1 if not require_prev else min_points)) & (n_curr >= min_points) \
+            & (~use_fallback | (not require_prev))
+        valid = valid_interval[:, None] & ~np.isnan(baseline) & ~np.isnan(mean_after)
+        touched = self.engines_touched(non_main["event_name"], engines)
+
+        # Format long : une ligne par (intervalle, moteur)
+        rep = lambda a: np.repeat(np.asarray(a), k)   # noqa: E731
+        return pd.DataFrame({
+            "event_idx": rep(non_main["event_idx"].astype(int)),
+            "event_date": rep(event_date),
+            "next_event_date": rep(next_event_date),
+            "event_name": rep(non_main["event_name"].astype(str)),
+            "tail_number": rep(tails),
+            "engine": np.tile(np.asarray(engines), n),
+            "touched": touched.ravel(),
+            "metric": self.metric,
+            "baseline_before": baseline.ravel(),
+            "mean_after": mean_after.ravel(),
+            "impact_observed": (baseline - mean_after).ravel(),
+            "drift_rate": drift_rate.ravel(),
+            "n_points_prev": rep(n_prev),
+            "n_points_curr": rep(n_curr),
+            "valid": valid.ravel(),
+        }, columns=columns)
+
+    @staticmethod
+    def summarize_engine_impacts(engine_table: pd.DataFrame) -> pd.DataFrame:
+        """Impact moyen par (type d'événement, moteur) sur les intervalles valides."""
+        columns = ["event_name", "engine", "touched", "impact_mean", "impact_std", "drift_rate_mean", "n"]
+        valid = engine_table[engine_table["valid"].astype(bool)] if not engine_table.empty else engine_table
+        if valid.empty:
+            return pd.DataFrame(columns=columns)
+        grouped = valid.groupby(["event_name", "engine"], sort=True)
+        out = pd.DataFrame({
+            "touched": grouped["touched"].any(),
+            "impact_mean": grouped["impact_observed"].mean(),
+            "impact_std": grouped["impact_observed"].std(ddof=1),
+            "drift_rate_mean": grouped["drift_rate"].mean(),
+            "n": grouped.size().astype(int),
+        })
+        return out.reset_index()[columns]
@@ -6,6 +6,7 @@ class MaintenanceType:
     cost: float
     downtime_hours: float
     expected_delta_pf: float
+    benefit_days: float = None
 
 class MaintenanceCatalog:
     def __init__(self):
@@ -28,7 +29,8 @@ class MaintenanceCatalog:
                 name=item["name"],
                 cost=item["cost"],
                 downtime_hours=item["downtime_hours"],
-                expected_delta_pf=item["expected_delta_pf"]
+                expected_delta_pf=item["expected_delta_pf"],
+                benefit_days=item.get("benefit_days")
             ))
         return cat
 
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:  # dépendance optionnelle : Parquet si pyarrow est installé, sinon colonnes .npy
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Empreinte du contenu d'un fichier (blake2b), lue par blocs."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FrameCache:
+    """
+    Cache disque de DataFrames adressé par le contenu.
+
+    La clé combine taille, mtime et empreinte du fichier source avec les paramètres
+    de lecture (ex. txt_read, columns_mapping) : toute modification de la source ou
+    du mapping produit une nouvelle clé, l'ancienne entrée n'est simplement plus lue.
+    Les frames sont stockées en format colonnaire binaire :
+      - "parquet" si pyarrow est disponible
+      - "npy" sinon (un fichier .npy par colonne + manifest.json)
+    L'empreinte d'un fichier est mémorisée tant que sa taille et son mtime ne changent pas,
+    pour que les runs à chaud ne relisent pas la source.
+    """
+
+    def __init__(self, cache_dir, fmt: str = "auto"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if fmt == "auto":
+            fmt = "parquet" if HAS_PYARROW else "npy"
+        if fmt == "parquet" and not HAS_PYARROW:
+            logger.warning("pyarrow not installed, cache falls back to npy columns")
+            fmt = "npy"
+        self.fmt = fmt
+        self._digests_path = self.cache_dir / "digests.json"
+
+    # -- clés ---------------------------------------------------------------
+
+    def _known_digests(self) -> dict:
+        if self._digests_path.exists():
+            try:
+                with open(self._digests_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return {}
+        return {}
+
+    def source_signature(self, filepath: str) -> dict:
+        """Taille, mtime et empreinte du contenu d'un fichier source."""
+        path = str(Path(filepath).resolve())
+        st = os.stat(path)
+        known = self._known_digests()
+        entry = known.get(path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            digest = entry["digest"]
+        else:
+            digest = file_digest(path)
+            known[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}
+            self._write_json_atomic(self._digests_path, known)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}
+
+    def key_for(self, filepath: str, **params) -> str:
+        payload = {"source": self.source_signature(filepath), "params": params}
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    # -- lecture / écriture --------------------------------------------------
+
+    def _entry_path(self, namespace: str, key: str) -> Path:
+        suffix = ".parquet" if self.fmt == "parquet" else ".npycols"
+        return self.cache_dir / f"{namespace}-{key}{suffix}"
+
+    def load(self, namespace: str, key: str) -> Optional[pd.DataFrame]:
+        path = self._entry_path(namespace, key)
+        if not path.exists():
+            return None
+        try:
+            if self.fmt == "parquet":
+                return pd.read_parquet(path)
+            return read_npy_columns(path)
+        except Exception as e:
+            logger.warning("Cache entry %s unreadable (%s), ignoring it", path, e)
+            return None
+
+    def store(self, namespace: str, key: str, df: pd.DataFrame) -> Path:
+        path = self._entry_path(namespace, key)
+        tmp = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-"))
+        try:
+            if self.fmt == "parquet":
+                tmp_file = tmp / path.name
+                df.to_parquet(tmp_file, index=False)
+                os.replace(tmp_file, path)
+            else:
+                write_npy_columns(tmp, df)
+                if path.exists():
+                    shutil.rmtree(path)
+                os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+        self._prune(namespace, keep=path)
+        return path
+
+    def _prune(self, namespace: str, keep: Path) -> None:
+        # Une seule entrée par namespace : les clés périmées sont supprimées
+        for old in self.cache_dir.glob(f"{namespace}-*"):
+            if old != keep:
+                if old.is_dir():
+                    shutil.rmtree(old, ignore_errors=True)
+                else:
+                    old.unlink(missing_ok=True)
+
+    @staticmethod
+    def _write_json_atomic(path: Path, payload: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp, path)
+
+
+def write_npy_columns(folder: Path, df: pd.DataFrame) -> None:
+    """Écrit une frame dans un dossier : un fichier .npy par colonne + manifest.json."""
+    manifest = []
+    for i, col in enumerate(df.columns):
+        s = df.iloc[:, i]  # par position : noms de colonnes éventuellement dupliqués
+        entry = {"name": col, "file": f"c{i}.npy", "dtype": str(s.dtype)}
+        if pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_numeric_dtype(s) \
+                or pd.api.types.is_bool_dtype(s):
+            np.save(folder / entry["file"], s.to_numpy())
+            entry["kind"] = "array"
+        elif pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+            mask = s.isna().to_numpy()
+            values = np.where(mask, "", s.astype(object).where(~mask, "")).astype(str)
+            np.save(folder / entry["file"], values)
+            np.save(folder / f"m{i}.npy", mask)
+            entry["kind"] = "string"
+            entry["mask"] = f"m{i}.npy"
+        else:
+            np.save(folder / entry["file"], s.to_numpy(dtype=object), allow_pickle=True)
+            entry["kind"] = "object"
+        manifest.append(entry)
+    with open(folder / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"columns": manifest}, f, ensure_ascii=False)
+
+
+def read_npy_columns(folder: Path) -> pd.DataFrame:
+    """Relit une frame écrite par write_npy_columns."""
+    with open(folder / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)["columns"]
+    data = {}
+    for i, entry in enumerate(manifest):
+        if entry["kind"] == "array":
+            data[i] = np.load(folder / entry["file"])
+        elif entry["kind"] == "string":
+            values = np.load(folder / entry["file"]).astype(object)
+            mask = np.load(folder / entry["mask"])
+            values[mask] = np.nan
+            data[i] = pd.Series(values, dtype=entry["dtype"])
+        else:
+            values = np.load(folder / entry["file"], allow_pickle=True)
+            if entry["dtype"] == "category":
+                values = pd.Categorical(values)
+            else:
+                values = pd.Series(values, dtype=object)
+            data[i] = values
+    df = pd.DataFrame(data, columns=range(len(manifest)))
+    df.columns = [e["name"] for e in manifest]
+    return df
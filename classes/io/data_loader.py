@@ -1,5 +1,17 @@
+import io
+import logging
+import re
+import numpy as np
 import pandas as pd
 
+from classes.io.cache import FrameCache
+from classes.processing.cleaning import DataCleaner
+from classes.processing.timestamp_parser import TimestampParser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATE_FORMATS = ("%Y/%m/%d", "%Y/%d/%m")
+
 def detect_separator(sample_path: str, possible_separators):
     """Détecte le séparateur probable en lisant les premières lignes du fichier TXT."""
     with open(sample_path, "r", encoding="utf-8", errors="ignore") as f:
@@ -10,22 +22,8 @@ def detect_separator(sample_path: str, possible_separators):
     return ","  # défaut
 
 
-def load_events(filepath: str, sheet_priority: list, ignore_sheets: list = None) -> pd.DataFrame:
-    """Charge les événements depuis l’Excel CMA-FORM-FOE-10."""
-    xls = pd.ExcelFile(filepath)
-    available = xls.sheet_names
-
-    ignore_sheets = ignore_sheets or []
-    target_sheet = None
-    for s in sheet_priority:
-        if s in available and s not in ignore_sheets:
-            target_sheet = s
-            break
-    if target_sheet is None:
-        raise ValueError(f"Aucune feuille cible trouvée parmi {sheet_priority}, disponibles={available}")
-
-    df = pd.read_excel(filepath, sheet_name=target_sheet)
-
+def _normalize_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Renomme les colonnes usuelles (date, event, remarks, update_flag) et trie par date."""
     rename_map = {}
     for col in df.columns:
         lc = str(col).strip().lower()
@@ -45,11 +43,99 @@ def load_events(filepath: str, sheet_priority: list, ignore_sheets: list = None)
         df["event"] = ""
 
     df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"]).copy()
+    df = df.dropna(subset=["date"])
     df = df.sort_values("date").reset_index(drop=True)
     return df
 
 
+def load_events(filepath: str, sheet_priority: list, ignore_sheets: list = None) -> pd.DataFrame:
+    """Charge les événements depuis l’Excel CMA-FORM-FOE-10."""
+    xls = pd.ExcelFile(filepath)
+    available = xls.sheet_names
+
+    ignore_sheets = ignore_sheets or []
+    target_sheet = None
+    for s in sheet_priority:
+        if s in available and s not in ignore_sheets:
+            target_sheet = s
+            break
+    if target_sheet is None:
+        raise ValueError(f"Aucune feuille cible trouvée parmi {sheet_priority}, disponibles={available}")
+
+    # Réutilise le classeur déjà ouvert plutôt que de le parser une seconde fois
+    df = xls.parse(sheet_name=target_sheet)
+    return _normalize_events(df)
+
+
+def _sheet_to_frame(ws) -> pd.DataFrame:
+    """Convertit une feuille openpyxl (read-only) en DataFrame, entête en première ligne."""
+    ws.reset_dimensions()
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+    data = [r for r in rows if any(v is not None for v in r)]
+    width = len(columns)
+    data = [tuple(r[:width]) + (None,) * (width - len(r)) for r in data]
+    df = pd.DataFrame(data, columns=columns)
+    # Cellules vides openpyxl (None) → NaN, puis typage comme read_excel
+    return df.where(df.notna(), np.nan).infer_objects()
+
+
+def load_events_all_sheets(filepath: str,
+                           tail_sheet_pattern: str = r"^F[A-Z]{4}$",
+                           ignore_sheets: list = None,
+                           cache_dir: str = None,
+                           cache_format: str = "auto") -> pd.DataFrame:
+    """
+    Charge les événements de toutes les feuilles avion (FHMRA, FHMRB, ...) en un seul
+    passage sur le classeur (openpyxl en lecture seule) et renvoie une table longue
+    avec tail_number = nom de la feuille. Le résultat est mis en cache (clé : taille,
+    mtime et empreinte du classeur + paramètres).
+    """
+    ignore_sheets = list(ignore_sheets or [])
+    cache = None
+    if cache_dir is not None:
+        cache = FrameCache(cache_dir, fmt=cache_format)
+        key = cache.key_for(filepath, tail_sheet_pattern=tail_sheet_pattern, ignore_sheets=ignore_sheets)
+        cached = cache.load("events", key)
+        if cached is not None:
+            logger.info("Events loaded from cache (%d rows)", cached.shape[0])
+            return cached
+
+    from openpyxl import load_workbook
+
+    pattern = re.compile(tail_sheet_pattern)
+    frames = []
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for name in wb.sheetnames:
+            if not pattern.match(name) or name in ignore_sheets:
+                continue
+            df = _sheet_to_frame(wb[name])
+            try:
+                df = _normalize_events(df)
+            except ValueError:
+                logger.warning("Sheet %s has no 'date' column, skipped", name)
+                continue
+            df["tail_number"] = name
+            frames.append(df)
+    finally:
+        wb.close()
+
+    if not frames:
+        raise ValueError(f"Aucune feuille avion trouvée (motif {tail_sheet_pattern}) dans {filepath}")
+
+    events = pd.concat(frames, ignore_index=True, sort=False)
+    events = events.sort_values(["date", "tail_number"], kind="mergesort").reset_index(drop=True)
+    logger.info("Events loaded from %d sheets: %s", len(frames), sorted(events["tail_number"].unique()))
+
+    if cache is not None:
+        cache.store("events", key, events)
+    return events
+
+
 def parse_recorded_date(val):
     """Essaye plusieurs formats pour parser les dates du TXT."""
     if pd.isna(val):
@@ -65,20 +151,19 @@ def parse_recorded_date(val):
     return pd.NaT
 
 
-def load_txt_series(filepath: str, txt_read: dict, columns_mapping: dict) -> pd.DataFrame:
-    """Charge le TXT avec mapping et construit timestamp, sans debug prints."""
-    encoding = txt_read.get("encoding", "utf-8")
-    fallback = txt_read.get("fallback_encoding", "latin-1")
-    skip_rows = int(txt_read.get("skip_rows", 5))
-    possible_separators = txt_read.get("possible_separators", [",", ";", "\t", "|"])
-
-    sep = detect_separator(filepath, possible_separators)
-
+def _read_txt(src, sep: str, skip_rows: int, txt_read: dict, dtype=None) -> pd.DataFrame:
+    """read_csv du TXT avec repli sur fallback_encoding (src : chemin ou buffer binaire)."""
     try:
-        df = pd.read_csv(filepath, sep=sep, skiprows=skip_rows, encoding=encoding)
+        return pd.read_csv(src, sep=sep, skiprows=skip_rows, encoding=txt_read.get("encoding", "utf-8"), dtype=dtype)
     except UnicodeDecodeError:
-        df = pd.read_csv(filepath, sep=sep, skiprows=skip_rows, encoding=fallback)
+        if hasattr(src, "seek"):
+            src.seek(0)
+        return pd.read_csv(src, sep=sep, skiprows=skip_rows, encoding=txt_read.get("fallback_encoding", "latin-1"),
+                           dtype=dtype)
+
 
+def _finish_txt(df: pd.DataFrame, txt_read: dict, columns_mapping: dict) -> pd.DataFrame:
+    """Mapping des colonnes, timestamp, fuel_flow numérique, lignes incomplètes retirées, tri."""
     # Appliquer le mapping fourni
     txt_map = columns_mapping.get("txt", {})
     for src, dst in txt_map.items():
@@ -87,23 +172,171 @@ def load_txt_series(filepath: str, txt_read: dict, columns_mapping: dict) -> pd.
 
     if "recorded_date" not in df.columns:
         raise ValueError("Colonne 'recorded_date' manquante après mapping.")
+    if "fuel_flow" not in df.columns:
+        raise ValueError("Colonne 'fuel_flow' manquante après mapping.")
+
+    df = _build_txt_timestamps(df, date_formats=txt_read.get("date_formats", DEFAULT_DATE_FORMATS))
+
+    # Forcer fuel_flow en numérique
+    df["fuel_flow"] = pd.to_numeric(df["fuel_flow"], errors="coerce")
+
+    df = df.dropna(subset=["timestamp", "fuel_flow"])
+    df = df.sort_values("timestamp").reset_index(drop=True)
+    return df
 
-    df["recorded_date"] = df["recorded_date"].apply(parse_recorded_date)
+
+def load_txt_series(filepath: str, txt_read: dict, columns_mapping: dict) -> pd.DataFrame:
+    """Charge le TXT avec mapping et construit timestamp, sans debug prints."""
+    skip_rows = int(txt_read.get("skip_rows", 5))
+    possible_separators = txt_read.get("possible_separators", [",", ";", "\t", "|"])
+
+    sep = detect_separator(filepath, possible_separators)
+    df = _read_txt(filepath, sep, skip_rows, txt_read)
+    return _finish_txt(df, txt_read, columns_mapping)
+
+
+def load_txt_appended(filepath: str, txt_read: dict, columns_mapping: dict, offset: int = 0,
+                      as_text: bool = False):
+    """
+    Lignes du TXT situées après offset (en octets), parsées comme load_txt_series : seuls les
+    octets nouveaux sont lus, l'en-tête (skip_rows lignes + noms de colonnes) est repris du début
+    du fichier. Renvoie (frame, fin), fin étant l'offset qui suit la dernière ligne complète :
+    une ligne en cours d'écriture sera relue au run suivant.
+    as_text lit toutes les colonnes en texte (types à aligner sur les lignes déjà ingérées,
+    l'inférence de read_csv sur quelques lignes pouvant différer de celle du fichier entier).
+    """
+    skip_rows = int(txt_read.get("skip_rows", 5))
+    possible_separators = txt_read.get("possible_separators", [",", ";", "\t", "|"])
+
+    sep = detect_separator(filepath, possible_separators)
+    with open(filepath, "rb") as f:
+        header = b"".join(f.readline() for _ in range(skip_rows + 1))
+        start = max(int(offset), len(header))
+        f.seek(start)
+        data = f.read()
+    data = data[:data.rfind(b"\n") + 1]
+    end = start + len(data)
+    if not data.strip():
+        return pd.DataFrame(), end
+
+    df = _read_txt(io.BytesIO(header + data), sep, skip_rows, txt_read, dtype=str if as_text else None)
+    return _finish_txt(df, txt_read, columns_mapping), end
+
+
+def _build_txt_timestamps(df: pd.DataFrame, date_formats=DEFAULT_DATE_FORMATS) -> pd.DataFrame:
+    """Parse recorded_date (une fois par date distincte) et construit timestamp = date + time."""
+    parser = TimestampParser(date_formats=date_formats)
+    df["recorded_date"] = parser.parse_dates(df["recorded_date"])
 
     if "time" in df.columns and df["time"].notna().any():
-        df["timestamp"] = pd.to_datetime(
-            df["recorded_date"].dt.strftime("%Y-%m-%d") + " " + df["time"].astype(str),
-            errors="coerce"
-        )
+        df["timestamp"] = parser.combine(df["recorded_date"], df["time"])
     else:
         df["timestamp"] = df["recorded_date"]
+    return df
 
-    if "fuel_flow" not in df.columns:
-        raise ValueError("Colonne 'fuel_flow' manquante après mapping.")
 
-    # Forcer fuel_flow en numérique
-    df["fuel_flow"] = pd.to_numeric(df["fuel_flow"], errors="coerce")
+def load_txt_series_streaming(filepath: str, txt_read: dict, columns_mapping: dict,
+                              chunksize: int = 250_000) -> pd.DataFrame:
+    """
+    Ingestion par blocs pour les gros exports APM : seules les colonnes de
+    columns_mapping["txt"] sont lues (usecols, lues en texte), et chaque bloc est
+    parsé (dates, timestamp), nettoyé (DataCleaner.clean_numeric_columns) et
+    filtré (NaN) dès sa lecture. La mémoire crête reste de l'ordre d'un bloc
+    plus la sortie, stockée en colonnes compactes (float64, catégories).
+    """
+    encoding = txt_read.get("encoding", "utf-8")
+    fallback = txt_read.get("fallback_encoding", "latin-1")
+    skip_rows = int(txt_read.get("skip_rows", 5))
+    possible_separators = txt_read.get("possible_separators", [",", ";", "\t", "|"])
+    txt_map = columns_mapping.get("txt", {})
+    date_formats = txt_read.get("date_formats", DEFAULT_DATE_FORMATS)
 
-    df = df.dropna(subset=["timestamp", "fuel_flow"]).copy()
-    df = df.sort_values("timestamp").reset_index(drop=True)
+    sep = detect_separator(filepath, possible_separators)
+
+    def read_chunks(enc):
+        header = pd.read_csv(filepath, sep=sep, skiprows=skip_rows, encoding=enc, nrows=0).columns
+        usecols = [c for c in header if c in txt_map]
+        if not usecols:
+            raise ValueError("Aucune colonne de columns_mapping['txt'] trouvée dans le TXT.")
+        reader = pd.read_csv(
+            filepath, sep=sep, skiprows=skip_rows, encoding=enc,
+            usecols=usecols, dtype={c: str for c in usecols}, chunksize=chunksize
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk
+
+    cleaner = DataCleaner()
+    numeric_extra = ("mach", "oat", "altitude")
+
+    def process(chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.rename(columns={src: dst for src, dst in txt_map.items() if src in chunk.columns})
+        if "recorded_date" not in chunk.columns:
+            raise ValueError("Colonne 'recorded_date' manquante après mapping.")
+        if "fuel_flow" not in chunk.columns:
+            raise ValueError("Colonne 'fuel_flow' manquante après mapping.")
+        chunk = _build_txt_timestamps(chunk, date_formats=date_formats)
+        chunk = cleaner.clean_numeric_columns(chunk)
+        for c in numeric_extra:
+            if c in chunk.columns:
+                chunk[c] = pd.to_numeric(chunk[c], errors="coerce")
+        chunk = chunk.dropna(subset=["timestamp", "fuel_flow"])
+        if "tail_number" in chunk.columns:
+            chunk["tail_number"] = chunk["tail_number"].astype("category")
+        return chunk
+
+    parts = []
+    n_read = 0
+    try:
+        for chunk in read_chunks(encoding):
+            n_read += chunk.shape[0]
+            parts.append(process(chunk))
+    except UnicodeDecodeError:
+        parts, n_read = [], 0
+        for chunk in read_chunks(fallback):
+            n_read += chunk.shape[0]
+            parts.append(process(chunk))
+
+    if not parts:
+        return pd.DataFrame(columns=list(txt_map.values()) + ["timestamp"])
+
+    # Les catégories diffèrent d'un bloc à l'autre : concat repasse en object, on recatégorise
+    df = pd.concat(parts, ignore_index=True)
+    if "tail_number" in df.columns:
+        df["tail_number"] = df["tail_number"].astype("category")
+    df = df.sort_values("timestamp", kind="mergesort").reset_index(drop=True)
+    logger.info("Streaming ingest: %d rows read, %d kept (%d chunks)", n_read, df.shape[0], len(parts))
+    return df
+
+
+def load_txt_series_cached(filepath: str, txt_read: dict, columns_mapping: dict,
+                           cache_dir: str = None, cache_format: str = "auto",
+                           ingest: dict = None) -> pd.DataFrame:
+    """
+    load_txt_series avec cache colonnaire : la frame nettoyée et typée est relue
+    directement tant que le fichier (taille, mtime, contenu) et les paramètres
+    txt_read / columns_mapping / ingest n'ont pas changé.
+    ingest = {"mode": "full" | "streaming", "chunksize": ...} choisit le chargeur.
+    """
+    ingest = ingest or {}
+
+    def load():
+        if ingest.get("mode", "full") == "streaming":
+            return load_txt_series_streaming(filepath, txt_read=txt_read, columns_mapping=columns_mapping,
+                                             chunksize=int(ingest.get("chunksize", 250_000)))
+        return load_txt_series(filepath, txt_read=txt_read, columns_mapping=columns_mapping)
+
+    if cache_dir is None:
+        return load()
+
+    cache = FrameCache(cache_dir, fmt=cache_format)
+    key = cache.key_for(filepath, txt_read=txt_read, columns_mapping=columns_mapping, ingest=ingest)
+    df = cache.load("txt_series", key)
+    if df is not None:
+        logger.info("TXT series loaded from cache (%d rows)", df.shape[0])
+        return df
+
+    df = load()
+    cache.store("txt_series", key, df)
+    logger.info("TXT series cached (%d rows, format=%s)", df.shape[0], cache.fmt)
     return df
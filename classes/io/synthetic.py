@@ -0,0 +1,257 @@
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# En-tête réel de l'export APM (ligne qui suit le préambule de 5 lignes)
+APM_HEADER = [
+    "Date Recorded ()", "Airplane ID ()", "Aircraft", "Date", "Time", "Flt Num", "Dept/Dest", "Flt Level",
+    "TAT (°C)", "Latitude", "CG(%MAC) (%)", "Gross Wt X 1000 (kg)", "Gen Load(% of Max)", "LHV",
+    "Thrust Setting", "Thrust Setting Dev", "Thrust Dev (%)", "FF Dev due to Thrust Setting (%)",
+    "Book Fn/Eng (kg)", "Book Fn/delta/Eng (kg)", "Fn/delta Eng1 (kg)", "Fn/delta Eng2 (kg)",
+    "Fn/delta Eng3 (kg)", "Fn/delta Eng4 (kg)", "Actual Fn Eng1 (kg)", "Actual Fn Eng2 (kg)",
+    "Actual Fn Eng3 (kg)", "Actual Fn Eng4 (kg)", "Book FF Eng 1", "%FF Dev Eng1 (%)", "Book FF Eng 2",
+    "%FF Dev Eng2 (%)", "Book FF Eng 3 (%)", "%FF Dev Eng3 (%)", "Book FF Eng 4 (%)", "%FF Dev Eng4 (%)",
+    "FF Total", "Book value of total FF", "%FF Dev Total (%)", "Fuel Mileage (FM)", "Book FM", "FM Dev (%)",
+    "Mach", "CAS (kts)", "TAS (kts)", "Ground Speed (kts)", "DVg/Dt", "DHp/Dt", "Quality factor",
+    "Wt/Delta (kg)", "SN Eng 1", "SN Eng 2", "SN Eng 3", "SN Eng 4",
+]
+
+# Préambule générique (5 lignes) quand aucun export réel ne sert de modèle
+GENERIC_PREAMBLE = [
+    "PETDAT_1,PETDAT_2,PETDAT_3,PETDAT_4,PETDAT_5",
+    "Database Name,Database Version,Revision Date,Airplane,Engine",
+    "synthetic.dat,1.4,2021-06-24,777F{VCP},GE90-110B1L",
+    "",
+    "PETAPMAbscissa_1,PETAPMAbscissa_2,PETAPM_1,PETAPM_2,PETAPM_3",
+]
+
+# Colonnes des feuilles avion du classeur CMA-FORM-FOE-10
+EVENT_SHEET_HEADER = [
+    "AIRAC cycle", "Date", "%THRST REQD", "%FUEL FLOW", "Fuel Flow factor = -(%FM)", "Update ?", "Remarks",
+    None, "Date of Event", "Position Y", "Event",
+]
+
+# Vols synthétiques : blocs de 6 h, palier de croisière par vol et montée par palier à mi-vol
+FLIGHT_SECONDS = 6 * 3600
+CRUISE_LEVELS = np.array([330, 350, 370, 390, 410])
+
+# Effet injecté par type d'action : fraction de la dégradation accumulée récupérée
+DEFAULT_WASH_EFFECTS = {
+    "RH engine wash": 0.35,
+    "LH engine wash": 0.35,
+    "Dual engine wash": 0.6,
+    "Airframe wash": 0.25,
+    "LH engine + Airframe wash": 0.55,
+    "Dual engine + Airframe wash": 0.75,
+    "A-check": 0.5,
+    "New line maintenance provider": 0.1,
+}
+
+# Premier mot du nom d'événement → moteurs dont la dégradation est récupérée (biréacteur)
+ENGINE_EVENTS = {"LH": (1,), "RH": (2,), "Dual": (1, 2)}
+
+# Heures %H:%M:%S indexées par seconde du jour
+_SECONDS_OF_DAY = np.array([f"{h:02d}:{m:02d}:{s:02d}" for h in range(24) for m in range(60) for s in range(60)],
+                           dtype=object)
+
+
+def tail_names(n_tails: int) -> List[str]:
+    """Immatriculations synthétiques au format des feuilles avion (F + 4 lettres)."""
+    names = []
+    for i in range(n_tails):
+        a, b = divmod(i, 26)
+        names.append(f"FH{chr(ord('M') + a % 14)}R{chr(ord('A') + b)}")
+    return names
+
+
+def generate_events(tails: Sequence[str], start: str, end: str, events_per_month: float = 1.0,
+                    event_types: Sequence[str] = None, seed: Optional[int] = None) -> pd.DataFrame:
+    """Événements de maintenance (date, event, tail_number) : processus de Poisson par avion."""
+    rng = np.random.default_rng(seed)
+    event_types = list(event_types or DEFAULT_WASH_EFFECTS.keys())
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    span_days = max(1.0, (end - start).total_seconds() / 86400.0)
+    frames = []
+    for tail in tails:
+        n = rng.poisson(events_per_month * span_days / 30.4375)
+        days = np.sort(rng.uniform(0, span_days, n)).astype(int)
+        frames.append(pd.DataFrame({
+            "date": start + pd.to_timedelta(days, unit="D"),
+            "event": rng.choice(event_types, size=n),
+            "tail_number": tail,
+        }))
+    events = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["date", "event", "tail_number"])
+    return events.drop_duplicates(["tail_number", "date"]).sort_values(["tail_number", "date"]).reset_index(drop=True)
+
+
+def _degradation(times_days: np.ndarray, event_days: np.ndarray, recovery: np.ndarray,
+                 drift_per_day: float) -> np.ndarray:
+    """
+    Dégradation relative D(t), t en jours depuis le début de la période (D(0) = 0) :
+    croît de drift_per_day par jour, chaque événement en récupère une fraction.
+    État calculé aux événements, puis propagé à toutes les mesures par recherche dichotomique.
+    """
+    level_after = np.empty(event_days.size)
+    level, last = 0.0, 0.0
+    for i, (t, r) in enumerate(zip(event_days, recovery)):
+        level = (level + drift_per_day * max(0.0, t - last)) * (1.0 - r)
+        last = t
+        level_after[i] = level
+    k = np.searchsorted(event_days, times_days, side="right") - 1
+    base_level = np.where(k >= 0, level_after[np.maximum(k, 0)], 0.0)
+    base_time = np.where(k >= 0, event_days[np.maximum(k, 0)], 0.0)
+    return base_level + drift_per_day * (times_days - base_time)
+
+
+def _fmt(values: np.ndarray) -> pd.Series:
+    return pd.Series(values).astype(str)
+
+
+def _fmt_timestamps(t0: pd.Timestamp, seconds: np.ndarray):
+    """Dates (%Y/%m/%d) et heures (%H:%M:%S) : formatage des jours et secondes distincts seulement."""
+    sec = seconds.astype(np.int64) + int((t0 - t0.normalize()).total_seconds())
+    day, sod = np.divmod(sec, 86400)
+    uniq, inv = np.unique(day, return_inverse=True)
+    day_str = (t0.normalize() + pd.to_timedelta(uniq, unit="D")).strftime("%Y/%m/%d").to_numpy(dtype=object)
+    return pd.Series(day_str[inv]), pd.Series(_SECONDS_OF_DAY[sod])
+
+
+def _join_sparse(header: List[str], values: Dict[str, object], n: int) -> pd.Series:
+    """
+    Lignes CSV où seules les colonnes de values sont renseignées : les colonnes vides sont
+    remplacées par des séparateurs précalculés (pas de formatage cellule par cellule).
+    """
+    filled = [i for i, c in enumerate(header) if c in values]
+    line = pd.Series([""] * n, dtype=object)
+    prev = -1
+    for i in filled:
+        gap = "," * (i - prev - 1 + (1 if prev >= 0 else 0)) if prev >= 0 or i > 0 else ""
+        v = values[header[i]]
+        line = line + gap + (v if isinstance(v, str) else v.astype(object).to_numpy())
+        prev = i
+    return line + "," * (len(header) - 1 - prev)
+
+
+def generate_apm_txt(path, events: pd.DataFrame, n_rows: int, start: str, end: str,
+                     columns_mapping: Dict, template_path=None, skip_rows: int = 5,
+                     drift_per_day: float = 2e-4, wash_effects: Dict[str, float] = None,
+                     noise: float = 0.01, invalid_date_rate: float = 0.0005, n_engines: int = 2,
+                     chunk_rows: int = 1_000_000, seed: Optional[int] = None) -> Path:
+    """
+    Écrit un export APM TXT synthétique : préambule de skip_rows lignes et en-tête repris de
+    template_path (export réel) s'il existe, sinon génériques ; colonnes réelles de columns_mapping.
+    Chaque avion de events se dégrade de drift_per_day par jour (fuel flow ↑, fuel mileage ↓) et
+    chaque événement récupère la fraction wash_effects[event] de la dégradation accumulée.
+    Une petite part de dates invalides (invalid_date_rate) reproduit celles des exports réels.
+    Chaque moteur (n_engines) a sa propre dégradation (%FF Dev EngN) : seuls les événements
+    qui le concernent (ENGINE_EVENTS : LH, RH, Dual) la récupèrent.
+    Écriture par blocs de chunk_rows lignes pour les fichiers de plusieurs Go.
+    """
+    rng = np.random.default_rng(seed)
+    path = Path(path)
+    wash_effects = {**DEFAULT_WASH_EFFECTS, **(wash_effects or {})}
+    txt_map = columns_mapping.get("txt", columns_mapping)
+    col = {dst: src for src, dst in txt_map.items()}
+
+    if template_path is not None and Path(template_path).exists():
+        with open(template_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            lines = [f.readline().rstrip("\r\n") for _ in range(skip_rows + 1)]
+        preamble, header = lines[:skip_rows], lines[skip_rows].split(",")
+    else:
+        preamble, header = (GENERIC_PREAMBLE + [""] * skip_rows)[:skip_rows], list(APM_HEADER)
+    header += [c for c in txt_map if c not in header]
+
+    tails = sorted(events["tail_number"].astype(str).unique())
+    per_tail = np.full(len(tails), n_rows // max(1, len(tails)))
+    per_tail[: n_rows - per_tail.sum()] += 1
+    t0 = pd.Timestamp(start)
+    span_s = max(1.0, (pd.Timestamp(end) - t0).total_seconds())
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("\r\n".join(preamble + [",".join(header)]) + "\r\n")
+        written = 0
+        for tail, n_tail in zip(tails, per_tail):
+            ev = events[events["tail_number"].astype(str) == tail].sort_values("date")
+            ev_days = ((pd.to_datetime(ev["date"]) - t0).dt.total_seconds() / 86400.0).to_numpy()
+            recovery = ev["event"].map(wash_effects).fillna(0.0).to_numpy(dtype=float)
+            first_word = ev["event"].astype(str).str.split().str[0]
+            engine_recovery = [np.where(first_word.isin([w for w, es in ENGINE_EVENTS.items() if e in es]), recovery, 0.0)
+                               for e in range(1, n_engines + 1)]
+            seconds = np.sort(rng.uniform(0, span_s, n_tail))
+
+            for lo in range(0, n_tail, chunk_rows):
+                sec = seconds[lo:lo + chunk_rows]
+                n = sec.size
+                D = _degradation(sec / 86400.0, ev_days, recovery, drift_per_day)
+                flight = (sec // FLIGHT_SECONDS).astype(np.int64)
+                dates, times = _fmt_timestamps(t0, sec)
+                bad = rng.random(n) < invalid_date_rate
+                dates[bad] = "2004/31/50"
+
+                values = {
+                    col.get("recorded_date", "Date Recorded ()"): dates,
+                    col.get("time", "Time"): times,
+                    col.get("tail_number", "Airplane ID ()"): tail,
+                    "Aircraft": tail,
+                    "Date": dates,
+                    col.get("fuel_flow", "FF Total"): _fmt(np.round(
+                        15000.0 * (1.0 + D) * (1.0 + noise * rng.standard_normal(n)), 0)),
+                    col.get("perf_factor", "Fuel Mileage (FM)"): _fmt(np.round(
+                        0.035 * (1.0 - D) * (1.0 + noise * rng.standard_normal(n)), 5)),
+                    col.get("mach", "Mach"): _fmt(np.round(0.832 + 0.004 * np.cos(flight)
+                                                          + 0.002 * rng.standard_normal(n), 3)),
+                    col.get("oat", "TAT (°C)"): _fmt(np.round(-17.0 + 8.8 * rng.standard_normal(n)).astype(int)),
+                    col.get("altitude", "Flt Level"): _fmt(CRUISE_LEVELS[flight % (CRUISE_LEVELS.size - 1)]
+                                                           + 20 * (sec % FLIGHT_SECONDS >= FLIGHT_SECONDS / 2)),
+                    col.get("flight_number", "Flt Num"): _fmt(np.char.add("SYN", (100 + flight % 900).astype(str))),
+                }
+                for e, rec in enumerate(engine_recovery, start=1):
+                    D_e = _degradation(sec / 86400.0, ev_days, rec, drift_per_day)
+                    values[col.get(f"ff_dev_eng{e}", f"%FF Dev Eng{e} (%)")] = _fmt(np.round(
+                        100.0 * D_e + 100.0 * noise * rng.standard_normal(n), 1))
+                    values[col.get(f"book_ff_eng{e}", f"Book FF Eng {e}")] = _fmt(np.round(
+                        7500.0 * (1.0 + noise * rng.standard_normal(n)), 0))
+                f.write("\r\n".join(_join_sparse(header, values, n)) + "\r\n")
+                written += n
+    logger.info("Synthetic APM TXT written to %s (%d rows, %d tails)", path, written, len(tails))
+    return path
+
+
+def generate_events_workbook(path, events: pd.DataFrame, extra_sheets: Sequence[str] = ("Front Page", "READ ME")) -> Path:
+    """Classeur d'événements au format CMA-FORM-FOE-10 : une feuille par avion (Date / Event)."""
+    from openpyxl import Workbook
+
+    path = Path(path)
+    wb = Workbook(write_only=True)
+    for name in extra_sheets:
+        wb.create_sheet(name).append([name])
+    for tail, grp in events.groupby(events["tail_number"].astype(str), sort=True):
+        ws = wb.create_sheet(tail)
+        ws.append(EVENT_SHEET_HEADER)
+        for i, (date, event) in enumerate(zip(pd.to_datetime(grp["date"]), grp["event"])):
+            ws.append([2300 + i, date.to_pydatetime(), None, None, None, "NO", "Synthetic", None,
+                       date.to_pydatetime(), None, str(event)])
+    wb.save(path)
+    logger.info("Synthetic events workbook written to %s (%d events)", path, events.shape[0])
+    return path
+
+
+def generate_fleet(out_dir, columns_mapping: Dict, n_rows: int = 10_000, n_tails: int = 3,
+                   start: str = "2022-06-01", end: str = "2025-11-30", events_per_month: float = 1.0,
+                   wash_effects: Dict[str, float] = None, drift_per_day: float = 2e-4,
+                   template_path=None, seed: Optional[int] = 0) -> Dict:
+    """Jeu de données complet (TXT APM + classeur d'événements) dans out_dir."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    events = generate_events(tail_names(n_tails), start, end, events_per_month,
+                             event_types=list((wash_effects or DEFAULT_WASH_EFFECTS).keys()), seed=seed)
+    txt = generate_apm_txt(out_dir / "synthetic_apm.txt", events, n_rows, start, end, columns_mapping,
+                           template_path=template_path, drift_per_day=drift_per_day,
+                           wash_effects=wash_effects, seed=seed)
+    xlsx = generate_events_workbook(out_dir / "synthetic_events.xlsx", events)
+    return {"txt": txt, "excel": xlsx, "events": events}
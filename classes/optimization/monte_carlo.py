@@ -0,0 +1,153 @@
+import logging
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class MonteCarloROI:
+    """
+    Distribution du ROI de chaque action du catalogue sous incertitude des taux et du prix carburant.
+
+    Point de départ identique à MaintenanceScheduler : gain = taux du type * delta_t moyen
+    (temps depuis la dernière même maintenance), ROI = gain * prix carburant - coût.
+    Chaque scénario tire :
+      - un taux par (avion, action) ~ N(rate_mean, rate_std) ; rate_std manquant (n = 1)
+        → médiane des écarts-types connus, sinon 0
+      - un facteur prix commun à toutes les actions ~ lognormal de moyenne 1 (price_volatility)
+    Les scénarios sont évalués par lots de taille bornée (batch_elements valeurs au plus),
+    sans boucle Python par scénario ; moyenne, écart-type, P(ROI > 0) et percentiles
+    (histogramme à pas fixe par action) sont accumulés au fil des lots.
+    """
+
+    def __init__(self, catalog, fuel_price: float, n_scenarios: int = 100_000,
+                 price_volatility: float = 0.0, percentiles: Iterable[float] = (5, 25, 50, 75, 95),
+                 batch_elements: int = 2_000_000, bins: int = 2048, seed: Optional[int] = None):
+        self.catalog = catalog
+        self.fuel_price = float(fuel_price)
+        self.n_scenarios = int(n_scenarios)
+        self.price_volatility = float(price_volatility)
+        self.percentiles = [float(p) for p in percentiles]
+        self.batch_elements = int(batch_elements)
+        self.bins = int(bins)
+        self.seed = seed
+
+    @classmethod
+    def from_settings(cls, catalog, settings: Dict) -> "MonteCarloROI":
+        cfg = settings.get("monte_carlo", {})
+        return cls(
+            catalog=catalog,
+            fuel_price=settings["economics"]["fuel_price_per_unit"],
+            n_scenarios=cfg.get("n_scenarios", 100_000),
+            price_volatility=cfg.get("price_volatility", 0.0),
+            percentiles=cfg.get("percentiles", (5, 25, 50, 75, 95)),
+            batch_elements=cfg.get("batch_elements", 2_000_000),
+            seed=cfg.get("seed")
+        )
+
+    def _actions(self, maint_impacts: pd.DataFrame, type_rates: pd.DataFrame) -> pd.DataFrame:
+        """Une ligne par (avion, action) : taux moyen, écart-type, delta_t moyen, coût."""
+        catalog = pd.DataFrame([{"action": m.name, "cost": float(m.cost)} for m in self.catalog.list_all()])
+        if maint_impacts is None or maint_impacts.empty:
+            return catalog.assign(tail_number=None, rate_mean=0.0, rate_std=0.0, delta_t=0.0, n_events=0)
+
+        mi = maint_impacts.assign(event_name=maint_impacts["event_name"].astype(str),
+                                  tail_number=maint_impacts["tail_number"].astype(str))
+        grouped = mi.groupby(["tail_number", "event_name"], sort=True)
+        stats = pd.DataFrame({
+            "rate_mean": grouped["rate_mean_type"].first().astype(float),
+            "rate_std": grouped["rate_std_type"].first().astype(float),
+            "delta_t": grouped["delta_t"].mean().astype(float),
+            "n_events": grouped.size().astype(int),
+        }).reset_index().rename(columns={"event_name": "action"})
+
+        tails = pd.DataFrame({"tail_number": sorted(mi["tail_number"].unique())})
+        rows = tails.merge(catalog, how="cross").merge(stats, on=["tail_number", "action"], how="left")
+
+        # Écart-type inconnu (un seul intervalle observé) : médiane des écarts-types par type
+        known_std = type_rates["rate_std"].astype(float).dropna() if type_rates is not None and not type_rates.empty \
+            else pd.Series(dtype=float)
+        std_fallback = float(known_std.median()) if not known_std.empty else 0.0
+        rows["rate_std"] = rows["rate_std"].fillna(std_fallback).where(rows["rate_mean"].notna(), 0.0)
+        # Action jamais observée : gain nul, ROI = -coût (comme MaintenanceScheduler)
+        rows["rate_mean"] = rows["rate_mean"].fillna(0.0)
+        rows["delta_t"] = rows["delta_t"].fillna(0.0)
+        rows["n_events"] = rows["n_events"].fillna(0).astype(int)
+        return rows
+
+    def run(self, maint_impacts: pd.DataFrame, type_rates: pd.DataFrame = None) -> pd.DataFrame:
+        """Statistiques de ROI par (avion, action) sur n_scenarios scénarios."""
+        rows = self._actions(maint_impacts, type_rates)
+        n_rows = rows.shape[0]
+        rate_mean = rows["rate_mean"].to_numpy(dtype=float)
+        rate_std = rows["rate_std"].to_numpy(dtype=float)
+        delta_t = rows["delta_t"].to_numpy(dtype=float)
+        cost = rows["cost"].to_numpy(dtype=float)
+
+        # Plage des histogrammes : ± 8 écarts-types analytiques autour du ROI moyen
+        sigma_p = self.price_volatility
+        price_var = np.expm1(sigma_p ** 2)
+        gain_mean = rate_mean * delta_t * self.fuel_price
+        gain_var = (delta_t * self.fuel_price) ** 2 * ((rate_std ** 2 + rate_mean ** 2) * (1 + price_var) - rate_mean ** 2)
+        spread = np.sqrt(np.maximum(gain_var, 0.0))
+        degenerate = spread == 0
+        spread = np.where(degenerate, 1.0, spread)
+        center = gain_mean - cost
+        lo = center - 8.0 * spread
+        width = 16.0 * spread / self.bins
+
+        rng = np.random.default_rng(self.seed)
+        batch = max(1, self.batch_elements // max(1, n_rows))
+        total = np.zeros(n_rows)
+        total_sq = np.zeros(n_rows)
+        positive = np.zeros(n_rows, dtype=np.int64)
+        # Deux cases supplémentaires par action : sous / dépassement de plage
+        hist = np.zeros(n_rows * (self.bins + 2), dtype=np.int64)
+        offsets = np.arange(n_rows) * (self.bins + 2)
+
+        done = 0
+        while done < self.n_scenarios:
+            b = min(batch, self.n_scenarios - done)
+            rates = rate_mean + rate_std * rng.standard_normal((b, n_rows))
+            price = self.fuel_price * np.exp(sigma_p * rng.standard_normal((b, 1)) - 0.5 * sigma_p ** 2)
+            roi = rates * delta_t * price - cost
+
+            # Sommes des écarts au ROI ponctuel : pas de perte de précision quand std << |ROI|
+            dev = roi - center
+            total += dev.sum(axis=0)
+            total_sq += np.square(dev).sum(axis=0)
+            positive += (roi > 0).sum(axis=0)
+            cell = np.clip(np.floor((roi - lo) / width), -1, self.bins).astype(np.int64) + 1
+            hist += np.bincount((cell + offsets).ravel(), minlength=hist.size)
+            done += b
+
+        n = float(self.n_scenarios)
+        mean_dev = total / n
+        std = np.sqrt(np.maximum(total_sq / n - mean_dev ** 2, 0.0) * n / max(n - 1.0, 1.0))
+        mean = center + mean_dev
+
+        out = rows[["tail_number", "action", "n_events", "rate_mean", "rate_std", "delta_t", "cost"]].copy()
+        out["roi_point"] = center
+        out["roi_mean"] = mean
+        out["roi_std"] = std
+        out["prob_positive"] = positive / n
+        # Percentiles par interpolation dans l'histogramme cumulé de chaque action
+        cdf = np.cumsum(hist.reshape(n_rows, self.bins + 2), axis=1) / n
+        edges = lo[:, None] + width[:, None] * np.arange(self.bins + 1)
+        for p in self.percentiles:
+            q = p / 100.0
+            k = (cdf < q).sum(axis=1)
+            k_in = np.clip(k - 1, 0, self.bins - 1)
+            below = np.where(k > 0, cdf[np.arange(n_rows), np.maximum(k - 1, 0)], 0.0)
+            in_bin = np.maximum(cdf[np.arange(n_rows), k.clip(max=self.bins + 1)] - below, 1e-300)
+            frac = np.clip((q - below) / in_bin, 0.0, 1.0)
+            value = edges[np.arange(n_rows), k_in] + frac * width
+            value = np.where(k == 0, lo, np.where(k > self.bins, lo + width * self.bins, value))
+            # Action sans incertitude (taux nul ou connu sans dispersion, prix fixe) : ROI constant
+            out[f"roi_p{p:g}"] = np.where(degenerate, center, value)
+
+        logger.info("Monte Carlo ROI: %d scenarios x %d actions", self.n_scenarios, n_rows)
+        return out.sort_values(["tail_number", "roi_mean"], ascending=[True, False], kind="mergesort") \
+            .reset_index(drop=True)
@@ -0,0 +1,245 @@
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24.0
+
+
+class RollingHorizonPlanner:
+    """
+    Planification datée des maintenances sur un horizon glissant.
+
+    Pour chaque (avion, action du catalogue), la dégradation suit le modèle de
+    compute_maintenance_impacts : elle croît au taux du type (estimate_type_rates, sinon dérive
+    moyenne de l'avion, puis de la flotte) depuis la dernière même action, et plafonne après
+    benefit_days (bénéfice de l'action précédente épuisé). Chaque jour dégradé coûte
+    dégradation * fuel_units_per_day * prix carburant.
+    La valeur d'une action au jour d (précédente au jour p) est la pénalité carburant qu'elle
+    supprime jusqu'à la fin de l'horizon ; elle ne dépend que de (p, d), donc le meilleur
+    calendrier de chaque ligne s'obtient par programmation dynamique sur les jours
+    (état = jour de la dernière action), vectorisée sur toutes les lignes (avion × action).
+    Une action n'est retenue que si valeur - coût > 0 et ≥ min_roi.
+    Replanifier chaque nuit revient à rappeler plan() avec la nouvelle date de départ :
+    seules les actions des commit_days premiers jours sont marquées comme fermes.
+    """
+
+    def __init__(self, catalog, fuel_price: float, constraints: Dict = None,
+                 horizon_days: int = 730, commit_days: int = 30, fuel_units_per_day: float = 1.0,
+                 time_axis: str = "days"):
+        self.catalog = catalog
+        self.fuel_price = float(fuel_price)
+        self.min_roi = float((constraints or {}).get("min_roi") or 0.0)
+        self.horizon_days = int(horizon_days)
+        self.commit_days = int(commit_days)
+        self.fuel_units_per_day = float(fuel_units_per_day)
+        # Taux exprimés par unité de time_axis → convertis en taux par jour
+        self.rate_scale = HOURS_PER_DAY if time_axis == "hours" else 1.0
+
+    @classmethod
+    def from_settings(cls, catalog, settings: Dict) -> "RollingHorizonPlanner":
+        cfg = settings.get("planning", {})
+        return cls(
+            catalog=catalog,
+            fuel_price=settings["economics"]["fuel_price_per_unit"],
+            constraints=settings["economics"].get("constraints", {}),
+            horizon_days=cfg.get("horizon_days", 730),
+            commit_days=cfg.get("commit_days", 30),
+            fuel_units_per_day=cfg.get("fuel_units_per_day", 1.0),
+            time_axis=settings["impact"]["time_axis"]
+        )
+
+    # -- état initial ----------------------------------------------------------
+
+    def _rows(self, events_df: pd.DataFrame, non_main: pd.DataFrame,
+              type_rates: pd.DataFrame, as_of: pd.Timestamp) -> pd.DataFrame:
+        """Une ligne par (avion, action) : taux par jour, âge de la dernière même action, coûts."""
+        actions = pd.DataFrame([
+            {"action": m.name, "cost": float(m.cost), "downtime_hours": float(m.downtime_hours),
+             "benefit_days": float(round(m.benefit_days or 1))}
+            for m in self.catalog.list_all()
+        ])
+        ev = events_df[pd.to_datetime(events_df["date"]) <= as_of]
+        ev = ev.assign(tail_number=ev["tail_number"].astype(str), event=ev["event"].astype(str),
+                       date=pd.to_datetime(ev["date"]))
+        tails = pd.DataFrame({"tail_number": sorted(ev["tail_number"].unique())})
+        rows = tails.merge(actions, how="cross")
+
+        # Âge : jours depuis la dernière même action, sinon depuis le premier événement connu de l'avion
+        last_same = ev.groupby(["tail_number", "event"])["date"].max().rename("last_date")
+        rows = rows.merge(last_same, left_on=["tail_number", "action"], right_index=True, how="left")
+        first_any = rows["tail_number"].map(ev.groupby("tail_number")["date"].min())
+        rows["last_date"] = rows["last_date"].fillna(first_any)
+        rows["age_days"] = (as_of - rows["last_date"]).dt.days.astype(float)
+
+        # Taux : type, sinon dérive moyenne des intervalles valides de l'avion, puis de la flotte
+        rates = type_rates.set_index(type_rates["type"].astype(str))["rate_mean"] \
+            if type_rates is not None and not type_rates.empty else pd.Series(dtype=float)
+        valid = non_main[non_main["valid"] == True] if not non_main.empty else non_main
+        drift_tail = valid.groupby(valid["tail_number"].astype(str))["drift_rate"].mean() \
+            if not valid.empty else pd.Series(dtype=float)
+        drift_fleet = float(valid["drift_rate"].mean()) if not valid.empty else np.nan
+
+        type_rate = rows["action"].map(rates).astype(float)
+        drift = rows["tail_number"].map(drift_tail).astype(float).fillna(drift_fleet)
+        rows["rate_per_day"] = type_rate.fillna(drift) * self.rate_scale
+        rows["rate_source"] = np.where(type_rate.notna(), "type_rate", "fallback_drift")
+        return rows.dropna(subset=["rate_per_day", "age_days"]).reset_index(drop=True)
+
+    # -- optimisation ----------------------------------------------------------
+
+    @staticmethod
+    def _cum_degradation(x, benefit):
+        """C(x) = Σ_{u<x} min(u, benefit) : dégradation cumulée (en jours×taux) sur x jours."""
+        x = np.maximum(x, 0.0)
+        m = np.minimum(x, benefit + 1.0)
+        return m * (m - 1.0) / 2.0 + np.maximum(0.0, x - benefit - 1.0) * benefit
+
+    def _action_value(self, rate, prev, d, benefit):
+        """Pénalité carburant supprimée par une action au jour d (précédente au jour prev), jusqu'à H."""
+        H = float(self.horizon_days)
+        C = self._cum_degradation
+        avoided = C(H - prev, benefit) - C(d - prev, benefit) - C(H - d, benefit)
+        return rate * avoided * self.fuel_units_per_day * self.fuel_price
+
+    def _solve(self, rate: np.ndarray, age: np.ndarray, cost: np.ndarray, benefit: np.ndarray):
+        """
+        Programmation dynamique jour par jour, vectorisée sur toutes les lignes (un seul passage
+        sur l'horizon, benefit_days propre à chaque ligne).
+        État j = dernière action au jour j-1 (j = 0 : état initial, dernière action il y a age jours).
+        Renvoie la liste des jours d'action par ligne.
+        """
+        n_rows, H = rate.size, self.horizon_days
+        # Intégrales C(.) ne dépendant que des jours et de benefit_days : précalculées une fois par ligne
+        b = benefit[:, None]
+        C = self._cum_degradation
+        t = np.arange(H + 2, dtype=float)
+        c_from = C(float(H) - (t[:H + 1] - 1.0), b)            # C(H - t), état s ↔ dernière action t = s - 1
+        c_lag = C(t, b)                                        # C(d - t)
+        c_to = C(float(H) - t[:H], b)                          # C(H - d)
+        c_init = C(float(H) + age, benefit)                    # C(H - t) de l'état initial (t = -age)
+
+        V = np.full((n_rows, H + 1), -np.inf)
+        V[:, 0] = 0.0
+        parent = np.zeros((n_rows, H + 1), dtype=np.int32)
+        rows = np.arange(n_rows)
+
+        # Au-delà de benefit_days + 1 jours, la valeur d'une action ne dépend plus de la précédente :
+        # les états plus anciens que la fenêtre (la plus large des lignes) sont résumés par leur maximum courant.
+        window = int(benefit.max()) + 1
+        old_val = np.full(n_rows, -np.inf)
+        old_state = np.zeros(n_rows, dtype=np.int32)
+
+        for d in range(H):
+            first = max(1, d - window + 1)
+            if first > 1:
+                s_new = first - 1
+                better = V[:, s_new] > old_val
+                old_val = np.where(better, V[:, s_new], old_val)
+                old_state = np.where(better, s_new, old_state)
+
+            # États candidats : initial (jour -age), résumé des anciens (t = first - 2), puis fenêtre récente
+            n_states = d + 1 - first
+            avoided = np.empty((n_rows, n_states + 2))
+            avoided[:, 0] = c_init - C(d + age, benefit) - c_to[:, d]
+            avoided[:, 1] = c_from[:, first - 1] - c_lag[:, d - first + 2] - c_to[:, d]
+            avoided[:, 2:] = c_from[:, first:d + 1] - c_lag[:, d + 1 - first:0:-1] - c_to[:, d, None]
+            v_prev = np.concatenate([V[:, :1], old_val[:, None], V[:, first:d + 1]], axis=1)
+            value = rate[:, None] * avoided * self.fuel_units_per_day * self.fuel_price - cost[:, None]
+            ok = (value > 0) & (value >= self.min_roi)
+            cand = np.where(ok, v_prev + value, -np.inf)
+            j = np.argmax(cand, axis=1)
+            V[:, d + 1] = cand[rows, j]
+            parent[:, d + 1] = np.where(j == 0, 0, np.where(j == 1, old_state, first + j - 2))
+
+        best_state = np.argmax(V, axis=1)
+        schedules = []
+        for r in range(n_rows):
+            days = []
+            s = int(best_state[r])
+            while s > 0:
+                days.append(s - 1)
+                s = int(parent[r, s])
+            schedules.append(days[::-1])
+        return schedules
+
+    def plan(self, events_df: pd.DataFrame, non_main: pd.DataFrame,
+             type_rates: pd.DataFrame, as_of: Optional[pd.Timestamp] = None):
+        """
+        Calendrier des actions de as_of à as_of + horizon_days, pour chaque avion de events_df.
+        Renvoie (schedule, daily) :
+          - schedule : une ligne par action datée (gain, coût, valeur nette, ferme ou non)
+          - daily : dégradation évitée par jour et par avion, et valeur cumulée du plan
+        """
+        schedule_cols = ["tail_number", "date", "action", "days_since_last", "expected_gain_units",
+                         "value", "cost", "downtime_hours", "net_value", "rate_source", "committed"]
+        daily_cols = ["tail_number", "date", "avoided_degradation", "cumulative_net_value"]
+
+        if as_of is None:
+            as_of = pd.to_datetime(events_df["date"]).max()
+        as_of = pd.Timestamp(as_of).normalize()
+
+        rows = self._rows(events_df, non_main, type_rates, as_of)
+        if rows.empty or self.horizon_days <= 0:
+            return pd.DataFrame(columns=schedule_cols), pd.DataFrame(columns=daily_cols)
+
+        rate = rows["rate_per_day"].to_numpy(dtype=float)
+        age = rows["age_days"].to_numpy(dtype=float)
+        cost = rows["cost"].to_numpy(dtype=float)
+        benefit = rows["benefit_days"].to_numpy(dtype=float)
+        schedules = self._solve(rate, age, cost, benefit)
+
+        H = self.horizon_days
+        records = []
+        marks = np.zeros((rows.shape[0], H), dtype=bool)
+        net_by_day = np.zeros((rows.shape[0], H))
+        for r, days in enumerate(schedules):
+            prev = -age[r]
+            for d in days:
+                gain_units = rate[r] * min(d - prev, benefit[r])
+                value = float(self._action_value(rate[r], prev, float(d), benefit[r]))
+                records.append({
+                    "tail_number": rows.at[r, "tail_number"],
+                    "date": as_of + pd.Timedelta(days=d),
+                    "action": rows.at[r, "action"],
+                    "days_since_last": d - prev,
+                    "expected_gain_units": gain_units,
+                    "value": value,
+                    "cost": cost[r],
+                    "downtime_hours": rows.at[r, "downtime_hours"],
+                    "net_value": value - cost[r],
+                    "rate_source": rows.at[r, "rate_source"],
+                    "committed": d < self.commit_days,
+                })
+                marks[r, d] = True
+                net_by_day[r, d] = value - cost[r]
+                prev = d
+
+        schedule = pd.DataFrame(records, columns=schedule_cols)
+        schedule = schedule.sort_values(["date", "tail_number"], kind="mergesort").reset_index(drop=True)
+
+        # Simulation journalière : dégradation sans action - dégradation avec le plan
+        days = np.arange(H, dtype=float)
+        last = np.maximum.accumulate(np.where(marks, days, -np.inf), axis=1)
+        last = np.where(np.isfinite(last), last, -age[:, None])
+        b = benefit[:, None]
+        avoided = rate[:, None] * (np.minimum(days + age[:, None], b) - np.minimum(days - last, b))
+
+        tail_codes, tail_names = pd.factorize(rows["tail_number"], sort=True)
+        avoided_tail = np.zeros((len(tail_names), H))
+        net_tail = np.zeros((len(tail_names), H))
+        np.add.at(avoided_tail, tail_codes, avoided)
+        np.add.at(net_tail, tail_codes, net_by_day)
+        daily = pd.DataFrame({
+            "tail_number": np.repeat(np.asarray(tail_names, dtype=object), H),
+            "date": np.tile(as_of + pd.to_timedelta(np.arange(H), unit="D"), len(tail_names)),
+            "avoided_degradation": avoided_tail.ravel(),
+            "cumulative_net_value": np.cumsum(net_tail, axis=1).ravel(),
+        }, columns=daily_cols)
+
+        logger.info("Rolling-horizon plan from %s over %d days: %d actions on %d tails",
+                    as_of.date(), H, schedule.shape[0], len(tail_names))
+        return schedule, daily
@@ -1,47 +1,158 @@
+import logging
+import math
+
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+
 class MaintenanceScheduler:
-    def __init__(self, catalog, constraints: dict, fuel_price: float):
+    def __init__(self, catalog, constraints: dict, fuel_price: float, solver: str = "exact", max_nodes: int = 200_000):
         self.catalog = catalog
         self.constraints = constraints
         self.fuel_price = fuel_price
+        # "exact" : sac à dos multi-contraintes par branch-and-bound ; "greedy" : tri par ROI (repli rapide)
+        self.solver = solver
+        self.max_nodes = max_nodes
 
-    def optimize(self, deltas: pd.DataFrame, event_col="event", delta_fuel_col="delta_fuel", default_delta_from_metric="delta_fuel_flow") -> pd.DataFrame:
-        # Use delta_fuel if present, else derive from delta_fuel_flow
-        if delta_fuel_col not in deltas.columns:
-            if default_delta_from_metric in deltas.columns:
-                deltas[delta_fuel_col] = deltas[default_delta_from_metric]
-            else:
-                deltas[delta_fuel_col] = 0.0
+    def _limits(self):
+        budget = self.constraints.get("budget")
+        max_downtime = self.constraints.get("max_downtime_hours")
+        max_events = self.constraints.get("max_events")
+        min_roi = self.constraints.get("min_roi")
+        return (
+            float("inf") if budget is None else float(budget),
+            float("inf") if max_downtime is None else float(max_downtime),
+            len(self.catalog.list_all()) if max_events is None else int(max_events),
+            0.0 if min_roi is None else float(min_roi),
+        )
+
+    def _candidates(self, deltas: pd.DataFrame, event_col: str, delta_fuel_col: str) -> pd.DataFrame:
+        # Gain moyen par type d'événement en un seul groupby, ROI = gain * prix carburant - coût
+        mean_gain = deltas.groupby(event_col, sort=False)[delta_fuel_col].mean()
+        rows = []
+        for m in self.catalog.list_all():
+            gain_units = mean_gain.get(m.name, 0.0)
+            roi = (gain_units * self.fuel_price) - m.cost
+            rows.append((m.name, m.cost, m.downtime_hours, gain_units, roi))
+        cand = pd.DataFrame(rows, columns=["event", "cost", "downtime_hours", "expected_gain_units", "roi"])
+        # Tri stable par ROI décroissant : même ordre que la sélection gloutonne historique
+        return cand.sort_values("roi", ascending=False, kind="mergesort").reset_index(drop=True)
 
-        budget = self.constraints.get("budget", float("inf"))
-        max_downtime = self.constraints.get("max_downtime_hours", float("inf"))
+    def _eligible(self, cand: pd.DataFrame) -> np.ndarray:
+        budget, max_downtime, _, min_roi = self._limits()
+        roi = cand["roi"].to_numpy(dtype=float)
+        return ((roi > 0) & (roi >= min_roi)
+                & (cand["cost"].to_numpy(dtype=float) <= budget)
+                & (cand["downtime_hours"].to_numpy(dtype=float) <= max_downtime))
 
+    def _greedy(self, cand: pd.DataFrame) -> list:
+        budget, max_downtime, max_events, _ = self._limits()
+        eligible = self._eligible(cand)
         chosen = []
         cost_sum = 0.0
         downtime_sum = 0.0
-
-        # Greedy: sort events by estimated ROI (gain * fuel_price - cost)
-        tmp = []
-        for m in self.catalog.list_all():
-            mask = deltas[event_col] == m.name
-            mean_gain_units = deltas.loc[mask, delta_fuel_col].mean() if mask.any() else 0.0
-            roi = (mean_gain_units * self.fuel_price) - m.cost
-            tmp.append((m.name, m.cost, m.downtime_hours, mean_gain_units, roi))
-
-        tmp_sorted = sorted(tmp, key=lambda x: x[-1], reverse=True)
-
-        for name, cost, dt, gain_units, roi in tmp_sorted:
-            if roi > 0 and cost_sum + cost <= budget and downtime_sum + dt <= max_downtime:
-                chosen.append({
-                    "event": name,
-                    "cost": cost,
-                    "downtime_hours": dt,
-                    "expected_gain_units": gain_units,
-                    "roi": roi
-                })
+        for i in np.flatnonzero(eligible):
+            if len(chosen) >= max_events:
+                break
+            cost, dt = float(cand.at[i, "cost"]), float(cand.at[i, "downtime_hours"])
+            if cost_sum + cost <= budget and downtime_sum + dt <= max_downtime:
+                chosen.append(int(i))
                 cost_sum += cost
                 downtime_sum += dt
+        return chosen
+
+    def _branch_and_bound(self, cand: pd.DataFrame) -> list:
+        """
+        Sac à dos 0-1 multi-contraintes (budget, downtime, nombre d'actions), résolu exactement.
+        Borne supérieure d'un nœud = relaxation lagrangienne
+            L(λ) = λ·capacité restante + Σ max(0, roi_j - λ·w_j)
+        dont les multiplicateurs, hérités du parent, sont affinés par recherche linéaire
+        exacte coordonnée par coordonnée (borne proche de la relaxation LP).
+        La solution gloutonne sert de borne inférieure initiale.
+        """
+        budget, max_downtime, max_events, _ = self._limits()
+        eligible = np.flatnonzero(self._eligible(cand))
+        if eligible.size == 0 or max_events <= 0:
+            return []
+
+        roi = cand["roi"].to_numpy(dtype=float)[eligible]
+        weights = [cand["cost"].to_numpy(dtype=float)[eligible],
+                   cand["downtime_hours"].to_numpy(dtype=float)[eligible],
+                   np.ones(eligible.size)]
+        caps = [budget, max_downtime, float(max_events)]
+        keep = [r for r in range(3) if math.isfinite(caps[r])]
+        W = np.vstack([weights[r] for r in keep])
+        caps = np.array([caps[r] for r in keep])
+
+        # Ordre de branchement : efficacité relative aux capacités
+        order = np.argsort(-(roi / (W / caps[:, None]).sum(axis=0)), kind="mergesort")
+        roi, W, eligible = roi[order], W[:, order], eligible[order]
+        n = roi.size
+
+        def bound(i, room, lam):
+            r, w = roi[i:], W[:, i:]
+            lam = lam.copy()
+            for k in range(lam.size):
+                # min_x x·room_k + Σ max(0, a_j - x·w_kj) : x = point de rupture où la pente devient positive
+                a = r - lam @ w + lam[k] * w[k]
+                active = (w[k] > 0) & (a > 0)
+                t = a[active] / w[k][active]
+                o = np.argsort(-t, kind="stable")
+                t, cum = t[o], np.cumsum(w[k][active][o])
+                j = int(np.searchsorted(cum, room[k], side="right"))
+                lam[k] = t[j] if j < t.size else 0.0
+            value = float(lam @ room + np.maximum(0.0, r - lam @ w).sum())
+            return value, lam
+
+        pos = {int(e): j for j, e in enumerate(eligible)}
+        best = [pos[g] for g in self._greedy(cand)]
+        best_value = float(roi[best].sum()) if best else 0.0
+
+        nodes = 0
+        truncated = False
+        # Pile DFS : (indice suivant, valeur, capacité restante, multiplicateurs du parent, sélection)
+        stack = [(0, 0.0, caps.copy(), np.zeros(caps.size), [])]
+        while stack:
+            i, value, room, lam, picked = stack.pop()
+            nodes += 1
+            if nodes > self.max_nodes:
+                truncated = True
+                break
+            if value > best_value + 1e-9:
+                best_value, best = value, picked
+            if i >= n:
+                continue
+            ub, lam = bound(i, room, lam)
+            if value + ub <= best_value + 1e-9:
+                continue
+            # Branche "exclure" empilée en premier : "inclure" est explorée d'abord
+            stack.append((i + 1, value, room, lam, picked))
+            new_room = room - W[:, i]
+            if (new_room >= -1e-9).all():
+                stack.append((i + 1, value + roi[i], new_room, lam, picked + [i]))
+
+        if truncated:
+            logger.warning("Exact scheduler stopped after %d nodes; returning best plan found so far", self.max_nodes)
+        return sorted(int(eligible[j]) for j in best)
+
+    def optimize(self, deltas: pd.DataFrame, event_col="event", delta_fuel_col="delta_fuel",
+                 default_delta_from_metric="delta_fuel_flow", solver: str = None) -> pd.DataFrame:
+        # Use delta_fuel if present, else derive from delta_fuel_flow
+        if delta_fuel_col not in deltas.columns:
+            if default_delta_from_metric in deltas.columns:
+                deltas[delta_fuel_col] = deltas[default_delta_from_metric]
+            else:
+                deltas[delta_fuel_col] = 0.0
 
-        return pd.DataFrame(chosen)
+        cand = self._candidates(deltas, event_col, delta_fuel_col)
+        solver = solver or self.solver
+        if solver == "greedy":
+            chosen = self._greedy(cand)
+        elif solver == "exact":
+            chosen = self._branch_and_bound(cand)
+        else:
+            raise ValueError(f"Unknown scheduler solver: {solver}")
 
+        return cand.loc[chosen].reset_index(drop=True)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from classes.io.cache import FrameCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def settings_subset(settings: Dict, keys: Sequence[str]) -> Dict:
+    """Valeurs des clés pointées ("economics", "paths.txt_file"…) ; None si absentes."""
+    out = {}
+    for key in keys:
+        value = settings
+        for part in key.split("."):
+            value = value.get(part, _MISSING) if isinstance(value, dict) else _MISSING
+            if value is _MISSING:
+                value = None
+                break
+        out[key] = value
+    return out
+
+
+@dataclass
+class Stage:
+    """
+    Étape nommée : fn(**arguments) → {nom de sortie: DataFrame ou None}.
+    deps associe chaque argument à la sortie (étape, sortie) qui l'alimente ; settings_keys
+    et sources (fichiers) sont les seules parties des settings et du disque que l'étape lit.
+    """
+    name: str
+    fn: Callable[..., Dict[str, Optional[pd.DataFrame]]]
+    deps: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    settings_keys: Sequence[str] = ()
+    sources: Sequence[str] = ()
+    persist: bool = True
+
+
+class StageGraph:
+    """
+    DAG d'étapes mémoïsées sur disque.
+
+    La clé d'une étape est l'empreinte de son nom, du sous-ensemble de settings qu'elle lit,
+    de la signature de ses fichiers sources et des clés de ses dépendances (chaînage à la Merkle :
+    une modification en amont invalide tout l'aval, rien d'autre).
+    Les sorties sont relues à la demande, sortie par sortie : une étape dont la clé n'a pas changé
+    n'est pas exécutée et ses entrées ne sont même pas chargées.
+    Sans cache_dir, les étapes sont simplement exécutées (une fois par run).
+    """
+
+    def __init__(self, settings: Dict, cache_dir=None, fmt: str = "auto", instr=None):
+        self.settings = settings
+        self.cache = FrameCache(cache_dir, fmt=fmt) if cache_dir is not None else None
+        self.index_dir = Path(cache_dir) if cache_dir is not None else None
+        self.instr = instr
+        self.stages: Dict[str, Stage] = {}
+        self._keys: Dict[str, str] = {}
+        self._values: Dict[Tuple[str, str], Optional[pd.DataFrame]] = {}
+        self._index: Dict[str, Optional[Dict]] = {}
+        self.executed = []
+
+    def add(self, name: str, fn: Callable, deps: Dict[str, Tuple[str, str]] = None,
+            settings_keys: Sequence[str] = (), sources: Sequence[str] = (), persist: bool = True) -> "StageGraph":
+        deps = deps or {}
+        unknown = sorted({s for s, _ in deps.values()} - set(self.stages))
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stage(s): {unknown}")
+        self.stages[name] = Stage(name, fn, deps, list(settings_keys), list(sources), persist)
+        return self
+
+    # -- clés ---------------------------------------------------------------
+
+    def key(self, name: str) -> str:
+        if name not in self._keys:
+            stage = self.stages[name]
+            payload = {
+                "stage": name,
+                "settings": settings_subset(self.settings, stage.settings_keys),
+                "sources": {str(p): self.cache.source_signature(p) if self.cache is not None else None
+                            for p in stage.sources},
+                "deps": {s: self.key(s) for s in sorted({s for s, _ in stage.deps.values()})},
+            }
+            raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+            self._keys[name] = hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+        return self._keys[name]
+
+    def _cached_outputs(self, name: str) -> Optional[Dict[str, bool]]:
+        """Sorties persistées de l'étape si sa clé n'a pas changé, sinon None."""
+        if name not in self._index:
+            entry = None
+            if self.cache is not None and self.stages[name].persist:
+                path = self.index_dir / f"{name}.json"
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    entry = None
+                if entry is not None and entry.get("key") != self.key(name):
+                    entry = None
+            self._index[name] = entry["outputs"] if entry is not None else None
+        return self._index[name]
+
+    # -- exécution ----------------------------------------------------------
+
+    def get(self, name: str, output: str) -> Optional[pd.DataFrame]:
+        """Sortie output de l'étape name : mémoire, puis cache disque, sinon exécution."""
+        if (name, output) in self._values:
+            return self._values[(name, output)]
+
+        outputs = self._cached_outputs(name)
+        if outputs is not None and output in outputs:
+            df = self._load(name, output) if outputs[output] else None
+            if df is not None or not outputs[output]:
+                logger.info("Stage %s: %s reused from cache", name, output)
+                self._values[(name, output)] = df
+                return df
+            self._index[name] = None
+
+        self._run(name)
+        if (name, output) not in self._values:
+            raise KeyError(f"Stage {name} has no output {output}")
+        return self._values[(name, output)]
+
+    def _load(self, name: str, output: str) -> Optional[pd.DataFrame]:
+        if self.instr is None:
+            return self.cache.load(f"{name}.{output}", self.key(name))
+        with self.instr.stage(f"{name}.{output}") as st:
+            df = self.cache.load(f"{name}.{output}", self.key(name))
+            st["cache"] = "hit"
+            st["rows_out"] = df
+        return df
+
+    def outputs(self, name: str, names: Sequence[str]) -> Dict[str, Optional[pd.DataFrame]]:
+        return {o: self.get(name, o) for o in names}
+
+    def run(self, name: str) -> Dict[str, Optional[pd.DataFrame]]:
+        """
+        Exécute l'étape même si sa clé est à jour (effets hors cache perdus, ex. fichiers supprimés)
+        et renvoie ses sorties ; les dépendances restent relues du cache.
+        """
+        self._run(name)
+        return {o: v for (s, o), v in self._values.items() if s == name}
+
+    def _run(self, name: str) -> None:
+        stage = self.stages[name]
+        args = {arg: self.get(s, o) for arg, (s, o) in stage.deps.items()}
+        logger.info("Stage %s: running", name)
+        result = stage.fn(**args)
+        for output, df in result.items():
+            if df is not None and not isinstance(df, pd.DataFrame):
+                raise TypeError(f"Stage {name} output {output} must be a DataFrame or None")
+            self._values[(name, output)] = df
+        self.executed.append(name)
+
+        if self.cache is not None and stage.persist:
+            key = self.key(name)
+            for output, df in result.items():
+                if df is not None:
+                    self.cache.store(f"{name}.{output}", key, df)
+            entry = {"key": key, "outputs": {o: df is not None for o, df in result.items()}}
+            # Index écrit en dernier : une étape interrompue n'est jamais considérée à jour
+            self.cache._write_json_atomic(self.index_dir / f"{name}.json", entry)
+            self._index[name] = entry["outputs"]
@@ -0,0 +1,116 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from classes.analysis.event_history import SameTypeHistory
+from classes.analysis.impact_analysis import (
+    build_event_intervals,
+    compute_non_maintenance_metrics,
+    estimate_type_rates,
+    compute_maintenance_impacts,
+    pool_type_rates
+)
+
+logger = logging.getLogger(__name__)
+
+# Colonnes APM réellement lues par l'analyse d'impact (limite le volume envoyé aux workers)
+ANALYSIS_COLUMNS = ["timestamp", "tail_number", "perf_factor", "fuel_flow"]
+
+
+def analyze_tail(tail: str,
+                 df_txt: pd.DataFrame,
+                 events_df: pd.DataFrame,
+                 settings: Dict) -> Dict[str, pd.DataFrame]:
+    """
+    Chaîne d'analyse complète pour un avion :
+    build_event_intervals → compute_non_maintenance_metrics → estimate_type_rates
+    → compute_maintenance_impacts. Exécutée dans un process worker en mode flotte.
+    """
+    intervals = build_event_intervals(events_df)
+    if intervals.empty:
+        logger.warning("[%s] No intervals could be built.", tail)
+        empty = pd.DataFrame()
+        return {"tail": tail, "non_main": empty, "type_rates": empty, "maint_impacts": empty}
+
+    non_main = compute_non_maintenance_metrics(df_txt, intervals, settings)
+    history = SameTypeHistory(events_df, time_axis=settings["impact"]["time_axis"])
+    type_rates = estimate_type_rates(non_main, events_df, settings, history=history)
+    maint_impacts = compute_maintenance_impacts(events_df, non_main, type_rates, settings, history=history)
+    return {"tail": tail, "non_main": non_main, "type_rates": type_rates, "maint_impacts": maint_impacts}
+
+
+def _analyze_tail_task(args: Tuple[str, pd.DataFrame, pd.DataFrame, Dict]) -> Dict[str, pd.DataFrame]:
+    return analyze_tail(*args)
+
+
+def partition_by_tail(df_txt: pd.DataFrame,
+                      events_df: pd.DataFrame,
+                      tails: List[str] = None) -> List[Tuple[str, pd.DataFrame, pd.DataFrame]]:
+    """Découpe les séries APM et les événements par tail_number (un seul groupby par table)."""
+    cols = [c for c in ANALYSIS_COLUMNS if c in df_txt.columns]
+    txt_groups = dict(tuple(df_txt[cols].groupby("tail_number", sort=False)))
+    ev_groups = dict(tuple(events_df.groupby("tail_number", sort=False)))
+
+    if tails is None:
+        tails = sorted(ev_groups.keys())
+    parts = []
+    for tail in tails:
+        if tail not in ev_groups:
+            logger.warning("[%s] No events for this tail, skipped.", tail)
+            continue
+        txt_tail = txt_groups.get(tail, df_txt[cols].iloc[0:0])
+        parts.append((tail, txt_tail.reset_index(drop=True), ev_groups[tail].reset_index(drop=True)))
+    return parts
+
+
+def run_fleet_analysis(df_txt: pd.DataFrame,
+                       events_df: pd.DataFrame,
+                       settings: Dict) -> Dict[str, pd.DataFrame]:
+    """
+    Mode flotte : exécute l'analyse d'impact de chaque avion sur un pool de processus
+    (settings["fleet"]["max_workers"], défaut = nombre de cœurs), puis fusionne les
+    tables par avion et agrège les taux par type sur toute la flotte.
+    Avec fleet.impact_rates = "pooled", les impacts sont recalculés avec les taux flotte.
+    """
+    fleet_cfg = settings.get("fleet", {})
+    parts = partition_by_tail(df_txt, events_df, tails=fleet_cfg.get("tails"))
+    if not parts:
+        raise ValueError("Fleet mode: no tail with events to analyze.")
+
+    max_workers = fleet_cfg.get("max_workers") or os.cpu_count() or 1
+    max_workers = max(1, min(int(max_workers), len(parts)))
+    logger.info("Fleet analysis on %d tails with %d worker(s)", len(parts), max_workers)
+
+    tasks = [(tail, txt, ev, settings) for tail, txt, ev in parts]
+    if max_workers == 1:
+        results = [_analyze_tail_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_analyze_tail_task, tasks))
+
+    for r in results:
+        logger.info("[%s] intervals: %d | modeled impacts: %d",
+                    r["tail"], r["non_main"].shape[0], r["maint_impacts"].shape[0])
+
+    non_main = pd.concat([r["non_main"] for r in results if not r["non_main"].empty], ignore_index=True) \
+        if any(not r["non_main"].empty for r in results) else pd.DataFrame()
+    per_tail_rates = [r["type_rates"].assign(tail_number=r["tail"]) for r in results if not r["type_rates"].empty]
+    type_rates = pool_type_rates(per_tail_rates)
+
+    if fleet_cfg.get("impact_rates", "pooled") == "pooled" and not non_main.empty:
+        all_events = pd.concat([ev for _, _, ev in parts], ignore_index=True)
+        history = SameTypeHistory(all_events, time_axis=settings["impact"]["time_axis"])
+        maint_impacts = compute_maintenance_impacts(all_events, non_main, type_rates, settings, history=history)
+    else:
+        impacts = [r["maint_impacts"] for r in results if not r["maint_impacts"].empty]
+        maint_impacts = pd.concat(impacts, ignore_index=True) if impacts else pd.DataFrame()
+
+    return {
+        "non_main": non_main,
+        "type_rates": type_rates,
+        "type_rates_by_tail": pd.concat(per_tail_rates, ignore_index=True) if per_tail_rates else pd.DataFrame(),
+        "maint_impacts": maint_impacts,
+    }
@@ -0,0 +1,424 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from classes.analysis.event_history import SameTypeHistory
+from classes.analysis.impact_analysis import (
+    build_event_intervals,
+    compute_non_maintenance_metrics,
+    estimate_type_rates,
+    compute_maintenance_impacts
+)
+from classes.io.cache import read_npy_columns, write_npy_columns
+from classes.io.data_loader import load_txt_appended
+from classes.pipeline.dag import settings_subset
+from classes.processing.cleaning import DataCleaner
+
+logger = logging.getLogger(__name__)
+
+# Colonnes APM conservées dans l'état incrémental (celles lues par l'analyse d'impact)
+STATE_METRICS = ["perf_factor", "fuel_flow"]
+# Colonnes d'événements lues par les intervalles et l'historique par type
+EVENT_COLUMNS = ["date", "event", "tail_number"]
+INTERVAL_KEY = ["tail_number", "event_date", "event_name", "prev_event_date", "next_event_date"]
+# Settings qui façonnent les données ingérées (lecture, mapping, nettoyage, croisière stabilisée,
+# compaction…) et l'analyse : en changer une invalide l'état, dont les partitions et résultats
+# ont été calculés avec les anciennes valeurs
+STATE_SETTINGS_KEYS = ["txt_read", "columns_mapping", "events", "excel_sheets_priority", "schema", "cleaning",
+                       "steady_state", "memory", "apm.engines", "impact"]
+# Settings qui façonnent le TXT nettoyé conservé par IncrementalIngest (lecture, mapping, prepare_txt)
+INGEST_SETTINGS_KEYS = ["paths.data_dir", "paths.txt_file", "txt_read", "columns_mapping", "schema", "cleaning",
+                        "apm.engines"]
+# Sous-dossier de l'état réservé à l'ingestion (conservé quand seule l'analyse est reconstruite)
+INGEST_DIR = "ingest"
+# Taille des blocs (début du fichier, fin de la partie déjà lue) dont l'empreinte vérifie que le TXT
+# n'a été que complété depuis le dernier run
+INGEST_PROBE_BYTES = 1 << 16
+
+
+def _settings_hash(settings: Dict, keys: List[str]) -> str:
+    return hashlib.blake2b(
+        json.dumps(settings_subset(settings, keys), sort_keys=True, default=str).encode("utf-8"),
+        digest_size=16
+    ).hexdigest()
+
+
+def build_intervals_by_tail(events_df: pd.DataFrame) -> pd.DataFrame:
+    """build_event_intervals appliqué tail par tail (prev/next ne traversent pas les avions)."""
+    parts = [build_event_intervals(g) for _, g in events_df.groupby("tail_number", sort=True)]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=["event_idx", "event_date", "prev_event_date",
+                                     "next_event_date", "event_name", "tail_number"])
+    return pd.concat(parts, ignore_index=True)
+
+
+class IncrementalIngest:
+    """
+    Ingestion incrémentale du TXT APM (mode incrémental), supposé complété par ajout de lignes.
+
+    state_dir/ingest contient le TXT déjà nettoyé (sortie de prepare_txt), en partitions .npy
+    ajoutées à chaque run, et un curseur : offset (octets) de la dernière ligne lue, empreintes
+    du début du fichier et du bloc qui précède l'offset. update ne lit et ne nettoie que les
+    octets postérieurs à l'offset, puis renvoie tout l'historique nettoyé.
+    Un TXT réécrit (plus court, empreintes différentes) entraîne la reconstruction de tout l'état
+    incrémental, analyse comprise ; une colonne dont les nouvelles lignes changent le type
+    (texte dans une colonne numérique) entraîne une relecture complète du TXT.
+    """
+
+    def __init__(self, state_dir, settings: Dict, txt_file):
+        self.state_dir = Path(state_dir)
+        self.ingest_dir = self.state_dir / INGEST_DIR
+        self.cursor_path = self.ingest_dir / "cursor.json"
+        self.txt_file = Path(txt_file)
+        self.settings = settings
+        self.settings_hash = _settings_hash(settings, INGEST_SETTINGS_KEYS)
+
+    def _empty_cursor(self) -> Dict:
+        return {"settings_hash": self.settings_hash, "offset": 0, "head": None, "tail": None, "parts": []}
+
+    def _probe(self, end: int) -> List[str]:
+        """Empreintes du début du fichier et du bloc qui précède end."""
+        with open(self.txt_file, "rb") as f:
+            head = f.read(min(end, INGEST_PROBE_BYTES))
+            f.seek(max(0, end - INGEST_PROBE_BYTES))
+            tail = f.read(end - max(0, end - INGEST_PROBE_BYTES))
+        return [hashlib.blake2b(head, digest_size=16).hexdigest(), hashlib.blake2b(tail, digest_size=16).hexdigest()]
+
+    def _load_cursor(self) -> Dict:
+        if not self.cursor_path.exists():
+            return self._empty_cursor()
+        with open(self.cursor_path, "r", encoding="utf-8") as f:
+            cursor = json.load(f)
+        if cursor.get("settings_hash") != self.settings_hash:
+            logger.info("Ingestion settings changed since last incremental run: TXT re-ingested")
+            return self._empty_cursor()
+        offset = int(cursor["offset"])
+        if self.txt_file.stat().st_size < offset or self._probe(offset) != [cursor["head"], cursor["tail"]]:
+            # Lignes déjà ingérées modifiées : partitions APM et résultats de l'analyse sont périmés
+            logger.info("TXT rewritten since last incremental run (not only appended): full rebuild")
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+            return self._empty_cursor()
+        return cursor
+
+    def _read_parts(self, parts: List[str]) -> pd.DataFrame:
+        frames = [read_npy_columns(self.ingest_dir / name) for name in parts]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        # Catégories propres à chaque partition : concat repasse en object, on recatégorise
+        for col in df.columns:
+            if isinstance(frames[0][col].dtype, pd.CategoricalDtype) and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        return df
+
+    @staticmethod
+    def _align_types(txt: pd.DataFrame, base: pd.DataFrame) -> bool:
+        """
+        Convertit les colonnes lues en texte qui sont numériques dans l'historique, comme l'aurait
+        fait read_csv sur tout le fichier. False si une valeur non numérique l'en empêche.
+        """
+        for col in txt.columns.intersection(base.columns):
+            if pd.api.types.is_numeric_dtype(base[col]) and not pd.api.types.is_numeric_dtype(txt[col]):
+                try:
+                    txt[col] = pd.to_numeric(txt[col])
+                except (TypeError, ValueError):
+                    return False
+        return True
+
+    def update(self, clean: Callable[[pd.DataFrame], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Lit les lignes ajoutées au TXT depuis le dernier run (load_txt_appended), les nettoie
+        avec clean (prepare_txt), les ajoute à l'historique et renvoie tout le TXT nettoyé,
+        trié par timestamp.
+        """
+        cursor = self._load_cursor()
+        base = self._read_parts(cursor["parts"])
+        # Après le premier run, lignes lues en texte : types alignés ensuite sur l'historique
+        txt, end = load_txt_appended(str(self.txt_file), self.settings["txt_read"], self.settings["columns_mapping"],
+                                     offset=cursor["offset"], as_text=not base.empty)
+        txt = clean(txt) if not txt.empty else txt
+        if not base.empty and not txt.empty and not self._align_types(txt, base):
+            logger.info("Appended TXT rows change a numeric column to text: TXT re-ingested")
+            cursor, base = self._empty_cursor(), pd.DataFrame()
+            txt, end = load_txt_appended(str(self.txt_file), self.settings["txt_read"],
+                                         self.settings["columns_mapping"])
+            txt = clean(txt) if not txt.empty else txt
+        logger.info("Incremental ingest: %d new TXT rows (bytes %d -> %d)", txt.shape[0], cursor["offset"], end)
+
+        if cursor["offset"] == 0:
+            # Première ingestion ou reconstruction : les anciennes partitions sont abandonnées
+            shutil.rmtree(self.ingest_dir, ignore_errors=True)
+        self.ingest_dir.mkdir(parents=True, exist_ok=True)
+
+        fresh = txt
+        if not base.empty and not txt.empty:
+            # Doublons (tail, timestamp) avec l'historique : la ligne déjà ingérée est conservée
+            recent = base[base["timestamp"] >= txt["timestamp"].min()]
+            both = DataCleaner().remove_duplicates(pd.concat([recent, txt], ignore_index=True))
+            fresh = txt.iloc[both.index[both.index >= len(recent)] - len(recent)]
+
+        if not fresh.empty:
+            name = f"txt-{len(cursor['parts']) + 1:06d}"
+            folder = Path(tempfile.mkdtemp(dir=self.ingest_dir, prefix=".tmp-"))
+            write_npy_columns(folder, fresh.reset_index(drop=True))
+            target = self.ingest_dir / name
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(folder, target)
+            cursor["parts"].append(name)
+
+        cursor["offset"] = end
+        cursor["head"], cursor["tail"] = self._probe(end)
+        tmp = self.cursor_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cursor, f, indent=2)
+        os.replace(tmp, self.cursor_path)
+
+        frames = [df for df in (base, fresh) if not df.empty]
+        if not frames:
+            return txt
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if not df["timestamp"].is_monotonic_increasing:
+            df = df.sort_values("timestamp", kind="mergesort")
+        return df.reset_index(drop=True)
+
+
+class IncrementalAnalysis:
+    """
+    Mode incrémental de l'analyse d'impact.
+
+    L'état persisté (settings["incremental"]["state_dir"]) contient :
+      - les résultats par intervalle de compute_non_maintenance_metrics
+      - l'historique des événements
+      - les mesures APM utiles, en partitions ajoutées à chaque run (une par run),
+        triées par (tail, timestamp) et relues par mmap + searchsorted
+      - un watermark par tail (dernier timestamp APM, dernière date d'événement)
+    À chaque run, seules les mesures et événements postérieurs au watermark sont
+    ingérés, et seuls les intervalles dont la plage [prev_event_date, next_event_date)
+    (étendue à la fenêtre de stabilisation) recoupe ces nouvelles données sont recalculés.
+    Les taux par type et les impacts sont ensuite rafraîchis depuis la table mise à jour.
+    Les données antérieures au watermark (corrections rétroactives) ne sont pas relues :
+    supprimer le dossier d'état force une reconstruction complète (automatique quand
+    IncrementalIngest détecte un TXT réécrit, pas pour les événements du classeur).
+    """
+
+    def __init__(self, state_dir, settings: Dict):
+        self.state_dir = Path(state_dir)
+        self.settings = settings
+        self.manifest_path = self.state_dir / "manifest.json"
+        self.settings_hash = _settings_hash(settings, STATE_SETTINGS_KEYS)
+
+    # -- état ----------------------------------------------------------------
+
+    def _empty_manifest(self) -> Dict:
+        return {"settings_hash": self.settings_hash, "watermarks": {}, "partitions": [], "metrics": []}
+
+    def _load_manifest(self) -> Dict:
+        if not self.manifest_path.exists():
+            return self._empty_manifest()
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("settings_hash") != self.settings_hash:
+            logger.info("Ingestion or impact settings changed since last incremental run: full rebuild")
+            # Le TXT nettoyé (INGEST_DIR) a sa propre empreinte et reste utilisable
+            for entry in self.state_dir.iterdir():
+                if entry.name == INGEST_DIR:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    entry.unlink(missing_ok=True)
+            return self._empty_manifest()
+        return manifest
+
+    def _read_table(self, name: str) -> Optional[pd.DataFrame]:
+        path = self.state_dir / name
+        return read_npy_columns(path) if path.exists() else None
+
+    def _write_table(self, name: str, df: pd.DataFrame) -> None:
+        path = self.state_dir / name
+        tmp = Path(tempfile.mkdtemp(dir=self.state_dir, prefix=".tmp-"))
+        write_npy_columns(tmp, df)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    def _write_partition(self, df: pd.DataFrame, metrics: List[str], seq: int) -> Optional[Dict]:
+        """Ajoute une partition APM triée par (tail, timestamp) avec ses offsets par tail."""
+        if df.empty:
+            return None
+        df = df.sort_values(["tail_number", "timestamp"], kind="mergesort")
+        name = f"apm-{seq:06d}"
+        folder = Path(tempfile.mkdtemp(dir=self.state_dir, prefix=".tmp-"))
+        np.save(folder / "timestamp.npy", df["timestamp"].to_numpy(dtype="datetime64[ns]"))
+        for m in metrics:
+            np.save(folder / f"{m}.npy", df[m].to_numpy(dtype=float))
+
+        tails = {}
+        codes, uniques = pd.factorize(df["tail_number"].astype(str), sort=False)
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(df)]])
+        ts = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+        for s, e in zip(starts, ends):
+            tails[str(uniques[codes[s]])] = [int(s), int(e), str(ts[s]), str(ts[e - 1])]
+        # Une partition orpheline (run interrompu avant le manifest) est écrasée
+        target = self.state_dir / name
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(folder, target)
+        return {"dir": name, "tails": tails}
+
+    def _read_range(self, manifest: Dict, tail: str, start, end) -> pd.DataFrame:
+        """Mesures APM d'un tail sur [start, end), en ne lisant que les partitions concernées."""
+        metrics = manifest["metrics"]
+        start = np.datetime64(pd.Timestamp(start), "ns")
+        end = np.datetime64(pd.Timestamp(end), "ns")
+        frames = []
+        for part in manifest["partitions"]:
+            info = part["tails"].get(tail)
+            if info is None:
+                continue
+            i0, i1, t_min, t_max = info
+            if np.datetime64(t_max, "ns") < start or np.datetime64(t_min, "ns") >= end:
+                continue
+            folder = self.state_dir / part["dir"]
+            ts = np.load(folder / "timestamp.npy", mmap_mode="r")[i0:i1]
+            j0 = int(np.searchsorted(ts, start, side="left"))
+            j1 = int(np.searchsorted(ts, end, side="left"))
+            data = {"timestamp": np.array(ts[j0:j1])}
+            for m in metrics:
+                data[m] = np.array(np.load(folder / f"{m}.npy", mmap_mode="r")[i0 + j0:i0 + j1])
+            frames.append(pd.DataFrame(data))
+        if not frames:
+            return pd.DataFrame(columns=["timestamp"] + metrics)
+        df = pd.concat(frames, ignore_index=True)
+        df["tail_number"] = tail
+        return df
+
+    # -- run -----------------------------------------------------------------
+
+    @staticmethod
+    def _past_watermark(values: pd.Series, tails: pd.Series, watermarks: Dict, key: str) -> np.ndarray:
+        wm = tails.astype(str).map({t: w.get(key) for t, w in watermarks.items()})
+        wm = pd.to_datetime(wm)
+        return (wm.isna() | (pd.to_datetime(values) > wm)).to_numpy()
+
+    def run(self, df_txt: pd.DataFrame, events_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Met à jour l'état avec les nouvelles données et renvoie
+        (non_main, type_rates, maint_impacts) sur tout l'historique.
+        """
+        manifest = self._load_manifest()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        watermarks = manifest["watermarks"]
+        impact_cfg = self.settings["impact"]
+
+        metrics = manifest["metrics"] or [m for m in STATE_METRICS if m in df_txt.columns]
+        manifest["metrics"] = metrics
+        tails = sorted(events_df["tail_number"].astype(str).unique())
+
+        txt = df_txt[df_txt["tail_number"].astype(str).isin(tails)]
+        txt = txt[["timestamp", "tail_number"] + metrics].dropna(subset=["timestamp"])
+        new_txt = txt[self._past_watermark(txt["timestamp"], txt["tail_number"], watermarks, "txt")]
+        new_txt = new_txt.assign(tail_number=new_txt["tail_number"].astype(str))
+        events_df = events_df[EVENT_COLUMNS]
+        new_events = events_df[self._past_watermark(events_df["date"], events_df["tail_number"], watermarks, "events")]
+
+        old_events = self._read_table("events")
+        old_non_main = self._read_table("non_main")
+        all_events = pd.concat([new_events] if old_events is None else [old_events, new_events], ignore_index=True)
+        all_events = all_events.assign(tail_number=all_events["tail_number"].astype(str))
+        all_events = all_events.sort_values("date", kind="mergesort").reset_index(drop=True)
+        logger.info("Incremental run: %d new APM records, %d new events", new_txt.shape[0], new_events.shape[0])
+
+        intervals = build_intervals_by_tail(all_events)
+
+        # Plage de données lue par chaque intervalle : [prev (ou fallback), max(next, event + stabilisation))
+        fallback = pd.Timedelta(days=int(impact_cfg["fallback_baseline_days"]))
+        window = pd.Timedelta(days=int(impact_cfg["stabilization_window_days"]))
+        ev_date = pd.to_datetime(intervals["event_date"])
+        range_start = pd.to_datetime(intervals["prev_event_date"]).fillna(ev_date - fallback)
+        range_end = np.maximum(pd.to_datetime(intervals["next_event_date"]), ev_date + window)
+
+        affected = np.ones(len(intervals), dtype=bool)
+        if old_non_main is not None and not old_non_main.empty:
+            # Intervalles inchangés (mêmes bornes) déjà calculés
+            known = old_non_main[INTERVAL_KEY].assign(_known=True)
+            known["tail_number"] = known["tail_number"].astype(str)
+            probe = intervals[INTERVAL_KEY].assign(tail_number=intervals["tail_number"].astype(str))
+            merged = probe.merge(known, on=INTERVAL_KEY, how="left")
+            affected = merged["_known"].isna().to_numpy(copy=True)
+
+            # ... sauf s'ils recoupent des mesures nouvelles
+            if not new_txt.empty:
+                span = new_txt.groupby("tail_number")["timestamp"].agg(["min", "max"])
+                t_new_min = intervals["tail_number"].astype(str).map(span["min"])
+                t_new_max = intervals["tail_number"].astype(str).map(span["max"])
+                overlap = (range_start <= t_new_max) & (range_end > t_new_min)
+                affected |= overlap.fillna(False).to_numpy()
+
+        to_compute = intervals[affected]
+        logger.info("Incremental run: recomputing %d / %d intervals", int(affected.sum()), len(intervals))
+
+        recomputed = []
+        for tail, grp in to_compute.groupby(to_compute["tail_number"].astype(str)):
+            lo, hi = range_start[grp.index].min(), range_end[grp.index].max()
+            old_txt = self._read_range(manifest, tail, lo, hi)
+            fresh = new_txt[(new_txt["tail_number"] == tail)
+                            & (new_txt["timestamp"] >= lo) & (new_txt["timestamp"] < hi)]
+            seg_txt = fresh if old_txt.empty else pd.concat([old_txt, fresh], ignore_index=True)
+            recomputed.append(compute_non_maintenance_metrics(seg_txt, grp, self.settings))
+
+        kept = []
+        if old_non_main is not None and not old_non_main.empty:
+            old = old_non_main.assign(tail_number=old_non_main["tail_number"].astype(str))
+            keep_keys = intervals.loc[~affected, INTERVAL_KEY].assign(tail_number=lambda d: d["tail_number"].astype(str))
+            kept.append(old.merge(keep_keys, on=INTERVAL_KEY, how="inner"))
+
+        frames = [df for df in kept + recomputed if not df.empty]
+        non_main = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if not non_main.empty:
+            # event_idx suit la numérotation des intervalles reconstruits
+            idx = intervals[INTERVAL_KEY + ["event_idx"]].assign(tail_number=lambda d: d["tail_number"].astype(str))
+            non_main = non_main.drop(columns=["event_idx"]).merge(idx, on=INTERVAL_KEY, how="left")
+            non_main = non_main.sort_values(["tail_number", "event_idx"]).reset_index(drop=True)
+            non_main = non_main[["event_idx"] + [c for c in non_main.columns if c != "event_idx"]]
+
+        # Persistance : partition APM du run, événements, résultats par intervalle, watermarks
+        part = self._write_partition(new_txt, metrics, seq=len(manifest["partitions"]) + 1)
+        if part is not None:
+            manifest["partitions"].append(part)
+        self._write_table("events", all_events)
+        if not non_main.empty:
+            self._write_table("non_main", non_main)
+        for tail in tails:
+            wm = watermarks.setdefault(tail, {})
+            t_max = txt.loc[txt["tail_number"].astype(str) == tail, "timestamp"].max()
+            e_max = all_events.loc[all_events["tail_number"] == tail, "date"].max()
+            if pd.notna(t_max):
+                wm["txt"] = max(str(pd.Timestamp(t_max)), wm.get("txt", ""))
+            if pd.notna(e_max):
+                wm["events"] = max(str(pd.Timestamp(e_max)), wm.get("events", ""))
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+        if non_main.empty:
+            return non_main, pd.DataFrame(), pd.DataFrame()
+
+        # Taux par type et impacts rafraîchis depuis la table mise à jour
+        history = SameTypeHistory(all_events, time_axis=impact_cfg["time_axis"])
+        type_rates = estimate_type_rates(non_main, all_events, self.settings, history=history)
+        maint_impacts = compute_maintenance_impacts(all_events, non_main, type_rates, self.settings, history=history)
+        return non_main, type_rates, maint_impacts
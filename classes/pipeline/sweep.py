@@ -0,0 +1,116 @@
+import copy
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Union
+
+import pandas as pd
+
+from classes.analysis.event_history import SameTypeHistory
+from classes.analysis.impact_analysis import (
+    compute_non_maintenance_metrics,
+    estimate_type_rates,
+    compute_maintenance_impacts,
+    summarize_global
+)
+from classes.analysis.series_store import SeriesStore
+from classes.pipeline.fleet import ANALYSIS_COLUMNS
+from classes.pipeline.incremental import build_intervals_by_tail
+
+logger = logging.getLogger(__name__)
+
+# État partagé d'un worker : construit une seule fois par processus (initializer du pool)
+_STATE: Dict = {}
+
+
+def expand_grid(grid: Union[Dict[str, list], List[Dict]]) -> List[Dict]:
+    """Grille {paramètre: [valeurs]} → liste des combinaisons (produit cartésien) ; une liste est gardée telle quelle."""
+    if isinstance(grid, list):
+        return [dict(p) for p in grid]
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _init_state(store: SeriesStore, txt_columns: pd.DataFrame, intervals: pd.DataFrame,
+                events_df: pd.DataFrame, settings: Dict) -> None:
+    _STATE.clear()
+    _STATE.update(store=store, txt_columns=txt_columns, intervals=intervals,
+                  events=events_df, settings=settings, histories={})
+
+
+def evaluate_point(params: Dict) -> Dict[str, pd.DataFrame]:
+    """
+    Analyse d'impact pour une combinaison de paramètres, sur l'état partagé :
+    index temporel (SeriesStore), intervalles et historique par type ne sont pas reconstruits.
+    """
+    settings = copy.deepcopy(_STATE["settings"])
+    settings["impact"].update(params)
+    time_axis = settings["impact"]["time_axis"]
+    histories = _STATE["histories"]
+    if time_axis not in histories:
+        histories[time_axis] = SameTypeHistory(_STATE["events"], time_axis=time_axis)
+    history = histories[time_axis]
+
+    non_main = compute_non_maintenance_metrics(_STATE["txt_columns"], _STATE["intervals"], settings,
+                                               store=_STATE["store"])
+    type_rates = estimate_type_rates(non_main, _STATE["events"], settings, history=history)
+    maint_impacts = compute_maintenance_impacts(_STATE["events"], non_main, type_rates, settings, history=history)
+
+    summary = summarize_global(non_main, type_rates, maint_impacts)
+    summary.insert(0, "n_intervals", int(non_main.shape[0]))
+    return {"params": params, "summary": summary, "type_rates": type_rates}
+
+
+def run_impact_sweep(df_txt: pd.DataFrame,
+                     events_df: pd.DataFrame,
+                     settings: Dict,
+                     grid: Union[Dict[str, list], List[Dict]],
+                     max_workers: int = None) -> Dict[str, pd.DataFrame]:
+    """
+    Évalue une grille de paramètres settings["impact"] en une seule invocation.
+    Données chargées et nettoyées une fois par l'appelant ; l'index temporel, les intervalles
+    et l'historique par type sont construits une fois puis partagés. Les combinaisons,
+    indépendantes, sont réparties sur un pool de processus (état envoyé une fois par worker).
+    Renvoie deux tables tidy, une ligne par combinaison (et par type pour les taux) :
+      - "summary" : paramètres + synthèse summarize_global (intervalles valides, impacts moyens…)
+      - "type_rates" : paramètres + rate_mean / rate_std / n par type
+    """
+    points = expand_grid(grid)
+    unknown = sorted({k for p in points for k in p} - set(settings["impact"]))
+    if unknown:
+        raise ValueError(f"Unknown impact settings in sweep grid: {unknown}")
+    if not points:
+        return {"summary": pd.DataFrame(), "type_rates": pd.DataFrame()}
+
+    metric = "perf_factor" if "perf_factor" in df_txt.columns else "fuel_flow"
+    store = SeriesStore.from_frame(df_txt, metrics=[metric])
+    txt_columns = df_txt[[c for c in ANALYSIS_COLUMNS if c in df_txt.columns]].iloc[0:0]
+    intervals = build_intervals_by_tail(events_df)
+    state = (store, txt_columns, intervals, events_df, settings)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = max(1, min(int(max_workers), len(points)))
+    logger.info("Impact sweep: %d combinations on %d intervals with %d worker(s)",
+                len(points), intervals.shape[0], max_workers)
+
+    if max_workers == 1:
+        _init_state(*state)
+        results = [evaluate_point(p) for p in points]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_state, initargs=state) as pool:
+            results = list(pool.map(evaluate_point, points))
+
+    summaries, rates = [], []
+    for i, r in enumerate(results):
+        keys = {"combination": i, **r["params"]}
+        summaries.append(r["summary"].assign(**keys))
+        if not r["type_rates"].empty:
+            rates.append(r["type_rates"].assign(**keys))
+
+    param_cols = ["combination"] + list(dict.fromkeys(k for p in points for k in p))
+    summary = pd.concat(summaries, ignore_index=True)
+    summary = summary[param_cols + [c for c in summary.columns if c not in param_cols]]
+    type_rates = pd.concat(rates, ignore_index=True) if rates else pd.DataFrame(columns=param_cols)
+    type_rates = type_rates[param_cols + [c for c in type_rates.columns if c not in param_cols]]
+    return {"summary": summary, "type_rates": type_rates}
@@ -1,6 +1,8 @@
 import pandas as pd
 import logging
 
+from classes.processing.timestamp_parser import TimestampParser
+
 logger = logging.getLogger(__name__)
 
 class DataCleaner:
@@ -25,25 +27,24 @@ class DataCleaner:
                 df[f"{m}_isna"] = df[m].isna()
         return df
 
-    def build_timestamp(self, df: pd.DataFrame, date_col="recorded_date", time_col="time") -> pd.DataFrame:
+    def build_timestamp(self, df: pd.DataFrame, date_col="recorded_date", time_col="time",
+                        date_formats=None) -> pd.DataFrame:
+        # Parsing mémoïsé : une date distincte = un parse ; déjà datetime → pas de repassage par str
+        parser = TimestampParser(date_formats=date_formats, dayfirst=True)
         if date_col in df.columns and time_col in df.columns:
             try:
-                df["timestamp"] = pd.to_datetime(
-                    df[date_col].astype(str) + " " + df[time_col].astype(str),
-                    errors="coerce",
-                    dayfirst=True
-                )
+                df["timestamp"] = parser.combine(df[date_col], df[time_col])
             except Exception:
-                df["timestamp"] = pd.to_datetime(df[date_col], errors="coerce", dayfirst=True)
+                df["timestamp"] = parser.parse_dates(df[date_col])
         elif date_col in df.columns:
-            df["timestamp"] = pd.to_datetime(df[date_col], errors="coerce", dayfirst=True)
+            df["timestamp"] = parser.parse_dates(df[date_col])
 
         # ⚠️ Correction: ne pas dropper toutes les lignes ici
         # On garde les NaT pour analyse ultérieure
         logger.info("build_timestamp: %d timestamps valides / %d lignes", df["timestamp"].notna().sum(), df.shape[0])
         return df
 
-    def clean_numeric_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+    def clean_numeric_columns(self, df: pd.DataFrame, extra_cols=()) -> pd.DataFrame:
         if "perf_factor" in df.columns:
             df["perf_factor"] = (
                 df["perf_factor"].astype(str)
@@ -60,6 +61,11 @@ class DataCleaner:
             )
             df["fuel_flow"] = pd.to_numeric(df["fuel_flow"], errors="coerce")
 
+        # Colonnes supplémentaires (ex. métriques par moteur) : simple conversion, sans suppression de lignes
+        for c in extra_cols:
+            if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+                df[c] = pd.to_numeric(df[c].astype(str).str.replace(",", ".", regex=False), errors="coerce")
+
         # ⚠️ Correction: drop uniquement si fuel_flow est NaN
         before = df.shape[0]
         df = df.dropna(subset=["fuel_flow"])
@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Indicateurs booléens de DataCleaner regroupés dans un octet : nom → bit
+QUALITY_FLAGS = {"is_year_plausible": 0, "perf_factor_isna": 1, "fuel_flow_isna": 2}
+QUALITY_FLAGS_COLUMN = "quality_flags"
+
+
+def pack_flags(df: pd.DataFrame, flags: Dict[str, int] = None, column: str = QUALITY_FLAGS_COLUMN) -> pd.DataFrame:
+    """Remplace les colonnes booléennes de flags par un entier uint8 (un bit par indicateur)."""
+    flags = flags or QUALITY_FLAGS
+    present = [name for name in flags if name in df.columns]
+    if not present:
+        return df
+    packed = np.zeros(df.shape[0], dtype=np.uint8)
+    for name in present:
+        packed |= df[name].to_numpy(dtype=bool).astype(np.uint8) << np.uint8(flags[name])
+    return df.drop(columns=present).assign(**{column: packed})
+
+
+def flag(df: pd.DataFrame, name: str, flags: Dict[str, int] = None, column: str = QUALITY_FLAGS_COLUMN) -> pd.Series:
+    """Lit un indicateur : colonne booléenne si elle existe, sinon bit de la colonne compacte."""
+    if name in df.columns:
+        return df[name].astype(bool)
+    bit = (flags or QUALITY_FLAGS)[name]
+    return pd.Series((df[column].to_numpy() >> np.uint8(bit)) & 1, index=df.index).astype(bool)
+
+
+def bytes_per_record(df: pd.DataFrame) -> float:
+    """Empreinte mémoire moyenne d'une ligne (colonnes + index, chaînes comprises)."""
+    if df.shape[0] == 0:
+        return 0.0
+    return float(df.memory_usage(deep=True).sum()) / df.shape[0]
+
+
+class FrameCompactor:
+    """
+    Représentation compacte des frames APM et événements :
+      - identifiants (chaînes peu distinctes) encodés en category (dictionnaire + codes entiers)
+      - float64 → float32 quand l'écart relatif reste sous float32_rtol (les statistiques
+        de segments restent calculées en float64)
+      - entiers réduits au plus petit type qui contient leurs valeurs
+      - indicateurs booléens de qualité regroupés en bits (quality_flags)
+      - colonnes non lues par le pipeline supprimées si drop_unmapped
+    Les conversions remplacent les colonnes une à une sans copier le reste de la frame.
+    """
+
+    def __init__(self, float32_rtol: float = 1e-6, category_max_ratio: float = 0.5,
+                 keep_columns: Optional[Iterable[str]] = None):
+        self.float32_rtol = float(float32_rtol)
+        self.category_max_ratio = float(category_max_ratio)
+        self.keep_columns = set(keep_columns) if keep_columns is not None else None
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> "FrameCompactor":
+        cfg = settings.get("memory", {})
+        keep = None
+        if cfg.get("drop_unmapped", True):
+            schema = settings.get("schema", {})
+            keep = set(settings["columns_mapping"]["txt"].values()) | set(schema.get("txt_required", [])) \
+                | {c.strip().lower().replace(" ", "_") for c in schema.get("txt_optional", [])} \
+                | {"timestamp", QUALITY_FLAGS_COLUMN}
+        return cls(float32_rtol=cfg.get("float32_rtol", 1e-6),
+                   category_max_ratio=cfg.get("category_max_ratio", 0.5),
+                   keep_columns=keep)
+
+    def _float32_ok(self, x: np.ndarray) -> bool:
+        x32 = x.astype(np.float32)
+        finite = np.isfinite(x)
+        if not np.array_equal(finite, np.isfinite(x32)):
+            return False  # dépassement de la plage float32
+        with np.errstate(invalid="ignore", divide="ignore"):
+            err = np.abs(x32[finite].astype(np.float64) - x[finite])
+            return bool((err <= self.float32_rtol * np.abs(x[finite])).all())
+
+    def _compact_column(self, s: pd.Series) -> pd.Series:
+        if pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype) \
+                or pd.api.types.is_datetime64_any_dtype(s):
+            return s
+        if pd.api.types.is_float_dtype(s):
+            x = s.to_numpy(dtype=np.float64)
+            return s.astype(np.float32) if s.dtype != np.float32 and self._float32_ok(x) else s
+        if pd.api.types.is_unsigned_integer_dtype(s):
+            return pd.to_numeric(s, downcast="unsigned")   # quality_flags reste un octet non signé
+        if pd.api.types.is_integer_dtype(s):
+            return pd.to_numeric(s, downcast="integer")
+        if pd.api.types.is_string_dtype(s) or s.dtype == object:
+            n_unique = s.nunique(dropna=True)
+            if n_unique <= self.category_max_ratio * max(len(s), 1):
+                return s.astype("category")
+        return s
+
+    def compact(self, df: pd.DataFrame, columns: Sequence[str] = None, keep_columns: Iterable[str] = None,
+                label: str = "frame") -> pd.DataFrame:
+        """
+        Frame compacte (mêmes lignes, même index) ; columns restreint les colonnes converties,
+        keep_columns supprime toutes les autres.
+        """
+        before = bytes_per_record(df)
+        df = pack_flags(df)   # avant le filtre keep_columns, qui ne liste que quality_flags
+        if keep_columns is not None:
+            keep = set(keep_columns)
+            drop = [c for c in df.columns if c not in keep]
+            if drop:
+                df = df.drop(columns=drop)
+        targets = [c for c in (columns if columns is not None else df.columns) if c in df.columns]
+        converted = {}
+        for c in dict.fromkeys(targets):
+            if isinstance(df[c], pd.DataFrame):
+                continue  # nom de colonne dupliqué : laissé tel quel
+            new = self._compact_column(df[c])
+            if new.dtype != df[c].dtype:
+                converted[c] = new
+        if converted:
+            df = df.assign(**converted)
+        logger.info("Compact %s: %.0f -> %.0f bytes/record (%d rows)", label, before, bytes_per_record(df), df.shape[0])
+        return df
+
+    def compact_txt(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.compact(df, keep_columns=self.keep_columns, label="APM series")
+
+    def compact_events(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Seuls les identifiants : les autres colonnes des feuilles avion sont marginales
+        return self.compact(df, columns=["tail_number", "event", "event_name"], label="events")
@@ -1,24 +1,180 @@
+import numpy as np
 import pandas as pd
+from typing import Sequence, Union
+
+NAT = np.iinfo(np.int64).min
+
+# Cycles AIRAC : 28 jours, alignés sur le cycle 2001 (entrée en vigueur le 2 janvier 2020)
+AIRAC_EPOCH = np.datetime64("2020-01-02", "ns")
+AIRAC_CYCLE = np.timedelta64(28, "D").astype("timedelta64[ns]")
+
+
+def to_window(window: Union[int, str, pd.Timedelta]) -> pd.Timedelta:
+    """Fenêtre temporelle : entier = jours (ancien paramètre), sinon chaîne pandas ("30D", "12h") ou Timedelta."""
+    if isinstance(window, (int, np.integer)):
+        return pd.Timedelta(days=int(window))
+    return pd.Timedelta(window)
+
+
+def window_label(window: pd.Timedelta) -> str:
+    """Suffixe de colonne : 30 jours → "30d", 12 heures → "12h", sinon secondes."""
+    seconds = int(window.total_seconds())
+    if seconds % 86400 == 0:
+        return f"{seconds // 86400}d"
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    return f"{seconds}s"
+
+
+def time_window_starts(codes: np.ndarray, ts: np.ndarray, window_ns: int) -> np.ndarray:
+    """
+    Début de la fenêtre (t - window, t] de chaque ligne, lignes triées par (groupe, timestamp) :
+    indice de la première ligne du même groupe strictement plus récente que t - window.
+    Les groupes sont mis bout à bout sur un seul axe (écart > window entre deux groupes),
+    de sorte qu'un unique searchsorted traite toute la flotte.
+    """
+    n = ts.size
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    first = np.r_[True, codes[1:] != codes[:-1]]
+    g_start = np.flatnonzero(first)
+    gid = np.cumsum(first) - 1
+    rel = ts - ts[g_start][gid]
+    span = np.r_[rel[g_start[1:] - 1], rel[-1]]
+    stride = span + window_ns + 1
+    if float(stride.astype(np.float64).sum()) < 2.0 ** 62:
+        base = np.cumsum(stride) - stride
+        key = base[gid] + rel
+        return np.searchsorted(key, key - window_ns, side="right")
+    # Axe commun hors de la plage int64 (très longues séries) : un searchsorted par groupe
+    left = np.empty(n, dtype=np.int64)
+    for a, b in zip(g_start, np.r_[g_start[1:], n]):
+        left[a:b] = a + np.searchsorted(ts[a:b], ts[a:b] - window_ns, side="right")
+    return left
+
+
+def rolling_time_mean(codes: np.ndarray, ts: np.ndarray, values: np.ndarray, window_ns: int,
+                      min_periods: int = 1, starts: np.ndarray = None) -> np.ndarray:
+    """
+    Moyenne sur (t - window, t] par groupe (comme groupby().rolling("30D")), lignes triées par
+    (groupe, timestamp) : sommes cumulées des valeurs et des observations non NaN, différence
+    entre la ligne et le début de sa fenêtre. O(n), sans boucle par groupe.
+    values peut être une matrice (n × k) : les k séries partagent les bornes de fenêtre.
+    starts : débuts de fenêtre déjà calculés par time_window_starts (sinon recalculés).
+    """
+    left = time_window_starts(codes, ts, window_ns) if starts is None else starts
+    valid = ~np.isnan(values)
+    # Valeurs centrées : sommes cumulées sans perte de précision sur de longues séries
+    with np.errstate(invalid="ignore", divide="ignore"):
+        center = np.nan_to_num(np.nansum(values, axis=0) / valid.sum(axis=0))
+    head = np.zeros((1,) + values.shape[1:])
+    cs = np.concatenate([head, np.cumsum(np.where(valid, values - center, 0.0), axis=0)])
+    cn = np.concatenate([head.astype(np.int64), np.cumsum(valid, axis=0, dtype=np.int64)])
+    right = np.arange(1, ts.size + 1)
+    count = cn[right] - cn[left]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = center + (cs[right] - cs[left]) / count
+    return np.where(count >= max(int(min_periods), 1), mean, np.nan)
+
+
+class AiracCalendar:
+    """
+    Calendrier précalculé des cycles AIRAC (28 jours) couvrant [start, end] :
+    dates d'entrée en vigueur (datetime64[ns]) et identifiants YYNN (NN = rang du cycle
+    dans l'année de son entrée en vigueur). Les timestamps sont rattachés à leur cycle
+    par searchsorted.
+    """
+
+    def __init__(self, start, end):
+        start, end = pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+        k0 = int(np.floor((np.datetime64(start, "ns") - AIRAC_EPOCH) / AIRAC_CYCLE))
+        k1 = int(np.floor((np.datetime64(end, "ns") - AIRAC_EPOCH) / AIRAC_CYCLE))
+        self.effective = AIRAC_EPOCH + np.arange(k0, k1 + 1) * AIRAC_CYCLE
+        year_start = self.effective.astype("datetime64[Y]")
+        year = year_start.astype(np.int64) + 1970
+        day_of_year = ((self.effective - year_start) // np.timedelta64(1, "D")).astype(np.int64)
+        self.ident = np.char.add(np.char.zfill((year % 100).astype(str), 2),
+                                 np.char.zfill((day_of_year // 28 + 1).astype(str), 2)).astype(object)
+
+    @classmethod
+    def covering(cls, timestamps) -> "AiracCalendar":
+        ts = pd.to_datetime(pd.Series(timestamps), errors="coerce").dropna()
+        if ts.empty:
+            return cls(AIRAC_EPOCH, AIRAC_EPOCH)
+        return cls(ts.min(), ts.max())
+
+    @property
+    def end(self) -> np.datetime64:
+        return self.effective[-1] + AIRAC_CYCLE
+
+    def cycle(self, timestamps) -> np.ndarray:
+        """Indice du cycle de chaque timestamp dans le calendrier ; -1 si NaT ou hors calendrier."""
+        ts = pd.to_datetime(pd.Series(timestamps), errors="coerce").to_numpy(dtype="datetime64[ns]")
+        pos = np.searchsorted(self.effective, ts, side="right") - 1
+        outside = np.isnat(ts) | (pos < 0) | (ts >= self.end)
+        return np.where(outside, -1, pos)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"airac": self.ident, "effective": self.effective,
+                             "end": self.effective + AIRAC_CYCLE})
+
 
 class FeatureEngineer:
-    def rolling_baseline(self, df: pd.DataFrame, key=("tail_number",), metric="perf_factor", window=30) -> pd.DataFrame:
+    """
+    Variables dérivées des séries APM :
+      - baselines roulantes sur une fenêtre de temps par tail (rolling_baseline)
+      - moyennes par cycle AIRAC et par tail (aggregate_by_airac)
+    Les deux traitent toute la flotte en un seul passage vectorisé (tri par (tail, timestamp),
+    sommes cumulées, searchsorted), sans fonction Python appelée par groupe.
+    """
+
+    def __init__(self, calendar: AiracCalendar = None):
+        self.calendar = calendar
+
+    def rolling_baseline(self, df: pd.DataFrame, key: Sequence[str] = ("tail_number",), metric="perf_factor",
+                         window: Union[int, str, pd.Timedelta] = 30, min_periods: int = 5) -> pd.DataFrame:
+        """
+        Ajoute {metric}_baseline_{window} : moyenne de metric sur (t - window, t] au sein de chaque
+        groupe key (window entier = jours, ou "30D", "12h"…). Les lignes gardent leur ordre ;
+        timestamp NaT → NaN.
+        """
         needed = list(key) + ["timestamp", metric]
         if not all(c in df.columns for c in needed):
             return df
-        df = df.sort_values(list(key)+["timestamp"])
-        df[f"{metric}_baseline_{window}d"] = (
-            df.groupby(list(key))[metric].transform(lambda s: s.rolling(window, min_periods=5).mean())
-        )
-        return df
-
-    def aggregate_by_airac(self, df: pd.DataFrame) -> pd.DataFrame:
-        # If 'airac' not available, approximate monthly period as placeholder
+        w = to_window(window)
+        values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+        out = self.rolling_mean(df, values, key=key, window=w, min_periods=min_periods)
+        return df.assign(**{f"{metric}_baseline_{window_label(w)}": out})
+
+    def rolling_mean(self, df: pd.DataFrame, values: np.ndarray, key: Sequence[str] = ("tail_number",),
+                     window: Union[int, str, pd.Timedelta] = 30, min_periods: int = 5) -> np.ndarray:
+        """
+        Moyenne roulante de values (alignées sur les lignes de df, vecteur ou matrice n × k) sur
+        (t - window, t] par groupe key ; mêmes ordre de lignes et forme que values.
+        """
+        key = [k for k in key if k in df.columns]
+        codes = df.groupby(key, sort=False, dropna=False, observed=True).ngroup().to_numpy() if key \
+            else np.zeros(df.shape[0], dtype=np.int64)
+        ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+        out = np.full(values.shape, np.nan)
+        ok = np.flatnonzero(ts != NAT)
+        order = ok[np.lexsort((ts[ok], codes[ok]))]
+        out[order] = rolling_time_mean(codes[order], ts[order], values[order], to_window(window).value,
+                                       min_periods=min_periods)
+        return out
+
+    def aggregate_by_airac(self, df: pd.DataFrame, metrics: Sequence[str] = ("perf_factor", "fuel_flow")) -> pd.DataFrame:
+        """Moyennes par (tail_number, cycle AIRAC), cycles dans l'ordre chronologique."""
         if "timestamp" not in df.columns or "tail_number" not in df.columns:
             return df
-        df["airac"] = df["timestamp"].dt.to_period("M").astype(str)
-        agg = df.groupby(["tail_number","airac"]).agg(
-            perf_factor=("perf_factor","mean"),
-            fuel_flow=("fuel_flow","mean")
-        ).reset_index()
+        calendar = self.calendar or AiracCalendar.covering(df["timestamp"])
+        cycle = calendar.cycle(df["timestamp"])
+        metrics = [m for m in metrics if m in df.columns]
+        keep = cycle >= 0
+        frame = df.loc[keep, ["tail_number"] + metrics].assign(_cycle=cycle[keep])
+        agg = frame.groupby(["tail_number", "_cycle"], sort=True, observed=True)[metrics].mean().reset_index()
+        pos = agg.pop("_cycle").to_numpy()
+        agg.insert(1, "airac", calendar.ident[pos])
+        agg.insert(2, "airac_start", calendar.effective[pos])
         return agg
-
@@ -0,0 +1,118 @@
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from classes.processing.feature_engineering import NAT, rolling_time_mean, time_window_starts, to_window
+
+logger = logging.getLogger(__name__)
+
+# Variance maximale par colonne sur une fenêtre stable (altitude en FL, Mach sans unité)
+DEFAULT_MAX_VARIANCE = {"altitude": 1.0, "mach": 1e-5}
+# Écart d'altitude (FL) entre deux points consécutifs d'un vol au-delà duquel le palier change
+DEFAULT_LEVEL_TOLERANCE = 5.0
+DAY_NS = 86_400 * 10**9
+
+
+class SteadyStateFilter:
+    """
+    Sélection des points de croisière stabilisée, avant l'analyse d'impact.
+
+    Les points sont regroupés par vol (tail_number, numéro de vol, date), puis par palier : un
+    écart de level_col de plus de level_tolerance entre deux points consécutifs du vol ouvre un
+    nouveau palier. Une montée par paliers (FL360 puis FL380, chaque rapport stable) n'est donc
+    pas prise pour une instabilité. Pour chaque point, la variance de chaque colonne de
+    max_variance (altitude, Mach…) est calculée sur la fenêtre (t - window, t] du même palier ;
+    une fenêtre d'au moins min_periods points sous tous les seuils est stable et tous ses points
+    sont conservés. Les autres (altitude ou Mach instables sur le palier) sont écartés. Un point
+    seul dans son palier à ± window ne peut pas être jugé : conservé si keep_isolated.
+    Toute la flotte est traitée en un passage vectorisé (tri, searchsorted, sommes cumulées).
+    """
+
+    def __init__(self, max_variance: Optional[Dict[str, float]] = None, window: Union[int, str, pd.Timedelta] = "60min",
+                 min_periods: int = 2, flight_col: str = "flight_number", keep_isolated: bool = True,
+                 level_col: str = "altitude", level_tolerance: Optional[float] = DEFAULT_LEVEL_TOLERANCE):
+        self.max_variance = {c: float(v) for c, v in (max_variance or DEFAULT_MAX_VARIANCE).items()}
+        self.window = to_window(window)
+        self.min_periods = max(int(min_periods), 2)
+        self.flight_col = flight_col
+        self.keep_isolated = bool(keep_isolated)
+        self.level_col = level_col
+        self.level_tolerance = float(level_tolerance) if level_tolerance is not None else None
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> "SteadyStateFilter":
+        cfg = settings.get("steady_state", {})
+        return cls(max_variance=cfg.get("max_variance"), window=cfg.get("window", "60min"),
+                   min_periods=cfg.get("min_periods", 2), flight_col=cfg.get("flight_col", "flight_number"),
+                   keep_isolated=cfg.get("keep_isolated", True), level_col=cfg.get("level_col", "altitude"),
+                   level_tolerance=cfg.get("level_tolerance", DEFAULT_LEVEL_TOLERANCE))
+
+    def flight_codes(self, df: pd.DataFrame, ts: np.ndarray) -> np.ndarray:
+        """Identifiant entier du vol de chaque ligne : (tail_number, numéro de vol, jour)."""
+        key = [c for c in ("tail_number", self.flight_col) if c in df.columns]
+        if self.flight_col not in df.columns:
+            logger.warning("Steady-state filter: no %s column, flights approximated by (tail, day)", self.flight_col)
+        day = np.where(ts != NAT, ts // DAY_NS, NAT)
+        frame = df[key].assign(_day=day) if key else pd.DataFrame({"_day": day})
+        return frame.groupby(list(frame.columns), sort=False, dropna=False, observed=True).ngroup().to_numpy()
+
+    def stable_mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Masque booléen aligné sur les lignes de df : True = point conservé."""
+        n = df.shape[0]
+        columns = [c for c in self.max_variance if c in df.columns]
+        if n == 0 or not columns or "timestamp" not in df.columns:
+            if n and not columns:
+                logger.warning("Steady-state filter: none of %s present, all rows kept", list(self.max_variance))
+            return np.ones(n, dtype=bool)
+
+        ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        codes = self.flight_codes(df, ts)
+        keep = np.ones(n, dtype=bool)   # timestamp NaT : non jugé
+        ok = np.flatnonzero(ts != NAT)
+        order = ok[np.lexsort((ts[ok], codes[ok]))]
+        c_sorted, t_sorted = codes[order], ts[order]
+        m = order.size
+        if self.level_tolerance is not None and self.level_col in df.columns and m:
+            # Paliers : nouveau groupe à chaque changement de vol ou saut d'altitude (NaN : dernier niveau connu)
+            level = pd.Series(pd.to_numeric(df[self.level_col], errors="coerce").to_numpy(
+                dtype=np.float64, na_value=np.nan)[order]).ffill().to_numpy()
+            with np.errstate(invalid="ignore"):
+                jump = (c_sorted[1:] != c_sorted[:-1]) | (np.abs(np.diff(level)) > self.level_tolerance)
+            c_sorted = np.r_[0, np.cumsum(jump)]
+
+        # Moments roulants de x et x² (x centré) pour toutes les colonnes, bornes de fenêtre partagées
+        x = np.column_stack([pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)[order]
+                             for c in columns])
+        with np.errstate(invalid="ignore"):
+            x = x - np.nan_to_num(np.nanmean(x, axis=0))
+        left = time_window_starts(c_sorted, t_sorted, self.window.value)
+        moments = rolling_time_mean(c_sorted, t_sorted, np.hstack([x, x * x]), self.window.value,
+                                    min_periods=self.min_periods, starts=left)
+        k = len(columns)
+        variance = np.maximum(moments[:, k:] - moments[:, :k] ** 2, 0.0)
+        limits = np.array([self.max_variance[c] for c in columns])
+        with np.errstate(invalid="ignore"):
+            stable = (variance <= limits).all(axis=1)   # NaN (trop peu de points) → instable
+
+        # Chaque fenêtre stable [left, i] couvre tous ses points : +1 / -1 puis somme cumulée
+        ends = np.flatnonzero(stable)
+        cover = np.cumsum(np.bincount(left[ends], minlength=m + 1) - np.bincount(ends + 1, minlength=m + 1))[:m] > 0
+        if self.keep_isolated:
+            # Seul dans sa fenêtre, et absent de la fenêtre du point suivant (même palier)
+            idx = np.arange(m)
+            alone = (left == idx) & (np.r_[left[1:], m] > idx)
+            cover |= alone
+        keep[order] = cover
+        return keep
+
+    def apply(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        """Lignes de croisière stabilisée (ordre conservé) et comptes conservés / écartés."""
+        keep = self.stable_mask(df)
+        counts = {"rows_in": int(df.shape[0]), "kept": int(keep.sum()), "dropped": int((~keep).sum())}
+        logger.info("Steady-state filter: %d rows kept, %d dropped (%.1f%%)", counts["kept"], counts["dropped"],
+                    100.0 * counts["dropped"] / max(counts["rows_in"], 1))
+        if counts["dropped"] == 0:
+            return df, counts
+        return df[keep].reset_index(drop=True), counts
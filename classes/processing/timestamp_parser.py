@@ -0,0 +1,78 @@
+import logging
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class TimestampParser:
+    """
+    Parsing mémoïsé et vectorisé des dates / heures APM.
+
+    Les enregistrements APM ne partagent que quelques milliers de dates distinctes :
+    chaque chaîne unique est parsée une seule fois (factorize), puis les résultats
+    sont redistribués via les codes. L'ambiguïté Y/m/d vs Y/d/m est tranchée pour
+    toute la colonne : le format qui parse le plus de valeurs distinctes est
+    prioritaire, les autres ne servent qu'à compléter les valeurs qu'il rejette.
+    L'heure est ajoutée comme un décalage (timedelta) vectorisé.
+    """
+
+    def __init__(self, date_formats: Optional[Iterable[str]] = ("%Y/%m/%d", "%Y/%d/%m"), dayfirst: bool = False):
+        self.date_formats = list(date_formats or [])
+        self.dayfirst = dayfirst
+
+    def _parse_unique_dates(self, uniques: pd.Index) -> pd.DatetimeIndex:
+        values = uniques.astype(str)
+        candidates = [pd.DatetimeIndex(pd.to_datetime(values, format=f, errors="coerce"))
+                      for f in self.date_formats]
+        if candidates:
+            counts = [int(c.notna().sum()) for c in candidates]
+            order = sorted(range(len(candidates)), key=lambda i: -counts[i])
+            result = candidates[order[0]]
+            for i in order[1:]:
+                result = result.where(result.notna(), candidates[i])
+            if counts[order[0]] > 0:
+                logger.debug("Date format resolved for column: %s", self.date_formats[order[0]])
+        else:
+            result = pd.DatetimeIndex(np.full(len(values), np.datetime64("NaT", "ns")))
+
+        missing = result.isna()
+        if missing.any():
+            # Formats non prévus : parsing générique, mais seulement sur les valeurs distinctes
+            generic = pd.DatetimeIndex(pd.to_datetime(pd.Series(values[missing]), errors="coerce",
+                                                      dayfirst=self.dayfirst, format="mixed"))
+            result = result.to_numpy(dtype="datetime64[ns]")
+            result[missing] = generic.to_numpy(dtype="datetime64[ns]")
+            result = pd.DatetimeIndex(result)
+        return result
+
+    def parse_dates(self, values: pd.Series) -> pd.Series:
+        """Dates (chaînes ou datetimes) → Series datetime64[ns], NaT si non parsable."""
+        values = pd.Series(values)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values.astype("datetime64[ns]")
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        parsed = self._parse_unique_dates(pd.Index(uniques)).to_numpy(dtype="datetime64[ns]")
+        out = np.full(len(values), np.datetime64("NaT", "ns"))
+        valid = codes >= 0
+        out[valid] = parsed[codes[valid]]
+        return pd.Series(out, index=values.index)
+
+    def parse_times(self, values: pd.Series) -> pd.Series:
+        """Heures "HH:MM:SS" → Series timedelta64[ns] (NaT si absente ou invalide)."""
+        values = pd.Series(values)
+        if pd.api.types.is_timedelta64_dtype(values):
+            return values.astype("timedelta64[ns]")
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        parsed = pd.to_timedelta(pd.Index(uniques).astype(str), errors="coerce").to_numpy(dtype="timedelta64[ns]")
+        out = np.full(len(values), np.timedelta64("NaT", "ns"))
+        valid = codes >= 0
+        out[valid] = parsed[codes[valid]]
+        return pd.Series(out, index=values.index)
+
+    def combine(self, dates: pd.Series, times: pd.Series) -> pd.Series:
+        """timestamp = date (à minuit) + heure ; NaT si l'une des deux manque."""
+        d = self.parse_dates(dates).dt.normalize()
+        return d + self.parse_times(times)
@@ -0,0 +1,159 @@
+import cProfile
+import json
+import logging
+import os
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024.0 * 1024.0
+
+
+def max_rss_mb() -> Optional[float]:
+    """Pic de mémoire résidente du processus depuis son démarrage (Unix), sans surcoût de traçage."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    return round(rss / (MB if os.uname().sysname == "Darwin" else 1024.0), 3)
+
+
+def count_rows(obj):
+    """Nombre de lignes d'un DataFrame (ou d'un dict / tuple de DataFrames) ; None sinon."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.shape[0])
+    if isinstance(obj, dict):
+        return {k: count_rows(v) for k, v in obj.items()}
+    if isinstance(obj, (tuple, list)):
+        return [count_rows(v) for v in obj]
+    if isinstance(obj, int):
+        return obj
+    return None
+
+
+class RunInstrumentation:
+    """
+    Mesures par étape d'un run : temps mural, temps CPU du processus, pic mémoire résidente
+    du processus, nombre de lignes en entrée / sortie, écrits dans run_report.json.
+    trace_memory=True ajoute le pic d'allocations Python propre à chaque étape (tracemalloc,
+    run nettement plus lent).
+    profile="cprofile" ajoute un profil cProfile par étape (fichiers .prof : pstats, snakeviz…).
+    Le temps CPU et les profils ne couvrent que le processus principal (pas les workers d'un pool).
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False, profile: Optional[str] = None,
+                 profile_dir=None, report_path=None):
+        if profile not in (None, "off", "cprofile"):
+            raise ValueError(f"Unknown profile mode: {profile}")
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.profile = profile if enabled and profile != "off" else None
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
+        self.report_path = Path(report_path) if report_path is not None else None
+        self.stages = []
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._own_tracing = False
+
+    @classmethod
+    def from_settings(cls, settings: Dict, output_dir) -> "RunInstrumentation":
+        cfg = settings.get("instrumentation", {})
+        output_dir = Path(output_dir)
+        return cls(
+            enabled=cfg.get("enabled", True),
+            trace_memory=cfg.get("trace_memory", False),
+            profile=cfg.get("profile"),
+            profile_dir=output_dir / cfg.get("profile_dir", "profiles"),
+            report_path=output_dir / cfg.get("report_file", "run_report.json")
+        )
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        """
+        Mesure le bloc ; le dict renvoyé reçoit rows_out (et éventuellement d'autres compteurs)
+        depuis le bloc. Une exception est enregistrée (status "error") puis propagée.
+        """
+        record = {"stage": name, "rows_in": count_rows(rows_in), "rows_out": None}
+        if not self.enabled:
+            yield record
+            return
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            mem0 = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile() if self.profile == "cprofile" else None
+
+        record["status"] = "ok"
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_seconds"] = round(time.perf_counter() - wall0, 6)
+            record["cpu_seconds"] = round(time.process_time() - cpu0, 6)
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["peak_mb"] = round((peak - mem0) / MB, 3)
+                record["net_mb"] = round((current - mem0) / MB, 3)
+            record["max_rss_mb"] = max_rss_mb()
+            record["rows_out"] = count_rows(record["rows_out"])
+            if profiler is not None and self.profile_dir is not None:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.profile_dir / f"{len(self.stages):02d}_{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.prof"
+                profiler.dump_stats(str(path))
+                record["profile"] = str(path)
+            self.stages.append(record)
+            logger.debug("Stage %s: %.3f s wall, %.3f s CPU", name, record["wall_seconds"], record["cpu_seconds"])
+
+    def report(self, status: str = "ok") -> Dict:
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "status": status,
+            "wall_seconds": round(time.perf_counter() - self._t0, 6),
+            "cpu_seconds": round(time.process_time() - self._cpu0, 6),
+            "max_rss_mb": max_rss_mb(),
+            "trace_memory": self.trace_memory,
+            "profile": self.profile,
+            "stages": self.stages,
+        }
+
+    def write_report(self, status: str = "ok", path=None) -> Optional[Path]:
+        """Écrit le rapport JSON (écriture atomique) et arrête tracemalloc s'il a été démarré ici."""
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+        path = Path(path) if path is not None else self.report_path
+        if not self.enabled or path is None:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.report(status), f, indent=2, default=str)
+        os.replace(tmp, path)
+        logger.info("Run report written to %s", path)
+        return path
@@ -0,0 +1,100 @@
+"""
+Ligne de commande du pipeline, une sous-commande par étape :
+
+    python cli.py ingest    # chargement + nettoyage (remplit le cache d'étapes)
+    python cli.py analyze   # analyse d'impact, tables d'analyse
+    python cli.py schedule  # optimisation / planning / monte carlo, plans
+    python cli.py report    # run complet, tables et graphiques (= python main.py)
+    python cli.py bench --sizes 10000 1000000   # benchmarks par étape (benchmarks/run_benchmarks.py)
+
+Options communes : --settings chemin/vers/settings.json et --set clé.pointée=valeur (répétable,
+valeur JSON sinon chaîne), ex. --set economics.fuel_price_per_unit=0.9 --set logging.level=WARNING.
+
+Démarrage rapide (appels répétés depuis cron ou d'autres scripts) : ce module n'importe que la
+bibliothèque standard ; pandas, NumPy et les classes du pipeline ne sont chargés que par la
+sous-commande lancée, matplotlib uniquement au tracé des graphiques (report). Avec le cache
+d'étapes (cache.stages), schedule relit les tables d'analyse sans recharger ni nettoyer le TXT.
+"""
+import argparse
+import copy
+import json
+import sys
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+SETTINGS_PATH = BASE / "config" / "settings.json"
+
+PIPELINE_COMMANDS = {
+    "ingest": "Load and clean the APM series and events (fills the stage cache)",
+    "analyze": "Impact analysis; export the analysis tables",
+    "schedule": "Optimization, planning and Monte Carlo; export the plans",
+    "report": "Full run: every table and plot (same as python main.py)",
+}
+
+
+def parse_override(text: str):
+    """"economics.budget=60000" → (["economics", "budget"], 60000) ; valeur JSON, sinon chaîne brute."""
+    key, sep, raw = text.partition("=")
+    if not sep or not key.strip():
+        raise ValueError(f"Invalid override (expected key.path=value): {text}")
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    return key.strip().split("."), value
+
+
+def apply_overrides(settings: dict, overrides) -> dict:
+    """Copie des settings avec les surcharges appliquées (sous-dictionnaires créés si absents)."""
+    settings = copy.deepcopy(settings)
+    for text in overrides or []:
+        path, value = parse_override(text)
+        node = settings
+        for part in path[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        node[path[-1]] = value
+    return settings
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--settings", type=Path, default=SETTINGS_PATH, help="Fichier settings.json")
+    common.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Surcharge d'un paramètre (clé pointée, valeur JSON), répétable")
+
+    parser = argparse.ArgumentParser(prog="cli.py", description="APM maintenance impact pipeline")
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, help_text in PIPELINE_COMMANDS.items():
+        commands.add_parser(name, parents=[common], help=help_text, description=help_text)
+    commands.add_parser("bench", parents=[common], help="Stage-level benchmarks on synthetic data",
+                        description="Stage-level benchmarks; other options are passed to benchmarks/run_benchmarks.py")
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command != "bench":
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if not args.settings.exists():
+        parser.error(f"settings file not found: {args.settings}")
+    with open(args.settings, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    try:
+        settings = apply_overrides(settings, args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Imports lourds différés : seulement ceux de la sous-commande demandée
+    if args.command == "bench":
+        from benchmarks.run_benchmarks import main as run_benchmarks
+        return run_benchmarks(extra + ["--settings", str(args.settings)], settings=settings)
+
+    from main import run_pipeline
+    return 0 if run_pipeline(settings=settings, step=args.command) == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
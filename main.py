@@ -5,13 +5,23 @@ import sys
 import pandas as pd
 
 from classes.utils.logging_conf import setup_logging
-from classes.io.data_loader import load_events, load_txt_series
+from classes.utils.instrumentation import RunInstrumentation
+from classes.io.data_loader import load_events_all_sheets, load_txt_series_cached
 from classes.io.schemas import DataSchema
 from classes.processing.cleaning import DataCleaner
-from classes.domain.apm_models import APMModels
+from classes.processing.compact import FrameCompactor, bytes_per_record
+from classes.processing.steady_state import SteadyStateFilter
+from classes.domain.apm_models import APMModels, engine_columns
 from classes.domain.maintenance import MaintenanceCatalog
 from classes.analysis.reporting import Reporter
 from classes.optimization.scheduler import MaintenanceScheduler
+from classes.optimization.planner import RollingHorizonPlanner
+from classes.optimization.monte_carlo import MonteCarloROI
+from classes.analysis.event_history import SameTypeHistory
+from classes.pipeline.fleet import run_fleet_analysis
+from classes.pipeline.incremental import IncrementalAnalysis, IncrementalIngest
+from classes.pipeline.sweep import run_impact_sweep
+from classes.pipeline.dag import StageGraph
 
 from classes.analysis.impact_analysis import (
     build_event_intervals,
@@ -28,125 +38,454 @@ SETTINGS_PATH = BASE / "config" / "settings.json"
 OUTPUTS_DIR = BASE / "outputs"
 
 
-def run_pipeline():
-    # Charger settings
-    if not SETTINGS_PATH.exists():
-        raise FileNotFoundError(f"Settings file not found: {SETTINGS_PATH}")
-    with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+def load_settings(settings_path: Path = None) -> dict:
+    settings_path = settings_path or SETTINGS_PATH
+    if not Path(settings_path).exists():
+        raise FileNotFoundError(f"Settings file not found: {settings_path}")
+    with open(settings_path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-    # Logging
-    setup_logging(settings.get("logging", {}).get("level", "INFO"))
-    logger = logging.getLogger("main")
-    logger.info("Starting pipeline")
 
-    try:
-        # 1) Chargement brut
-        data_dir = settings["paths"]["data_dir"]
-        excel_file = BASE / data_dir / settings["paths"]["excel_file"]
-        txt_file = BASE / data_dir / settings["paths"]["txt_file"]
+def load_event_sheets(settings: dict) -> pd.DataFrame:
+    """Chargement brut de toutes les feuilles d'événements (avec cache si activé)."""
+    excel_file = BASE / settings["paths"]["data_dir"] / settings["paths"]["excel_file"]
+    events_cfg = settings.get("events", {})
+    cache_cfg = settings.get("cache", {})
+    cache_dir = str(BASE / cache_cfg.get("dir", "cache")) if cache_cfg.get("enabled", False) else None
 
-        sheet_priority = [s for s in settings["excel_sheets_priority"] if s != "FHMRI"]
+    # Toutes les feuilles avion en un seul passage sur le classeur (tail_number = nom de feuille)
+    return load_events_all_sheets(
+        str(excel_file),
+        tail_sheet_pattern=events_cfg.get("tail_sheet_pattern", r"^F[A-Z]{4}$"),
+        ignore_sheets=events_cfg.get("ignore_sheets", ["FHMRI"]),
+        cache_dir=cache_dir,
+        cache_format=cache_cfg.get("format", "auto")
+    )
 
-        events_df = load_events(str(excel_file), sheet_priority=sheet_priority, ignore_sheets=["FHMRI"])
-        df_txt = load_txt_series(str(txt_file), txt_read=settings["txt_read"], columns_mapping=settings["columns_mapping"])
 
-        if df_txt.empty or events_df.empty:
-            logger.error("Data not loaded or empty. Aborting.")
-            return
+def load_inputs(settings: dict):
+    """Chargement brut : toutes les feuilles d'événements et le TXT APM (avec cache si activé)."""
+    txt_file = BASE / settings["paths"]["data_dir"] / settings["paths"]["txt_file"]
+    cache_cfg = settings.get("cache", {})
+    cache_dir = str(BASE / cache_cfg.get("dir", "cache")) if cache_cfg.get("enabled", False) else None
 
-        sheet_used = sheet_priority[0]
-        events_df["tail_number"] = sheet_used
-        logger.info("Events loaded from sheet: %s", sheet_used)
+    all_events = load_event_sheets(settings)
+    df_txt = load_txt_series_cached(
+        str(txt_file),
+        txt_read=settings["txt_read"],
+        columns_mapping=settings["columns_mapping"],
+        cache_dir=cache_dir,
+        cache_format=cache_cfg.get("format", "auto"),
+        ingest=settings.get("ingest")
+    )
+    return df_txt, all_events
 
-        # 2) Schéma et nettoyage
-        schema = DataSchema(settings)
 
+def prepare_txt(df_txt: pd.DataFrame, schema: DataSchema, instr: RunInstrumentation = None) -> pd.DataFrame:
+    """Schéma et nettoyage des séries APM."""
+    instr = instr or RunInstrumentation(enabled=False)
+    with instr.stage("schema_mapping", rows_in=df_txt) as st:
         df_txt = schema.standardize_columns(df_txt)
         df_txt = schema.apply_mapping_txt(df_txt)
         schema.validate_txt(df_txt)
+        st["rows_out"] = df_txt
 
+    with instr.stage("cleaning", rows_in=df_txt) as st:
         cleaner = DataCleaner()
         df_txt = cleaner.build_timestamp(df_txt, date_col="recorded_date", time_col="time")
         df_txt = cleaner.fix_timestamps(df_txt)
         df_txt = cleaner.remove_duplicates(df_txt)
         df_txt = cleaner.flag_quality(df_txt)
-        df_txt = cleaner.clean_numeric_columns(df_txt)
+        df_txt = cleaner.clean_numeric_columns(df_txt, extra_cols=engine_columns(schema.settings))
         if "timestamp" in df_txt.columns:
             df_txt = df_txt.dropna(subset=["timestamp"])
             df_txt["timestamp"] = pd.to_datetime(df_txt["timestamp"], errors="coerce")
             df_txt = df_txt.dropna(subset=["timestamp"])
             df_txt = df_txt.sort_values("timestamp").reset_index(drop=True)
+        st["rows_out"] = df_txt
+    return df_txt
 
-        events_df = schema.standardize_columns(events_df)
-        events_df = schema.apply_mapping_events(events_df)
-        schema.validate_events(events_df)
-        if "date" in events_df.columns:
-            events_df["date"] = pd.to_datetime(events_df["date"], errors="coerce")
-            events_df = events_df.dropna(subset=["date"])
-            events_df = events_df.sort_values("date").reset_index(drop=True)
 
-        logger.info("TXT records: %d | Event records: %d", df_txt.shape[0], events_df.shape[0])
+def prepare_events(events_df: pd.DataFrame, schema: DataSchema) -> pd.DataFrame:
+    """Schéma et nettoyage des événements de maintenance."""
+    events_df = schema.standardize_columns(events_df)
+    events_df = schema.apply_mapping_events(events_df)
+    schema.validate_events(events_df)
+    if "date" in events_df.columns:
+        events_df["date"] = pd.to_datetime(events_df["date"], errors="coerce")
+        events_df = events_df.dropna(subset=["date"])
+        events_df = events_df.sort_values("date").reset_index(drop=True)
+    return events_df
 
-        # 3) Analyse d’impact robuste
+
+def analyze_single_tail(df_txt: pd.DataFrame, events_df: pd.DataFrame, settings: dict,
+                        instr: RunInstrumentation = None):
+    """Analyse d'impact pour un seul avion. Renvoie None si aucun intervalle."""
+    instr = instr or RunInstrumentation(enabled=False)
+    with instr.stage("intervals", rows_in=events_df) as st:
         intervals = build_event_intervals(events_df)
-        if intervals.empty:
-            logger.warning("No intervals could be built. Aborting analysis.")
-            return
+        st["rows_out"] = intervals
+    if intervals.empty:
+        return None
 
+    with instr.stage("metrics", rows_in={"txt": df_txt, "intervals": intervals}) as st:
         non_main = compute_non_maintenance_metrics(df_txt, intervals, settings)
-        type_rates = estimate_type_rates(non_main, events_df, settings)
-        maint_impacts = compute_maintenance_impacts(events_df, non_main, type_rates, settings)
+        st["rows_out"] = non_main
+    with instr.stage("rates", rows_in=non_main) as st:
+        history = SameTypeHistory(events_df, time_axis=settings["impact"]["time_axis"])
+        type_rates = estimate_type_rates(non_main, events_df, settings, history=history)
+        st["rows_out"] = type_rates
+    with instr.stage("impacts", rows_in=events_df) as st:
+        maint_impacts = compute_maintenance_impacts(events_df, non_main, type_rates, settings, history=history)
+        st["rows_out"] = maint_impacts
+    return non_main, type_rates, maint_impacts
+
+
+def select_events(all_events: pd.DataFrame, settings: dict) -> pd.DataFrame:
+    """Événements analysés : toute la flotte, ou le premier avion de excel_sheets_priority présent."""
+    logger = logging.getLogger("main")
+    if settings.get("fleet", {}).get("enabled", False):
+        logger.info("Fleet mode: events loaded for tails %s", sorted(all_events["tail_number"].unique()))
+        return all_events
+
+    ignore_sheets = settings.get("events", {}).get("ignore_sheets", ["FHMRI"])
+    sheet_priority = [s for s in settings["excel_sheets_priority"] if s not in ignore_sheets]
+    available_tails = set(all_events["tail_number"].unique())
+    sheet_used = next((s for s in sheet_priority if s in available_tails), None)
+    if sheet_used is None:
+        logger.error("None of the priority sheets %s found in workbook (%s). Aborting.",
+                     sheet_priority, sorted(available_tails))
+        return all_events.iloc[0:0]
+    logger.info("Events loaded from sheet: %s", sheet_used)
+    return all_events[all_events["tail_number"] == sheet_used].reset_index(drop=True)
+
+
+def build_pipeline(settings: dict, instr: RunInstrumentation = None) -> StageGraph:
+    """
+    Pipeline sous forme de DAG d'étapes mémoïsées (cache.stages) : chaque étape n'est rejouée
+    que si les settings qu'elle lit, ses fichiers sources ou une étape amont ont changé.
+    Une modification de economics ne relance ainsi que optimization / planning / monte_carlo.
+    """
+    instr = instr or RunInstrumentation(enabled=False)
+    cache_cfg = settings.get("cache", {})
+    stages_dir = None
+    if cache_cfg.get("enabled", False) and cache_cfg.get("stages", True):
+        stages_dir = BASE / cache_cfg.get("dir", "cache") / "stages"
+    graph = StageGraph(settings, cache_dir=stages_dir, fmt=cache_cfg.get("format", "auto"), instr=instr)
+    data_dir = BASE / settings["paths"]["data_dir"]
+    fleet_mode = bool(settings.get("fleet", {}).get("enabled", False))
+    incremental_cfg = settings.get("incremental", {})
+    state_dir = BASE / incremental_cfg.get("state_dir", "cache/incremental")
+    ingest = None
+    if incremental_cfg.get("enabled", False):
+        ingest = IncrementalIngest(state_dir, settings, data_dir / settings["paths"]["txt_file"])
+
+    def load():
+        # Le TXT brut a déjà son propre cache (cache.enabled) : étape non persistée
+        with instr.stage("load") as st:
+            if ingest is not None:
+                # Mode incrémental : le TXT est lu par prepare, à partir de la dernière ligne ingérée
+                df_txt, all_events = None, load_event_sheets(settings)
+            else:
+                df_txt, all_events = load_inputs(settings)
+            events_df = select_events(all_events, settings)
+            st["rows_out"] = {"txt": df_txt, "events": events_df}
+        return {"txt": df_txt, "events": events_df}
+
+    def prepare(txt, events):
+        schema = DataSchema(settings)
+        if ingest is not None:
+            # Seules les lignes ajoutées au TXT depuis le dernier run sont lues et nettoyées
+            txt = ingest.update(lambda new: prepare_txt(new, schema, instr=instr))
+        if txt.empty or events.empty:
+            return {"txt": txt, "events": events, "meta": pd.DataFrame({"last_timestamp": pd.to_datetime([])})}
+        if ingest is None:
+            txt = prepare_txt(txt, schema, instr=instr)
+        last_timestamp = txt["timestamp"].max()
+        if settings.get("steady_state", {}).get("enabled", False):
+            # Croisière stabilisée seulement : moins de lignes et moins de bruit pour toute l'analyse aval
+            with instr.stage("steady_state", rows_in=txt) as st:
+                txt, counts = SteadyStateFilter.from_settings(settings).apply(txt)
+                st["rows_out"] = txt
+                st["kept"], st["dropped"] = counts["kept"], counts["dropped"]
+        with instr.stage("events", rows_in=events) as st:
+            events = prepare_events(events, schema)
+            st["rows_out"] = events
+        if settings.get("memory", {}).get("compact", False):
+            # Identifiants en category, métriques float32, indicateurs en bits (flottes sur plusieurs années)
+            with instr.stage("compact", rows_in=txt) as st:
+                compactor = FrameCompactor.from_settings(settings)
+                txt = compactor.compact_txt(txt)
+                events = compactor.compact_events(events)
+                st["rows_out"] = txt
+                st["bytes_per_record"] = round(bytes_per_record(txt), 1)
+        # Métadonnées légères : les étapes aval n'ont pas à relire les séries nettoyées
+        meta = pd.DataFrame({"last_timestamp": [last_timestamp]})
+        return {"txt": txt, "events": events, "meta": meta}
+
+    def sweep(txt, events):
+        sweep_cfg = settings["sweep"]
+        with instr.stage("sweep", rows_in=txt) as st:
+            result = run_impact_sweep(txt, events, settings, sweep_cfg["grid"], max_workers=sweep_cfg.get("max_workers"))
+            st["rows_out"] = result["summary"]
+        return result
+
+    def analysis(txt, events):
+        by_tail = None
+        if incremental_cfg.get("enabled", False):
+            # Ne recalcule que les intervalles touchés par les données postérieures au dernier run
+            with instr.stage("impact_analysis.incremental", rows_in=txt) as st:
+                non_main, type_rates, maint_impacts = IncrementalAnalysis(state_dir, settings).run(txt, events)
+                st["rows_out"] = {"intervals": non_main, "rates": type_rates, "impacts": maint_impacts}
+        elif fleet_mode:
+            # Intervalles, métriques, taux et impacts calculés par avion dans les workers
+            with instr.stage("impact_analysis.fleet", rows_in=txt) as st:
+                fleet = run_fleet_analysis(txt, events, settings)
+                non_main, type_rates, maint_impacts = fleet["non_main"], fleet["type_rates"], fleet["maint_impacts"]
+                by_tail = fleet["type_rates_by_tail"]
+                st["rows_out"] = {"intervals": non_main, "rates": type_rates, "impacts": maint_impacts}
+        else:
+            result = analyze_single_tail(txt, events, settings, instr=instr)
+            if result is None:
+                return {"non_main": pd.DataFrame(), "type_rates": None, "maint_impacts": None, "summary": None,
+                        "type_rates_by_tail": None}
+            non_main, type_rates, maint_impacts = result
+        if non_main.empty:
+            return {"non_main": non_main, "type_rates": None, "maint_impacts": None, "summary": None,
+                    "type_rates_by_tail": None}
         summary = summarize_global(non_main, type_rates, maint_impacts)
+        return {"non_main": non_main, "type_rates": type_rates, "maint_impacts": maint_impacts,
+                "summary": summary, "type_rates_by_tail": by_tail}
 
-        # 4) Économie et optimisation
-        catalog = MaintenanceCatalog.from_settings(settings)
-        fuel_price = settings["economics"]["fuel_price_per_unit"]
-        constraints = settings["economics"]["constraints"]
+    def engines(txt, non_main):
+        # Analyse par moteur : mêmes intervalles, matrice (n_records × n_engines) en un passage
+        apm = APMModels(settings)
+        with instr.stage("engines", rows_in=non_main) as st:
+            table = apm.engine_interval_metrics(txt, non_main)
+            st["rows_out"] = table
+        if table.empty:
+            return {"intervals": None, "summary": None}
+        return {"intervals": table, "summary": apm.summarize_engine_impacts(table)}
 
+    def optimization(maint_impacts):
+        logger = logging.getLogger("main")
         scheduler = MaintenanceScheduler(
-            catalog=catalog,
-            constraints=constraints,
-            fuel_price=fuel_price
+            catalog=MaintenanceCatalog.from_settings(settings),
+            constraints=settings["economics"]["constraints"],
+            fuel_price=settings["economics"]["fuel_price_per_unit"],
+            solver=settings["economics"].get("solver", "exact")
         )
-
-        # Choix de la colonne delta
-        delta_col = "impact_model"
-        if delta_col not in maint_impacts.columns or maint_impacts[delta_col].isna().all():
-            logger.warning("No modeled impact available; falling back to observed impacts if present.")
-            if "impact_observed" in maint_impacts.columns and not maint_impacts["impact_observed"].isna().all():
-                delta_col = "impact_observed"
+        with instr.stage("optimization", rows_in=maint_impacts) as st:
+            # Choix de la colonne delta
+            plan = None
+            delta_col = "impact_model"
+            if delta_col not in maint_impacts.columns or maint_impacts[delta_col].isna().all():
+                logger.warning("No modeled impact available; falling back to observed impacts if present.")
+                if "impact_observed" in maint_impacts.columns and not maint_impacts["impact_observed"].isna().all():
+                    delta_col = "impact_observed"
+                else:
+                    logger.error("No usable delta found for optimization. Skipping scheduler.")
+                    plan = pd.DataFrame()
             else:
-                logger.error("No usable delta found for optimization. Skipping scheduler.")
-                plan = pd.DataFrame()
-        else:
-            plan = scheduler.optimize(
-                deltas=maint_impacts,
-                event_col="event_name",
-                delta_fuel_col=delta_col,
-                default_delta_from_metric="impact_observed"
-            )
-
-        # 5) Reporting et exports
-        OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+                plan = scheduler.optimize(
+                    deltas=maint_impacts,
+                    event_col="event_name",
+                    delta_fuel_col=delta_col,
+                    default_delta_from_metric="impact_observed"
+                )
+            st["rows_out"] = plan
+        return {"plan": plan}
+
+    def planning(events, meta, non_main, type_rates):
+        # Plan daté sur horizon glissant (à relancer à chaque nouvelle date de départ)
+        with instr.stage("planning", rows_in=events) as st:
+            as_of = settings["planning"].get("as_of") or meta["last_timestamp"].iloc[0]
+            planner = RollingHorizonPlanner.from_settings(MaintenanceCatalog.from_settings(settings), settings)
+            schedule, schedule_daily = planner.plan(events, non_main, type_rates, as_of=as_of)
+            st["rows_out"] = schedule
+        return {"schedule": schedule, "daily": schedule_daily}
+
+    def monte_carlo(maint_impacts, type_rates):
+        # Distribution du ROI par action sous incertitude des taux et du prix carburant
+        with instr.stage("monte_carlo", rows_in=maint_impacts) as st:
+            roi_risk = MonteCarloROI.from_settings(MaintenanceCatalog.from_settings(settings), settings) \
+                .run(maint_impacts, type_rates)
+            st["rows_out"] = roi_risk
+        return {"roi_risk": roi_risk}
+
+    def plots(txt, events):
+        # Graphiques : ne dépendent que des données préparées, non retracés si leur clé n'a pas changé
+        plots_cfg = settings["reporting"]["plots"]
         reporter = Reporter(OUTPUTS_DIR)
+        with instr.stage("plots", rows_in=txt) as st:
+            # Séries réduites avant tracé : durée de rendu quasi indépendante du volume APM
+            metric = plots_cfg.get("metric_default", "fuel_flow")
+            opts = {"max_points": plots_cfg.get("max_points", 4000), "method": plots_cfg.get("downsample", "minmax")}
+            files = [reporter.plot_metric(txt, metric=metric, event_col=plots_cfg.get("event_col", "event"),
+                                          events=events, **opts)]
+            if plots_cfg.get("by_tail", True) and "tail_number" in txt.columns and txt["tail_number"].nunique() > 1:
+                files += reporter.plot_metric_by_tail(txt, metric=metric, events=events,
+                                                      max_workers=plots_cfg.get("max_workers"), **opts)
+            st["rows_out"] = len(files)
+        return {"files": pd.DataFrame({"file": [Path(f).name for f in files]})}
 
-        reporter.export_csv(non_main, filename="impact_interval_non_maintenance.csv")
-        reporter.export_csv(type_rates, filename="maintenance_type_rates.csv")
-        reporter.export_csv(maint_impacts, filename="maintenance_impacts_modeled.csv")
-        reporter.export_csv(summary, filename="impact_summary.csv")
+    graph.add("load", load, persist=False,
+              settings_keys=["paths.data_dir", "paths.excel_file", "paths.txt_file", "txt_read", "columns_mapping",
+                             "ingest", "events", "excel_sheets_priority", "fleet.enabled", "incremental"],
+              sources=[data_dir / settings["paths"]["excel_file"], data_dir / settings["paths"]["txt_file"]])
+    graph.add("prepare", prepare, deps={"txt": ("load", "txt"), "events": ("load", "events")},
+              settings_keys=["schema", "columns_mapping", "cleaning", "steady_state", "memory", "apm.engines"])
+    if settings.get("sweep", {}).get("enabled", False):
+        graph.add("sweep", sweep, deps={"txt": ("prepare", "txt"), "events": ("prepare", "events")},
+                  settings_keys=["impact", "sweep"])
+    graph.add("analysis", analysis, deps={"txt": ("prepare", "txt"), "events": ("prepare", "events")},
+              settings_keys=["impact", "fleet", "incremental"])
+    if settings.get("apm", {}).get("engines", {}).get("enabled", False):
+        graph.add("engines", engines, deps={"txt": ("prepare", "txt"), "non_main": ("analysis", "non_main")},
+                  settings_keys=["apm", "impact"])
+    graph.add("optimization", optimization, deps={"maint_impacts": ("analysis", "maint_impacts")},
+              settings_keys=["economics"])
+    if settings.get("planning", {}).get("enabled", False):
+        graph.add("planning", planning,
+                  deps={"events": ("prepare", "events"), "meta": ("prepare", "meta"),
+                        "non_main": ("analysis", "non_main"), "type_rates": ("analysis", "type_rates")},
+                  settings_keys=["planning", "economics", "impact.time_axis"])
+    if settings.get("monte_carlo", {}).get("enabled", False):
+        graph.add("monte_carlo", monte_carlo,
+                  deps={"maint_impacts": ("analysis", "maint_impacts"), "type_rates": ("analysis", "type_rates")},
+                  settings_keys=["monte_carlo", "economics"])
+    if settings.get("reporting", {}).get("plots", {}).get("enabled", False):
+        graph.add("plots", plots, deps={"txt": ("prepare", "txt"), "events": ("prepare", "events")},
+                  settings_keys=["reporting.plots"])
+    return graph
 
-        if plan is not None and not plan.empty:
-            reporter.export_csv(plan, filename="maintenance_plan.csv")
-        else:
-            logger.warning("No positive ROI events selected or no deltas available under constraints.")
 
+# Sous-commandes de cli.py : tables exportées (analyse, économie) et graphiques selon l'étape
+STEPS = ("ingest", "analyze", "schedule", "report")
+
+
+def analysis_tables(graph: StageGraph, analysis: dict) -> dict:
+    """Tables de l'analyse d'impact (et de l'étude de sensibilité / par moteur si activées)."""
+    tables = {
+        "impact_interval_non_maintenance.csv": analysis["non_main"],
+        "maintenance_type_rates.csv": analysis["type_rates"],
+        "maintenance_impacts_modeled.csv": analysis["maint_impacts"],
+        "impact_summary.csv": analysis["summary"],
+    }
+    # Étude de sensibilité : toute la grille de paramètres impact sur les données déjà nettoyées
+    if "sweep" in graph.stages:
+        sweep = graph.outputs("sweep", ["summary", "type_rates"])
+        tables["impact_sweep_summary.csv"] = sweep["summary"]
+        tables["impact_sweep_type_rates.csv"] = sweep["type_rates"]
+
+    by_tail = analysis["type_rates_by_tail"]
+    if by_tail is not None and not by_tail.empty:
+        tables["maintenance_type_rates_by_tail.csv"] = by_tail
+
+    if "engines" in graph.stages:
+        engine_impacts = graph.outputs("engines", ["intervals", "summary"])
+        if engine_impacts["intervals"] is not None:
+            tables["impact_engine_intervals.csv"] = engine_impacts["intervals"]
+            tables["impact_engine_summary.csv"] = engine_impacts["summary"]
+    return tables
+
+
+def schedule_tables(graph: StageGraph) -> dict:
+    """Plan optimisé, plan daté sur horizon glissant et ROI sous incertitude (si activés)."""
+    tables = {}
+    if "planning" in graph.stages:
+        tables["maintenance_schedule.csv"] = graph.get("planning", "schedule")
+        tables["maintenance_schedule_daily.csv"] = graph.get("planning", "daily")
+
+    if "monte_carlo" in graph.stages:
+        tables["maintenance_roi_risk.csv"] = graph.get("monte_carlo", "roi_risk")
+
+    plan = graph.get("optimization", "plan")
+    if plan is not None and not plan.empty:
+        tables["maintenance_plan.csv"] = plan
+    else:
+        logging.getLogger("main").warning("No positive ROI events selected or no deltas available under constraints.")
+    return tables
+
+
+def run_pipeline(settings_path: Path = None, settings: dict = None, step: str = "report") -> str:
+    """
+    Exécute le pipeline jusqu'à step (STEPS) et renvoie le statut ("ok", "aborted") :
+      - ingest   : chargement et nettoyage seulement (remplit le cache d'étapes)
+      - analyze  : analyse d'impact, export des tables d'analyse
+      - schedule : optimisation / planning / monte carlo, export des plans
+      - report   : tout, tables et graphiques (run complet, comportement historique)
+    Seules les étapes du DAG dont dépendent les sorties demandées sont exécutées ou relues.
+    """
+    if step not in STEPS:
+        raise ValueError(f"Unknown step: {step} (expected one of {STEPS})")
+    # Charger settings
+    settings = settings if settings is not None else load_settings(settings_path)
+
+    # Logging
+    setup_logging(settings.get("logging", {}).get("level", "INFO"))
+    logger = logging.getLogger("main")
+    logger.info("Starting pipeline (%s)", step)
+
+    # Mesures par étape (temps, CPU, mémoire, lignes) → outputs/run_report.json
+    instr = RunInstrumentation.from_settings(settings, OUTPUTS_DIR)
+    status = "aborted"
+
+    try:
+        # 1-3) Chargement, nettoyage et analyse d'impact : étapes rejouées seulement si leur clé a changé
+        graph = build_pipeline(settings, instr=instr)
+
+        prepared = graph.outputs("prepare", ["events", "meta"])
+        if prepared["events"].empty or prepared["meta"].empty:
+            logger.error("Data not loaded or empty. Aborting.")
+            return status
+        if step == "ingest":
+            logger.info("Stages executed: %s", ", ".join(graph.executed) or "none (all reused from cache)")
+            status = "ok"
+            return status
+
+        analysis = graph.outputs("analysis", ["non_main", "type_rates", "maint_impacts", "summary",
+                                              "type_rates_by_tail"])
+        if analysis["non_main"] is None or analysis["non_main"].empty:
+            logger.warning("No intervals could be built. Aborting analysis.")
+            return status
+
+        # 4) Économie et optimisation, puis 5) reporting et exports
+        tables = {}
+        if step in ("analyze", "report"):
+            tables.update(analysis_tables(graph, analysis))
+        if step in ("schedule", "report"):
+            tables.update(schedule_tables(graph))
+
+        with instr.stage("export") as st:
+            OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+            export_cfg = settings.get("reporting", {}).get("export", {})
+            reporter = Reporter(OUTPUTS_DIR, formats=export_cfg.get("formats", ["csv"]),
+                                max_workers=export_cfg.get("max_workers"))
+            # Tables indépendantes : écrites en parallèle, chacune via fichier temporaire + rename
+            reporter.export_many(tables)
+            st["rows_out"] = {"intervals": analysis["non_main"], "rates": analysis["type_rates"],
+                              "impacts": analysis["maint_impacts"], "plan": tables.get("maintenance_plan.csv")}
+
+        if step == "report" and "plots" in graph.stages:
+            # Graphiques relus du cache d'étapes tant que les données préparées et reporting.plots
+            # n'ont pas changé ; retracés si un fichier a été supprimé entre-temps
+            files = graph.get("plots", "files")
+            if not all((OUTPUTS_DIR / f).exists() for f in files["file"]):
+                graph.run("plots")
+
+        logger.info("Stages executed: %s", ", ".join(graph.executed) or "none (all reused from cache)")
+        status = "ok"
         logger.info("Pipeline completed successfully.")
 
     except Exception as e:
+        status = "error"
         logger.exception("Pipeline failed with an unexpected error: %s", e)
         sys.exit(1)
 
+    finally:
+        instr.write_report(status)
+    return status
 
 if __name__ == "__main__":
     run_pipeline()
@@ -0,0 +1,375 @@
+"""
+Service what-if local : les données sont chargées et analysées une seule fois, puis les
+questions économiques (prix carburant, budget, contraintes…) sont résolues en mémoire
+par MaintenanceScheduler, en quelques millisecondes au lieu d'un run complet.
+
+Exemples (depuis la racine du dépôt) :
+    python service.py                      # HTTP sur 127.0.0.1:8765 (service.host / service.port)
+    python service.py --stdio              # une requête JSON par ligne sur stdin, une réponse par ligne sur stdout
+
+    curl -s localhost:8765/optimize -d '{"fuel_price": 0.9, "budget": 60000}'
+    echo '{"op": "optimize", "fuel_price": 0.9, "budget": 60000}' | python service.py --stdio
+
+Opérations : status, optimize, scenarios (liste de requêtes optimize), type_rates, reload.
+Les fichiers sources (TXT, classeur, settings) sont surveillés : en cas de modification,
+l'analyse est relancée en arrière-plan (étapes en cache réutilisées) et remplace l'état
+courant d'un bloc ; les requêtes continuent d'être servies sur l'état précédent.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from main import BASE, SETTINGS_PATH, build_pipeline, load_settings
+from classes.domain.maintenance import MaintenanceCatalog
+from classes.optimization.scheduler import MaintenanceScheduler
+from classes.utils.instrumentation import RunInstrumentation
+from classes.utils.logging_conf import setup_logging
+
+logger = logging.getLogger("service")
+
+# Raccourcis de requête → clés de economics.constraints
+CONSTRAINT_KEYS = ("budget", "max_events", "max_downtime_hours", "min_roi")
+MAX_BODY_BYTES = 1 << 20
+
+
+@dataclass(frozen=True)
+class ServiceState:
+    """Instantané immuable servi aux requêtes ; remplacé d'un bloc à chaque rechargement."""
+    settings: Dict
+    non_main: pd.DataFrame
+    type_rates: Optional[pd.DataFrame]
+    maint_impacts: Optional[pd.DataFrame]
+    gains: Optional[pd.DataFrame]
+    delta_col: Optional[str]
+    catalog: MaintenanceCatalog
+    sources: Dict[str, tuple]
+    version: int
+    loaded_at: float
+    load_seconds: float
+
+
+def source_stamps(paths) -> Dict[str, tuple]:
+    """(taille, mtime) de chaque fichier surveillé ; None s'il est absent."""
+    out = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+            out[str(p)] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            out[str(p)] = None
+    return out
+
+
+def delta_column(maint_impacts: Optional[pd.DataFrame]) -> Optional[str]:
+    """Gain utilisé par l'optimiseur : impact_model, sinon impact_observed (même règle que main.py)."""
+    if maint_impacts is None or maint_impacts.empty:
+        return None
+    for col in ("impact_model", "impact_observed"):
+        if col in maint_impacts.columns and not maint_impacts[col].isna().all():
+            return col
+    return None
+
+
+def _json_value(v):
+    if isinstance(v, (np.integer,)):
+        return int(v)
+    if isinstance(v, (np.floating, float)):
+        return None if not np.isfinite(v) else float(v)
+    if isinstance(v, (np.bool_,)):
+        return bool(v)
+    if isinstance(v, (pd.Timestamp,)):
+        return v.isoformat()
+    return v
+
+
+def records(df: Optional[pd.DataFrame]) -> list:
+    if df is None or df.empty:
+        return []
+    cols = list(df.columns)
+    return [{c: _json_value(v) for c, v in zip(cols, row)} for row in df.itertuples(index=False, name=None)]
+
+
+class WhatIfService:
+    """
+    Tables d'analyse (non_main, type_rates, maint_impacts) gardées en mémoire ; chaque requête
+    ne reconstruit qu'un MaintenanceScheduler avec l'économie surchargée. Les gains moyens par
+    type d'action sont agrégés une fois par chargement (le scheduler n'a plus qu'une ligne par type).
+    """
+
+    def __init__(self, settings_path: Path = None, poll_seconds: float = None):
+        self.settings_path = Path(settings_path or SETTINGS_PATH)
+        self.poll_seconds = poll_seconds
+        self.state: Optional[ServiceState] = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloading = False
+        self.last_error: Optional[str] = None
+
+    # -- chargement ---------------------------------------------------------
+
+    def _watched(self, settings: Dict):
+        data_dir = BASE / settings["paths"]["data_dir"]
+        return [self.settings_path, data_dir / settings["paths"]["txt_file"], data_dir / settings["paths"]["excel_file"]]
+
+    def load(self) -> ServiceState:
+        """Charge et analyse les données (DAG de main.py, cache d'étapes compris) puis publie l'état."""
+        with self._reload_lock:
+            self.reloading = True
+            t0 = time.perf_counter()
+            try:
+                settings = load_settings(self.settings_path)
+                sources = source_stamps(self._watched(settings))
+                graph = build_pipeline(settings, instr=RunInstrumentation(enabled=False))
+                analysis = graph.outputs("analysis", ["non_main", "type_rates", "maint_impacts"])
+                maint_impacts = analysis["maint_impacts"]
+                delta_col = delta_column(maint_impacts)
+                gains = None
+                if delta_col is not None:
+                    gains = maint_impacts.groupby("event_name", sort=False)[delta_col].mean().reset_index()
+                previous = self.state
+                state = ServiceState(
+                    settings=settings,
+                    non_main=analysis["non_main"] if analysis["non_main"] is not None else pd.DataFrame(),
+                    type_rates=analysis["type_rates"],
+                    maint_impacts=maint_impacts,
+                    gains=gains,
+                    delta_col=delta_col,
+                    catalog=MaintenanceCatalog.from_settings(settings),
+                    sources=sources,
+                    version=(previous.version + 1) if previous is not None else 1,
+                    loaded_at=time.time(),
+                    load_seconds=round(time.perf_counter() - t0, 3),
+                )
+                self.state = state   # publication atomique : les requêtes en cours gardent l'ancien état
+                self.last_error = None
+                logger.info("Data loaded (version %d, %d intervals, %.2f s)",
+                            state.version, state.non_main.shape[0], state.load_seconds)
+                return state
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                self.reloading = False
+
+    def _changed(self) -> bool:
+        state = self.state
+        return state is not None and source_stamps(state.sources.keys()) != state.sources
+
+    def _watch(self) -> None:
+        failed = None   # sources d'un rechargement en échec : pas de nouvel essai tant qu'elles ne bougent pas
+        while not self._stop.wait(self.poll_seconds):
+            if self._changed() and not self.reloading:
+                stamps = source_stamps(self.state.sources.keys())
+                if stamps == failed:
+                    continue
+                logger.info("Source files changed: reloading in background")
+                try:
+                    self.load()
+                    failed = None
+                except Exception:
+                    failed = stamps
+                    logger.exception("Background reload failed; keeping previous data")
+
+    def start_watcher(self) -> None:
+        if self.poll_seconds is None:
+            cfg = (self.state.settings if self.state else {}).get("service", {})
+            self.poll_seconds = float(cfg.get("poll_seconds", 2.0))
+        if self.poll_seconds > 0 and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="service-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # -- requêtes -----------------------------------------------------------
+
+    def optimize(self, query: Dict, state: ServiceState = None) -> Dict:
+        """Plan de maintenance sous économie surchargée (fuel_price, solver, budget, max_events…)."""
+        state = state or self.state
+        econ = state.settings["economics"]
+        constraints = dict(econ["constraints"])
+        constraints.update(query.get("constraints", {}))
+        constraints.update({k: query[k] for k in CONSTRAINT_KEYS if k in query})
+        fuel_price = float(query.get("fuel_price", econ["fuel_price_per_unit"]))
+        catalog = state.catalog
+        if "catalog" in query:
+            catalog = MaintenanceCatalog.from_settings({"economics": {"catalog": query["catalog"]}})
+        scheduler = MaintenanceScheduler(catalog=catalog, constraints=constraints, fuel_price=fuel_price,
+                                         solver=query.get("solver", econ.get("solver", "exact")))
+
+        if state.delta_col is None:
+            plan = pd.DataFrame()
+        else:
+            plan = scheduler.optimize(state.gains, event_col="event_name", delta_fuel_col=state.delta_col)
+        return {
+            "fuel_price": fuel_price,
+            "constraints": constraints,
+            "delta_col": state.delta_col,
+            "n_selected": int(plan.shape[0]),
+            "total_cost": float(plan["cost"].sum()) if not plan.empty else 0.0,
+            "total_roi": float(plan["roi"].sum()) if not plan.empty else 0.0,
+            "plan": records(plan),
+        }
+
+    def handle(self, request: Dict) -> Dict:
+        """Traite une requête {"op": …} ; erreurs renvoyées dans la réponse (ok = false)."""
+        t0 = time.perf_counter()
+        state = self.state
+        op = request.get("op", "optimize")
+        try:
+            if op == "status":
+                result = {"version": state.version if state else None,
+                          "loaded_at": state.loaded_at if state else None,
+                          "load_seconds": state.load_seconds if state else None,
+                          "intervals": int(state.non_main.shape[0]) if state else 0,
+                          "reloading": self.reloading, "last_error": self.last_error}
+            elif state is None:
+                raise RuntimeError("Data not loaded yet")
+            elif op == "optimize":
+                result = self.optimize(request, state)
+            elif op == "scenarios":
+                result = {"scenarios": [self.optimize(q, state) for q in request.get("scenarios", [])]}
+            elif op == "type_rates":
+                result = {"type_rates": records(state.type_rates)}
+            elif op == "reload":
+                threading.Thread(target=self._safe_reload, name="service-reload", daemon=True).start()
+                result = {"reloading": True}
+            else:
+                raise ValueError(f"Unknown op: {op}")
+            response = {"ok": True, "op": op, **result}
+        except Exception as e:
+            response = {"ok": False, "op": op, "error": f"{type(e).__name__}: {e}"}
+        response["version"] = state.version if state else None
+        response["elapsed_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        return response
+
+    def _safe_reload(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Reload failed; keeping previous data")
+
+
+# -- transports ---------------------------------------------------------------
+
+ROUTES = {("GET", "/status"): "status", ("GET", "/type_rates"): "type_rates", ("POST", "/optimize"): "optimize",
+          ("POST", "/scenarios"): "scenarios", ("POST", "/reload"): "reload"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+async def _http_connection(service: WhatIfService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """HTTP/1.1 minimal (JSON uniquement), connexions persistantes."""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length", 0) or 0)
+            if length > MAX_BODY_BYTES:
+                status, response = 413, {"ok": False, "error": "Request body too large"}
+                body = b""
+            else:
+                body = await reader.readexactly(length) if length else b""
+                op = ROUTES.get((method.upper(), target.split("?", 1)[0]))
+                if op is None:
+                    status, response = 404, {"ok": False, "error": f"No route for {method} {target}"}
+                else:
+                    try:
+                        request = json.loads(body) if body.strip() else {}
+                        if not isinstance(request, dict):
+                            raise ValueError("JSON object expected")
+                        request["op"] = op
+                        response = service.handle(request)
+                        status = 200 if response["ok"] else 400
+                    except ValueError as e:
+                        status, response = 400, {"ok": False, "error": f"Invalid JSON: {e}"}
+            payload = json.dumps(response, default=str).encode("utf-8")
+            keep_alive = headers.get("connection", "").lower() != "close" and status != 413
+            writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                         f"\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_http(service: WhatIfService, host: str, port: int) -> None:
+    server = await asyncio.start_server(lambda r, w: _http_connection(service, r, w), host, port)
+    logger.info("What-if service listening on http://%s:%d", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def serve_stdio(service: WhatIfService, stdin=None, stdout=None) -> None:
+    """Une requête JSON par ligne, une réponse JSON par ligne (logs sur stderr)."""
+    stdin, stdout = stdin or sys.stdin, stdout or sys.stdout
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            response = service.handle(request) if isinstance(request, dict) \
+                else {"ok": False, "error": "JSON object expected"}
+        except ValueError as e:
+            response = {"ok": False, "error": f"Invalid JSON: {e}"}
+        stdout.write(json.dumps(response, default=str) + "\n")
+        stdout.flush()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local what-if service (data kept in memory)")
+    parser.add_argument("--settings", type=Path, default=SETTINGS_PATH)
+    parser.add_argument("--stdio", action="store_true", help="Requêtes JSON-lines sur stdin au lieu de HTTP")
+    parser.add_argument("--host", help="Adresse d'écoute (défaut service.host, 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="Port d'écoute (défaut service.port, 8765)")
+    parser.add_argument("--poll-seconds", type=float, help="Période de surveillance des sources (0 = désactivée)")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.settings)
+    setup_logging(settings.get("logging", {}).get("level", "INFO"))
+    cfg = settings.get("service", {})
+
+    service = WhatIfService(args.settings, poll_seconds=args.poll_seconds)
+    service.load()
+    service.start_watcher()
+    try:
+        if args.stdio:
+            serve_stdio(service)
+        else:
+            asyncio.run(serve_http(service, args.host or cfg.get("host", "127.0.0.1"), args.port or cfg.get("port", 8765)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())